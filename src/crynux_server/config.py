@@ -188,6 +188,43 @@ class TaskConfig(BaseModel):
 
     proxy: Optional[ProxyConfig] = None
 
+    # Seconds between two syncs of a running task with the relay. Task status
+    # is pushed by the relay events, so the sync only catches missed events
+    status_reconcile_interval: float = 30
+
+    # Recompute the result hashes reported by the worker on the node
+    verify_result_hash: bool = False
+
+    # Upload task results in resumable parts, the relay must support it
+    resumable_result_upload: bool = False
+
+    # Devices to run workers on, one worker process is pinned to each device.
+    # An empty list runs a single worker which sees all devices
+    worker_devices: List[str] = []
+
+    # Max model downloads running at the same time, from model prefetching
+    # at node start and from relay events alike.
+    # Workers without parallel downloads still run one at a time
+    download_concurrency: int = 2
+    # Total download bandwidth in bytes per second of all model downloads.
+    # Each download slot of download_concurrency gets a fixed equal share,
+    # which the workers apply when the download starts. So a download running
+    # alone still gets only its share. None for no limit
+    download_bandwidth: Optional[int] = None
+
+    # Run the full local evaluation task at start even if it passed before
+    # on the same gpu, workers and models.
+    # Otherwise a shortened evaluation task is run in that case
+    force_evaluation: bool = False
+
+    # Keep a standby worker process with the libraries imported,
+    # which takes over at once when a worker process exits
+    standby_worker: bool = False
+
+    # Serve the worker endpoint on this unix socket instead of the server port
+    # Ignored on platforms without unix sockets
+    worker_socket: Optional[str] = None
+
     @computed_field
     @property
     def hf_cache_dir(self) -> str:
@@ -226,6 +263,22 @@ class PreloadedModelsConfig(BaseModel):
     lora: Optional[List[ModelConfig]] = None
 
 
+class RelayPoolConfig(BaseModel):
+    # Connections for the small control calls to the relay
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    # Seconds an idle connection is kept alive
+    keepalive_expiry: float = 30
+    # Multiplex the control calls over HTTP/2 connections, when h2 is installed
+    http2: bool = True
+    # Connections for the task result uploads and downloads, which use HTTP/1.1
+    # so that a large body does not stall the control calls
+    upload_max_connections: int = 4
+    # Seconds to wait for a connection from the pool
+    pool_timeout: float = 10
+    timeout: float = 30
+
+
 class ProxyConfig(BaseModel):
     host: str = ""
     port: int = 8080
@@ -240,6 +293,7 @@ class Config(BaseSettings):
 
     db: DBConfig
     relay_url: str
+    relay_pool: RelayPoolConfig = RelayPoolConfig()
 
     task_config: TaskConfig
 
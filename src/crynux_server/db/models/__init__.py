@@ -1,5 +1,6 @@
 from .base import Base, BaseMixin
 from .download_model import DownloadModel
+from .evaluation import EvaluationResult
 from .node import NodeState, NodeScoreState
 from .task import DownloadTaskState, InferenceTaskState
 from .tx import TxState
@@ -13,4 +14,5 @@ __all__ = [
     "NodeScoreState",
     "TxState",
     "DownloadModel",
+    "EvaluationResult",
 ]
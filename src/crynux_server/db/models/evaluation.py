@@ -0,0 +1,14 @@
+import sqlalchemy as sa
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base, BaseMixin
+
+
+class EvaluationResult(Base, BaseMixin):
+    __tablename__ = "evaluation_results"
+
+    fingerprint: Mapped[str] = mapped_column(
+        sa.String(64), nullable=False, index=True
+    )
+    duration: Mapped[float] = mapped_column(nullable=False, index=False)
+    result_hash: Mapped[str] = mapped_column(sa.Text, nullable=False, index=False)
@@ -3,6 +3,7 @@ from typing import Optional
 from .abc import DownloadModelCache
 from .db_impl import DbDownloadModelCache
 from .memory_impl import MemoryDownloadModelCache
+from .utils import model_files_exist
 
 __all__ = [
     "DownloadModelCache",
@@ -10,6 +11,7 @@ __all__ = [
     "MemoryDownloadModelCache",
     "get_download_model_cache",
     "set_download_model_cache",
+    "model_files_exist",
 ]
 
 _default_download_model_cache: Optional[DownloadModelCache] = None
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import List
 
-from crynux_server.models import DownloadedModel
+from crynux_server.models import DownloadedModel, ModelConfig
 
 
 class DownloadModelCache(ABC):
@@ -10,3 +10,6 @@ class DownloadModelCache(ABC):
 
     @abstractmethod
     async def load_all(self) -> List[DownloadedModel]: ...
+
+    @abstractmethod
+    async def has(self, model: ModelConfig) -> bool: ...
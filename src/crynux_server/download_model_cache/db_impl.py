@@ -1,5 +1,5 @@
 from hashlib import sha256
-from typing import List
+from typing import List, Optional, Set
 
 import sqlalchemy as sa
 
@@ -10,11 +10,18 @@ from crynux_server.models import DownloadedModel, ModelConfig
 from .abc import DownloadModelCache
 
 
+def _model_id_hash(model: ModelConfig) -> str:
+    return sha256(model.to_model_id().encode("utf-8")).hexdigest()
+
+
 class DbDownloadModelCache(DownloadModelCache):
+    def __init__(self) -> None:
+        # In-memory index of the saved model id hashes, loaded on the first lookup
+        self._index: Optional[Set[str]] = None
+
     async def save(self, model: DownloadedModel):
         async with db.session_scope() as sess:
-            model_id = model.model.to_model_id()
-            model_id_hash = sha256(model_id.encode("utf-8")).hexdigest()
+            model_id_hash = _model_id_hash(model.model)
 
             q = sa.select(db_models.DownloadModel).where(
                 db_models.DownloadModel.model_id_hash == model_id_hash
@@ -30,6 +37,8 @@ class DbDownloadModelCache(DownloadModelCache):
                 )
                 sess.add(m)
                 await sess.commit()
+        if self._index is not None:
+            self._index.add(model_id_hash)
 
     async def load_all(self) -> List[DownloadedModel]:
         limit = 100
@@ -61,3 +70,10 @@ class DbDownloadModelCache(DownloadModelCache):
             )
             for model in all_models
         ]
+
+    async def has(self, model: ModelConfig) -> bool:
+        if self._index is None:
+            async with db.session_scope() as sess:
+                q = sa.select(db_models.DownloadModel.model_id_hash)
+                self._index = set((await sess.scalars(q)).all())
+        return _model_id_hash(model) in self._index
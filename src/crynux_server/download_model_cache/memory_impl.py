@@ -1,7 +1,7 @@
 from hashlib import sha256
 from typing import Dict, List
 
-from crynux_server.models import DownloadedModel
+from crynux_server.models import DownloadedModel, ModelConfig
 
 from .abc import DownloadModelCache
 
@@ -17,3 +17,8 @@ class MemoryDownloadModelCache(DownloadModelCache):
 
     async def load_all(self) -> List[DownloadedModel]:
         return list(self._download_models.values())
+
+    async def has(self, model: ModelConfig) -> bool:
+        model_id = model.to_model_id()
+        model_id_hash = sha256(model_id.encode("utf-8")).hexdigest()
+        return model_id_hash in self._download_models
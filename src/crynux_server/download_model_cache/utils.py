@@ -0,0 +1,23 @@
+import os
+from typing import Optional
+
+from crynux_server.models import ModelConfig
+
+
+def _is_huggingface_model(model: ModelConfig) -> bool:
+    return "://" not in model.id and model.id.count("/") == 1
+
+
+# Check the files of a downloaded model are still on disk
+# Only huggingface models can be checked on the node, other models are
+# reported missing so that the worker checks their files itself
+def model_files_exist(model: ModelConfig, hf_cache_dir: Optional[str]) -> bool:
+    if hf_cache_dir is None or not _is_huggingface_model(model):
+        return False
+    repo_dirname = "models--" + model.id.replace("/", "--")
+    # the worker may use the cache dir as the hub cache or as HF_HOME
+    for dirname in [hf_cache_dir, os.path.join(hf_cache_dir, "hub")]:
+        snapshots_dir = os.path.join(dirname, repo_dirname, "snapshots")
+        if os.path.isdir(snapshots_dir) and len(os.listdir(snapshots_dir)) > 0:
+            return True
+    return False
@@ -0,0 +1,29 @@
+from typing import Optional
+
+from .abc import EvaluationCache
+from .db_impl import DbEvaluationCache
+from .memory_impl import MemoryEvaluationCache
+from .utils import get_evaluation_fingerprint
+
+__all__ = [
+    "EvaluationCache",
+    "DbEvaluationCache",
+    "MemoryEvaluationCache",
+    "get_evaluation_fingerprint",
+    "get_evaluation_cache",
+    "set_evaluation_cache",
+]
+
+_default_evaluation_cache: Optional[EvaluationCache] = None
+
+
+def get_evaluation_cache() -> EvaluationCache:
+    assert _default_evaluation_cache is not None
+
+    return _default_evaluation_cache
+
+
+def set_evaluation_cache(cache: EvaluationCache):
+    global _default_evaluation_cache
+
+    _default_evaluation_cache = cache
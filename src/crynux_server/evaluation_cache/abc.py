@@ -0,0 +1,12 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from crynux_server.models import EvaluationResult
+
+
+class EvaluationCache(ABC):
+    @abstractmethod
+    async def save(self, result: EvaluationResult): ...
+
+    @abstractmethod
+    async def get(self, fingerprint: str) -> Optional[EvaluationResult]: ...
@@ -0,0 +1,43 @@
+from typing import Optional
+
+import sqlalchemy as sa
+
+import crynux_server.db.models as db_models
+from crynux_server import db
+from crynux_server.models import EvaluationResult
+
+from .abc import EvaluationCache
+
+
+class DbEvaluationCache(EvaluationCache):
+    async def save(self, result: EvaluationResult):
+        async with db.session_scope() as sess:
+            q = sa.select(db_models.EvaluationResult).where(
+                db_models.EvaluationResult.fingerprint == result.fingerprint
+            )
+            m = (await sess.scalars(q)).one_or_none()
+            if m is None:
+                m = db_models.EvaluationResult(
+                    fingerprint=result.fingerprint,
+                    duration=result.duration,
+                    result_hash=result.result_hash,
+                )
+                sess.add(m)
+            else:
+                m.duration = result.duration
+                m.result_hash = result.result_hash
+            await sess.commit()
+
+    async def get(self, fingerprint: str) -> Optional[EvaluationResult]:
+        async with db.session_scope() as sess:
+            q = sa.select(db_models.EvaluationResult).where(
+                db_models.EvaluationResult.fingerprint == fingerprint
+            )
+            m = (await sess.scalars(q)).one_or_none()
+            if m is None:
+                return None
+            return EvaluationResult(
+                fingerprint=m.fingerprint,
+                duration=m.duration,
+                result_hash=m.result_hash,
+            )
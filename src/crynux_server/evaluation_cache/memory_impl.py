@@ -0,0 +1,16 @@
+from typing import Dict, Optional
+
+from crynux_server.models import EvaluationResult
+
+from .abc import EvaluationCache
+
+
+class MemoryEvaluationCache(EvaluationCache):
+    def __init__(self):
+        self._results: Dict[str, EvaluationResult] = {}
+
+    async def save(self, result: EvaluationResult):
+        self._results[result.fingerprint] = result
+
+    async def get(self, fingerprint: str) -> Optional[EvaluationResult]:
+        return self._results.get(fingerprint)
@@ -0,0 +1,29 @@
+import json
+from hashlib import sha256
+from typing import List, Optional, Tuple
+
+from crynux_server.models import ModelConfig
+
+
+# The evaluation result can be reused only when the gpu, every worker and the
+# evaluation task itself are unchanged.
+# workers are the (device, version) pairs of the connected workers
+def get_evaluation_fingerprint(
+    gpu_name: str,
+    gpu_vram: int,
+    workers: List[Tuple[Optional[str], str]],
+    models: List[ModelConfig],
+    task_args: str,
+) -> str:
+    data = {
+        "gpu_name": gpu_name,
+        "gpu_vram": gpu_vram,
+        "workers": sorted(
+            f"{device or ''}:{version}" for device, version in workers
+        ),
+        "models": sorted(model.to_model_id() for model in models),
+        "task_args": sha256(task_args.encode("utf-8")).hexdigest(),
+    }
+    return sha256(
+        json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
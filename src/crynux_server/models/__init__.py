@@ -1,4 +1,5 @@
 from .download_model import DownloadedModel, ModelConfig
+from .evaluation import EvaluationResult
 from .event import (EventType, Event, DownloadModel, TaskEndAborted, TaskEndGroupRefund,
                     TaskEndGroupSuccess, TaskEndInvalidated, TaskEndSuccess,
                     TaskErrorReported, TaskScoreReady, TaskStarted,
@@ -8,10 +9,11 @@ from .node import (ChainNetworkNodeInfo, ChainNodeInfo, ChainNodeStatus, NodeInf
                    GpuInfo, NodeState, NodeStatus, convert_node_status, NodeScoreState, ChainNodeStakingStatus, ChainNodeStakingInfo)
 from .task import (ChainTask, DownloadTaskState, DownloadTaskStatus,
                    InferenceTaskState, InferenceTaskStatus, RelayTask,
-                   TaskAbortReason, TaskError, TaskType)
+                   TaskAbortReason, TaskError, TaskResultFile, TaskType)
 from .tx import TxState, TxStatus
-from .worker import (DownloadTaskInput, ErrorResult, InferenceTaskInput,
-                     SuccessResult, TaskInput, TaskResult)
+from .worker import (CancelledResult, DownloadTaskInput, ErrorResult,
+                     InferenceTaskInput, SuccessResult, TaskCancel, TaskInput,
+                     TaskProgress, TaskResult, WarmupTaskInput)
 
 __all__ = [
     "EventType",
@@ -52,12 +54,18 @@ __all__ = [
     "TxState",
     "TaskError",
     "TaskAbortReason",
+    "TaskResultFile",
     "DownloadTaskInput",
     "InferenceTaskInput",
+    "WarmupTaskInput",
+    "TaskCancel",
+    "TaskProgress",
+    "CancelledResult",
     "ModelConfig",
     "TaskInput",
     "SuccessResult",
     "ErrorResult",
     "TaskResult",
     "DownloadedModel",
+    "EvaluationResult",
 ]
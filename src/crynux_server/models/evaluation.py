@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class EvaluationResult(BaseModel):
+    # hash of the hardware, worker version and evaluation task the result comes from
+    fingerprint: str
+    # seconds used by the evaluation task
+    duration: float
+    # hex hashes of the result files, joined by ","
+    result_hash: str
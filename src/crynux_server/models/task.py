@@ -117,6 +117,14 @@ class RelayTask(BaseModel):
     result_uploaded_time: Optional[datetime] = None
 
 
+# A task result file of the resumable upload
+class TaskResultFile(BaseModel):
+    name: str
+    filename: str
+    size: int
+    sha256: str
+
+
 class InferenceTaskState(BaseModel):
     task_id_commitment: bytes
     timeout: int
@@ -1,4 +1,4 @@
-from typing import List, Literal
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -11,6 +11,8 @@ class DownloadTaskInput(BaseModel):
     task_type: TaskType
     task_id: str
     model: ModelConfig
+    # Bandwidth limit of the download in bytes per second, None for no limit
+    max_bandwidth: Optional[int] = None
 
 
 class InferenceTaskInput(BaseModel):
@@ -22,12 +24,43 @@ class InferenceTaskInput(BaseModel):
     output_dir: str
 
 
+# Hint the worker to load the task models before the task parameters are uploaded
+# Only sent to workers which support the "warmup" feature
+class WarmupTaskInput(BaseModel):
+    task_name: Literal["warmup"]
+    task_type: TaskType
+    task_id: str
+    models: List[ModelConfig]
+
+
+# Progress of the running task, sent by workers which support the "progress" feature
+class TaskProgress(BaseModel):
+    task_id: str
+    # e.g. "loading", "inference"
+    phase: str
+    step: int = 0
+    total: int = 0
+
+
+# Stop the running task in the worker
+# Only sent to workers which support the "cancel" feature
+class TaskCancel(BaseModel):
+    task_id: str
+
+
 class TaskInput(BaseModel):
-    task: DownloadTaskInput | InferenceTaskInput = Field(discriminator="task_name")
+    task: DownloadTaskInput | InferenceTaskInput | WarmupTaskInput = Field(
+        discriminator="task_name"
+    )
 
 
 class SuccessResult(BaseModel):
     status: Literal["success"]
+    # Result files relative to the task output dir and their hex encoded hashes,
+    # sent by inference workers which hash results on their own.
+    # Both are empty for download tasks and older workers.
+    files: List[str] = []
+    hashes: List[str] = []
 
 
 class ErrorResult(BaseModel):
@@ -35,7 +68,17 @@ class ErrorResult(BaseModel):
     traceback: str
 
 
+# Sent by the worker when it stops the task on a cancel message
+class CancelledResult(BaseModel):
+    status: Literal["cancelled"]
+
+
 class TaskResult(BaseModel):
-    task_name: Literal["inference", "download"]
+    task_name: Literal["inference", "download", "warmup"]
     task_id_commitment: str
-    result: SuccessResult | ErrorResult = Field(discriminator="status")
+    result: SuccessResult | ErrorResult | CancelledResult = Field(
+        discriminator="status"
+    )
+    # Models loaded in the worker after the task, used to route tasks to warm workers.
+    # None for older workers which don't report them.
+    resident_models: Optional[List[ModelConfig]] = None
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import functools
 import json
 import logging
+import os
+import shutil
+import time
 from datetime import datetime
-from typing import Optional, Type
+from typing import List, Optional, Tuple, Type
 
 from anyio import (
     TASK_STATUS_IGNORED,
@@ -28,6 +32,7 @@ from web3 import Web3
 from crynux_server import models
 from crynux_server.config import (
     Config,
+    RelayPoolConfig,
     ensure_staking_amount,
     get_staking_amount,
     wait_privkey,
@@ -35,6 +40,7 @@ from crynux_server.config import (
 from crynux_server.contracts import Contracts, set_contracts
 from crynux_server.relay import Relay, WebRelay, set_relay
 from crynux_server.task import (
+    INFERENCE_TASK_EVENT_STATUS,
     DbDownloadTaskStateCache,
     DbInferenceTaskStateCache,
     DownloadTaskStateCache,
@@ -44,6 +50,13 @@ from crynux_server.task import (
     set_inference_task_state_cache,
     set_task_system,
 )
+from crynux_server.task.utils import (
+    DownloadBudget,
+    get_result_files,
+    get_result_hashes,
+    run_download_task,
+    set_download_budget,
+)
 from crynux_server.watcher import EventWatcher, set_watcher
 from crynux_server.worker_manager import (
     TaskCancelled,
@@ -55,8 +68,15 @@ from crynux_server.worker_manager import (
 from crynux_server.download_model_cache import (
     DownloadModelCache,
     DbDownloadModelCache,
+    model_files_exist,
     set_download_model_cache,
 )
+from crynux_server.evaluation_cache import (
+    DbEvaluationCache,
+    EvaluationCache,
+    get_evaluation_fingerprint,
+    set_evaluation_cache,
+)
 
 from .state_cache import (
     DbNodeStateCache,
@@ -70,6 +90,11 @@ from .state_manager import NodeStateManager, set_node_state_manager
 
 _logger = logging.getLogger(__name__)
 
+# steps of the local evaluation task, and of the shortened one run instead
+# when the evaluation passed before in the same environment
+EVALUATION_STEPS = 40
+QUICK_EVALUATION_STEPS = 4
+
 
 async def _make_contracts(
     privkey: str,
@@ -94,8 +119,10 @@ async def _make_contracts(
     return contracts
 
 
-def _make_relay(privkey: str, relay_url: str) -> Relay:
-    relay = WebRelay(base_url=relay_url, privkey=privkey)
+def _make_relay(
+    privkey: str, relay_url: str, pool_config: Optional[RelayPoolConfig] = None
+) -> Relay:
+    relay = WebRelay(base_url=relay_url, privkey=privkey, pool_config=pool_config)
     set_relay(relay)
     return relay
 
@@ -176,6 +203,7 @@ class NodeManager(object):
             StateCache[models.NodeScoreState]
         ] = DbNodeScoreStateCache,
         download_model_cache_cls: Type[DownloadModelCache] = DbDownloadModelCache,
+        evaluation_cache_cls: Type[EvaluationCache] = DbEvaluationCache,
         manager_state_cache: Optional[ManagerStateCache] = None,
         privkey: Optional[str] = None,
         contracts: Optional[Contracts] = None,
@@ -197,6 +225,15 @@ class NodeManager(object):
 
         self.download_model_cache = download_model_cache_cls()
         set_download_model_cache(self.download_model_cache)
+        if config.task_config is not None:
+            set_download_budget(
+                DownloadBudget(
+                    concurrency=config.task_config.download_concurrency,
+                    bandwidth=config.task_config.download_bandwidth,
+                )
+            )
+        self.evaluation_cache = evaluation_cache_cls()
+        set_evaluation_cache(self.evaluation_cache)
         if manager_state_cache is None:
             manager_state_cache = ManagerStateCache(
                 node_state_cache_cls=node_state_cache_cls,
@@ -256,7 +293,9 @@ class NodeManager(object):
                 )
                 _logger.info("Staking amount is %s CNX.", staking_amount)
             if self._relay is None:
-                self._relay = _make_relay(self._privkey, self.config.relay_url)
+                self._relay = _make_relay(
+                    self._privkey, self.config.relay_url, self.config.relay_pool
+                )
 
         if self._task_system is None:
             self._task_system = _make_task_system(
@@ -338,19 +377,44 @@ class NodeManager(object):
                     )
                     task_inputs.append(task_input)
 
-        for i, task_input in enumerate(task_inputs):
-            task_fut = await self._worker_manager.send_task(task_input)
+        # skip the models downloaded before whose files are still on disk
+        pending_inputs = []
+        for task_input in task_inputs:
+            assert isinstance(task_input.task, models.DownloadTaskInput)
+            model = task_input.task.model
+            if await self.download_model_cache.has(model) and model_files_exist(
+                model, self.config.task_config.hf_cache_dir
+            ):
+                _logger.info(f"Model {model.to_model_id()} has been downloaded")
+            else:
+                pending_inputs.append(task_input)
+        if len(pending_inputs) == 0:
+            return
+
+        total = len(task_inputs)
+        done = total - len(pending_inputs)
+
+        async def report_progress():
+            msg = f"Downloading models............ ({done}/{total})"
+            _logger.info(msg)
+            await self.state_cache.set_node_state(
+                status=models.NodeStatus.Init, init_message=msg
+            )
+
+        async def download(task: models.DownloadTaskInput):
+            nonlocal done
+
             try:
-                msg = f"Downloading models............ ({i+1}/{len(task_inputs)})"
-                _logger.info(msg)
-                await self.state_cache.set_node_state(
-                    status=models.NodeStatus.Init, init_message=msg
+                # downloads share the concurrency and bandwidth budget with
+                # the downloads from relay events, and the same models are coalesced
+                await run_download_task(
+                    task_id=task.task_id,
+                    task_type=task.task_type,
+                    model=task.model,
+                    worker_manager=self._worker_manager,
                 )
-                await task_fut.get()
                 await self.download_model_cache.save(
-                    models.DownloadedModel(
-                        task_type=task_input.task.task_type, model=task_input.task.model
-                    )
+                    models.DownloadedModel(task_type=task.task_type, model=task.model)
                 )
             except TaskCancelled:
                 raise ValueError(
@@ -360,10 +424,20 @@ class NodeManager(object):
                 raise ValueError(
                     "Failed to download models due to network issue"
                 ) from e
+            except get_cancelled_exc_class():
+                raise
             except Exception as e:
                 raise ValueError("Failed to download models") from e
+            done += 1
+            await report_progress()
 
-    async def _run_initial_inference_task(self):
+        await report_progress()
+        async with create_task_group() as tg:
+            for task_input in pending_inputs:
+                assert isinstance(task_input.task, models.DownloadTaskInput)
+                tg.start_soon(download, task_input.task)
+
+    def _evaluation_task_args(self, steps: int) -> str:
         prompt = (
             "a realistic photo of an old man sitting on a brown chair, "
             "on the seaside, with blue sky and white clouds, a dog is lying "
@@ -382,30 +456,41 @@ class NodeManager(object):
                 "safety_checker": False,
                 "cfg": 7,
                 "seed": 99975892,
-                "steps": 40,
+                "steps": steps,
             },
         }
+        return json.dumps(task_args)
+
+    # run an evaluation task, return its duration and the hash of its result
+    async def _run_evaluation_task(
+        self, task_id: str, task_models: List[models.ModelConfig], task_args: str
+    ) -> Tuple[float, str]:
+        # each evaluation task has its own result dir, so that only the files
+        # of this run are hashed
+        task_dir = os.path.join(self.config.task_config.output_dir, task_id)
+        await to_thread.run_sync(
+            functools.partial(shutil.rmtree, task_dir, ignore_errors=True)
+        )
+        await to_thread.run_sync(
+            functools.partial(os.makedirs, task_dir, exist_ok=True)
+        )
 
         task_input = models.TaskInput(
             task=models.InferenceTaskInput(
                 task_name="inference",
                 task_type=models.TaskType.SD,
-                task_id="initial_inference_task",
-                models=[
-                    models.ModelConfig(
-                        id="crynux-network/stable-diffusion-v1-5",
-                        type="base",
-                        variant="fp16",
-                    )
-                ],
-                task_args=json.dumps(task_args),
-                output_dir=self.config.task_config.output_dir,
+                task_id=task_id,
+                models=task_models,
+                task_args=task_args,
+                output_dir=task_dir,
             )
         )
         try:
             with fail_after(300):
+                start_time = time.monotonic()
                 task_fut = await self._worker_manager.send_task(task_input)
-                await task_fut.get()
+                result = await task_fut.get()
+                duration = time.monotonic() - start_time
         except TimeoutError as e:
             msg = (
                 "The initial inference task exceeded the timeout limit(5 min). Maybe your device does not meet "
@@ -415,6 +500,102 @@ class NodeManager(object):
         except TaskError as e:
             raise ValueError("The initial validation task failed") from e
 
+        if isinstance(result, models.SuccessResult) and len(result.hashes) > 0:
+            result_hashes = result.hashes
+        else:
+            # older workers only write the result files
+            files = await to_thread.run_sync(
+                get_result_files, models.TaskType.SD, task_dir
+            )
+            hashes = await get_result_hashes(models.TaskType.SD, files)
+            result_hashes = [h.hex() for h in hashes]
+        return duration, ",".join(result_hashes)
+
+    async def _run_initial_inference_task(self):
+        task_models = [
+            models.ModelConfig(
+                id="crynux-network/stable-diffusion-v1-5",
+                type="base",
+                variant="fp16",
+            )
+        ]
+        task_args = self._evaluation_task_args(steps=EVALUATION_STEPS)
+        quick_task_args = self._evaluation_task_args(steps=QUICK_EVALUATION_STEPS)
+
+        workers = [
+            (state.device, state.version)
+            for state in self._worker_manager.worker_states()
+            if state.version is not None
+        ]
+        assert len(workers) > 0
+        fingerprint = get_evaluation_fingerprint(
+            gpu_name=self.gpu_name,
+            gpu_vram=self.gpu_vram,
+            workers=workers,
+            models=task_models,
+            task_args=task_args,
+        )
+        quick_fingerprint = get_evaluation_fingerprint(
+            gpu_name=self.gpu_name,
+            gpu_vram=self.gpu_vram,
+            workers=workers,
+            models=task_models,
+            task_args=quick_task_args,
+        )
+
+        quick_evaluation: Optional[models.EvaluationResult] = None
+        evaluation = await self.evaluation_cache.get(fingerprint)
+        if evaluation is not None and not self.config.task_config.force_evaluation:
+            # the full evaluation passed before in the same environment,
+            # a shortened one checks the worker still gives the same result
+            await self.state_cache.set_node_state(
+                status=models.NodeStatus.Init,
+                init_message="Running shortened local evaluation task",
+            )
+            duration, result_hash = await self._run_evaluation_task(
+                "initial_inference_task_quick", task_models, quick_task_args
+            )
+            quick_evaluation = models.EvaluationResult(
+                fingerprint=quick_fingerprint,
+                duration=duration,
+                result_hash=result_hash,
+            )
+            previous = await self.evaluation_cache.get(quick_fingerprint)
+            if previous is None or previous.result_hash == result_hash:
+                await self.evaluation_cache.save(quick_evaluation)
+                _logger.info(
+                    f"Reuse the initial validation task result, which took {evaluation.duration:.1f}s, "
+                    f"the shortened validation task took {duration:.1f}s"
+                )
+                return
+            _logger.warning(
+                "The shortened validation task result differs from the last one, "
+                "run the full initial validation task"
+            )
+
+        await self.state_cache.set_node_state(
+            status=models.NodeStatus.Init, init_message="Running local evaluation task"
+        )
+        duration, result_hash = await self._run_evaluation_task(
+            "initial_inference_task", task_models, task_args
+        )
+        if evaluation is not None and evaluation.result_hash != result_hash:
+            _logger.warning(
+                "The initial validation task result differs from the last one "
+                "in the same environment"
+            )
+        await self.evaluation_cache.save(
+            models.EvaluationResult(
+                fingerprint=fingerprint,
+                duration=duration,
+                result_hash=result_hash,
+            )
+        )
+        # the full evaluation passed, the shortened result of this environment
+        # replaces the mismatched one
+        if quick_evaluation is not None:
+            await self.evaluation_cache.save(quick_evaluation)
+
     async def _init(self):
         _logger.info("Initialize node manager")
 
@@ -428,9 +609,6 @@ class NodeManager(object):
                 await self._prefetch_models()
         _logger.info("Finish downloading models")
 
-        await self.state_cache.set_node_state(
-            status=models.NodeStatus.Init, init_message="Running local evaluation task"
-        )
         await self._run_initial_inference_task()
         _logger.info("Finish initial validation task")
 
@@ -494,6 +672,9 @@ class NodeManager(object):
 
         account = self._relay.node_address
 
+        if self._task_system is not None:
+            self._watcher.set_active_check(self._task_system.has_active_tasks)
+
         async def _node_kicked_out(event: models.Event):
             assert isinstance(event, models.NodeKickedOut)
             address = event.node_address
@@ -526,6 +707,16 @@ class NodeManager(object):
 
         self._watcher.add_event_filter("TaskStarted", callback=_inference_task_started)
 
+        async def _inference_task_status_changed(event: models.Event):
+            assert self._task_system is not None
+
+            await self._task_system.update_inference_task_status(event)
+
+        for event_type in INFERENCE_TASK_EVENT_STATUS:
+            self._watcher.add_event_filter(
+                event_type, callback=_inference_task_status_changed
+            )
+
         async def _download_task_started(event: models.Event):
             assert isinstance(event, models.DownloadModel)
             assert self._task_system is not None
@@ -780,7 +971,10 @@ class NodeManager(object):
 
         try:
             with self._worker_manager.start():
-                await self._run(prefetch=prefetch)
+                async with create_task_group() as tg:
+                    tg.start_soon(self._worker_manager.supervise)
+                    await self._run(prefetch=prefetch)
+                    tg.cancel_scope.cancel()
         except get_cancelled_exc_class():
             raise
         except Exception as e:
@@ -1,11 +1,20 @@
 from typing import Optional
 
 from .abc import Relay
+from .coalesce import CoalesceStats
 from .exceptions import RelayError
 from .mock_impl import MockRelay
 from .web_impl import WebRelay
 
-__all__ = ["Relay", "RelayError", "get_relay", "set_relay", "WebRelay", "MockRelay"]
+__all__ = [
+    "Relay",
+    "RelayError",
+    "get_relay",
+    "set_relay",
+    "WebRelay",
+    "MockRelay",
+    "CoalesceStats",
+]
 
 
 _default_relay: Optional[Relay] = None
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import BinaryIO, List, Optional
+from typing import AsyncIterator, BinaryIO, List, Optional
 
 from eth_typing import ChecksumAddress
 
@@ -12,10 +12,17 @@ from crynux_server.models import (
     RelayTask,
     TaskAbortReason,
     TaskError,
+    TaskResultFile,
 )
 
+from .streaming import TaskResultPayload
+
 
 class Relay(ABC):
+    # Whether the relay pushes events by subscribe_events,
+    # otherwise the caller should poll get_events instead
+    supports_event_push: bool = False
+
     @property
     @abstractmethod
     def node_address(self) -> ChecksumAddress: ...
@@ -51,14 +58,34 @@ class Relay(ABC):
         self, task_id_commitment: bytes, abort_reason: TaskAbortReason
     ): ...
 
+    # payload is the result staged by stage_task_result in advance,
+    # it is uploaded instead of reading file_paths and checkpoint_dir again
     @abstractmethod
     async def upload_task_result(
         self,
         task_id_commitment: bytes,
         file_paths: List[str],
         checkpoint_dir: Optional[str] = None,
+        payload: Optional[TaskResultPayload] = None,
+    ): ...
+
+    # Resumable task result upload
+    # The relay keeps the received parts of each result file, so an interrupted
+    # upload only sends the missing parts again.
+    # Returns the received size of each file.
+    @abstractmethod
+    async def start_task_result_upload(
+        self, task_id_commitment: bytes, files: List[TaskResultFile]
+    ) -> List[int]: ...
+
+    @abstractmethod
+    async def upload_task_result_part(
+        self, task_id_commitment: bytes, index: int, offset: int, data: bytes
     ): ...
 
+    @abstractmethod
+    async def complete_task_result_upload(self, task_id_commitment: bytes): ...
+
     @abstractmethod
     async def get_result(
         self, task_id_commitment: bytes, index: int, dst: BinaryIO
@@ -134,3 +161,13 @@ class Relay(ABC):
         node_address: Optional[str] = None,
         task_id_commitment: Optional[bytes] = None,
     ) -> int: ...
+
+    # Subscribe to the events pushed by the relay, after the event start_id
+    # Events are yielded as soon as the relay has them
+    # Only relays with supports_event_push implement it
+    def subscribe_events(
+        self,
+        start_id: int,
+        node_address: Optional[str] = None,
+    ) -> AsyncIterator[Event]:
+        raise NotImplementedError("The relay does not push events")
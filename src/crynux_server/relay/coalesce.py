@@ -0,0 +1,88 @@
+import copy
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from pydantic import BaseModel
+
+from crynux_server.utils import SingleFlight
+
+__all__ = ["CoalesceStats", "RequestCoalescer"]
+
+
+class CoalesceStats(BaseModel):
+    # calls answered by a running request or a cached result
+    hits: int = 0
+    # calls which sent a request to the relay
+    misses: int = 0
+
+
+# Concurrent identical calls share one request, and the result is kept
+# for a short ttl, so that the callers polling the same resource do not
+# each send a signed request
+# Each caller gets its own copy of the result
+# Errors are never cached, and a cancelled request is sent again by the next caller
+class RequestCoalescer(object):
+    def __init__(self) -> None:
+        self._flight = SingleFlight()
+        self._cache: Dict[Tuple[str, Hashable], Tuple[float, Any]] = {}
+        self._stats: Dict[str, CoalesceStats] = defaultdict(CoalesceStats)
+        # bumped on each invalidation, so that a request sent before it
+        # does not cache its result
+        self._generations: Dict[str, int] = defaultdict(int)
+
+    async def call(
+        self,
+        method: str,
+        key: Hashable,
+        func: Callable[[], Awaitable[Any]],
+        ttl: float = 0,
+    ) -> Any:
+        cache_key = (method, key)
+        stats = self._stats[method]
+
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                stats.hits += 1
+                return copy.deepcopy(result)
+            del self._cache[cache_key]
+
+        sent = False
+
+        async def send():
+            nonlocal sent
+
+            sent = True
+            stats.misses += 1
+            generation = self._generations[method]
+            result = await func()
+            if ttl > 0 and generation == self._generations[method]:
+                self._cache[cache_key] = (time.monotonic() + ttl, result)
+            return result
+
+        # the callers answered by the running request are hits
+        try:
+            result = await self._flight.call(cache_key, send)
+        except Exception:
+            if not sent:
+                stats.hits += 1
+            raise
+        if not sent:
+            stats.hits += 1
+        return result
+
+    # Drop the cached results of the method, or only the one of the key,
+    # after a call which changes them
+    def invalidate(self, method: str, key: Optional[Hashable] = None):
+        self._generations[method] += 1
+        if key is not None:
+            self._cache.pop((method, key), None)
+            return
+        for cache_key in list(self._cache):
+            if cache_key[0] == method:
+                del self._cache[cache_key]
+
+    def stats(self) -> Dict[str, CoalesceStats]:
+        return {method: stats.model_copy() for method, stats in self._stats.items()}
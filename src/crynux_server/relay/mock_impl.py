@@ -1,25 +1,63 @@
+import hashlib
+import io
 import json
 import os
 import shutil
 import time
+import zipfile
+from collections import defaultdict
 from contextlib import contextmanager
 from datetime import datetime
 from tempfile import mkdtemp
-from typing import BinaryIO, Dict, List, Optional
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
 
 from anyio import Condition, get_cancelled_exc_class, to_thread
 from web3 import Web3
 
-from crynux_server.models import InferenceTaskStatus, RelayTask, TaskType
+from crynux_server.models import (ChainNodeStatus, Event, EventType,
+                                  InferenceTaskStatus, NodeInfo, RelayTask,
+                                  TaskAbortReason, TaskError, TaskResultFile,
+                                  TaskType)
 
 from .abc import Relay
 from .exceptions import RelayError
+from .streaming import TaskResultPayload
+
+
+# Size of the contiguous data received from the beginning of the file
+def _received_size(parts: Dict[int, bytes]) -> int:
+    size = 0
+    while size in parts and len(parts[size]) > 0:
+        size += len(parts[size])
+    return size
+
+
+def _write_file(content: bytes, dst_path: str):
+    with open(dst_path, mode="wb") as f:
+        f.write(content)
+
+
+def _extract_zip(content: bytes, dst_dir: str):
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        zf.extractall(dst_dir)
+
+
+MOCK_NODE_ADDRESS = "0x577887519278199ce8F8D80bAcc70fc32b48daD4"
 
 
 class MockRelay(Relay):
-    def __init__(self) -> None:
+    def __init__(
+        self, push_events: bool = True, node_address: str = MOCK_NODE_ADDRESS
+    ) -> None:
         super().__init__()
 
+        self._node_address = Web3.to_checksum_address(node_address)
+
+        # events of the relay, the id of an event is its index plus 1
+        self.events: List[Event] = []
+        self.supports_event_push = push_events
+        self._event_condition = Condition()
+
         self.tasks: Dict[bytes, RelayTask] = {}
 
         self.task_input_checkpoint: Dict[bytes, str] = {}
@@ -27,12 +65,46 @@ class MockRelay(Relay):
         self.task_results: Dict[bytes, List[str]] = {}
         self.task_result_checkpoint: Dict[bytes, str] = {}
 
+        # received parts of resumable result uploads, offset to data of each file
+        self.task_result_uploads: Dict[
+            bytes, Tuple[List[TaskResultFile], List[Dict[int, bytes]]]
+        ] = {}
+
         self._conditions: Dict[bytes, Condition] = {}
 
+        # node and balances kept by the relay
+        self.node_info = NodeInfo(
+            address=self._node_address,
+            gpu_name="",
+            gpu_vram=0,
+            in_use_model_ids=[],
+            model_ids=[],
+            qos_score=0,
+            staking_score=0,
+            prob_weight=0,
+            status=ChainNodeStatus.QUIT,
+            version="",
+            operator_staking="0",
+            delegator_staking="0",
+            delegator_share=0,
+            delegators_num=0,
+            total_operator_earnings="0",
+            today_operator_earnings="0",
+            total_delegator_earnings="0",
+            today_delegator_earnings="0",
+        )
+        self.node_task = bytes(32)
+        self.balances: Dict[str, int] = defaultdict(int)
+        self.staking_amount = 0
+
         self._tempdir = mkdtemp()
 
         self._closed = False
 
+    @property
+    def node_address(self):
+        return self._node_address
+
     def get_condition(self, task_id_commitment: bytes) -> Condition:
         if task_id_commitment not in self._conditions:
             self._conditions[task_id_commitment] = Condition()
@@ -138,11 +210,30 @@ class MockRelay(Relay):
         with self.wrap_error("getTask"):
             return self.tasks[task_id_commitment]
 
+    async def report_task_error(
+        self, task_id_commitment: bytes, task_error: TaskError
+    ):
+        with self.wrap_error("reportTaskError"):
+            self.tasks[task_id_commitment].status = InferenceTaskStatus.ErrorReported
+
+    async def submit_task_score(self, task_id_commitment: bytes, score: bytes):
+        with self.wrap_error("submitTaskScore"):
+            task = self.tasks[task_id_commitment]
+            task.score = score.hex()
+            task.status = InferenceTaskStatus.ScoreReady
+
+    async def abort_task(
+        self, task_id_commitment: bytes, abort_reason: TaskAbortReason
+    ):
+        with self.wrap_error("abortTask"):
+            self.tasks[task_id_commitment].status = InferenceTaskStatus.EndAborted
+
     async def upload_task_result(
         self,
         task_id_commitment: bytes,
         file_paths: List[str],
         checkpoint_dir: Optional[str] = None,
+        payload: Optional[TaskResultPayload] = None,
     ):
         with self.wrap_error("uploadTaskResult"):
             condition = self.get_condition(task_id_commitment)
@@ -168,6 +259,60 @@ class MockRelay(Relay):
 
                 condition.notify()
 
+    async def start_task_result_upload(
+        self, task_id_commitment: bytes, files: List[TaskResultFile]
+    ) -> List[int]:
+        with self.wrap_error("startTaskResultUpload"):
+            upload = self.task_result_uploads.get(task_id_commitment)
+            if upload is None or upload[0] != files:
+                upload = (files, [{} for _ in files])
+                self.task_result_uploads[task_id_commitment] = upload
+            return [_received_size(parts) for parts in upload[1]]
+
+    async def upload_task_result_part(
+        self, task_id_commitment: bytes, index: int, offset: int, data: bytes
+    ):
+        with self.wrap_error("uploadTaskResultPart"):
+            files, parts = self.task_result_uploads[task_id_commitment]
+            if offset + len(data) > files[index].size:
+                raise ValueError(f"Part of file {index} exceeds the file size")
+            parts[index][offset] = data
+
+    async def complete_task_result_upload(self, task_id_commitment: bytes):
+        with self.wrap_error("completeTaskResultUpload"):
+            files, parts = self.task_result_uploads[task_id_commitment]
+            contents: List[bytes] = []
+            for file, file_parts in zip(files, parts):
+                if _received_size(file_parts) != file.size:
+                    raise ValueError(f"File {file.filename} is incomplete")
+                content = b"".join(file_parts[offset] for offset in sorted(file_parts))
+                if hashlib.sha256(content).hexdigest() != file.sha256:
+                    raise ValueError(f"File {file.filename} checksum mismatch")
+                contents.append(content)
+
+            condition = self.get_condition(task_id_commitment)
+            async with condition:
+                self.task_results[task_id_commitment] = []
+
+                task_dir = os.path.join(self._tempdir, task_id_commitment.hex())
+                if not os.path.exists(task_dir):
+                    os.makedirs(task_dir, exist_ok=True)
+
+                for file, content in zip(files, contents):
+                    if file.name == "checkpoint":
+                        dst_path = os.path.join(task_dir, "result_checkpoint")
+                        await to_thread.run_sync(
+                            _extract_zip, content, dst_path
+                        )
+                        self.task_result_checkpoint[task_id_commitment] = dst_path
+                    else:
+                        dst_path = os.path.join(task_dir, file.filename)
+                        await to_thread.run_sync(_write_file, content, dst_path)
+                        self.task_results[task_id_commitment].append(dst_path)
+
+                del self.task_result_uploads[task_id_commitment]
+                condition.notify()
+
     async def get_result(self, task_id_commitment: bytes, index: int, dst: BinaryIO):
         with self.wrap_error("getResult"):
             condition = self.get_condition(task_id_commitment)
@@ -199,6 +344,108 @@ class MockRelay(Relay):
     async def now(self) -> int:
         return int(time.time())
 
+    async def node_get_node_info(self) -> NodeInfo:
+        return self.node_info.model_copy(deep=True)
+
+    async def node_join(
+        self,
+        network: str,
+        gpu_name: str,
+        gpu_vram: int,
+        model_ids: List[str],
+        version: str,
+        staking_amount: int,
+    ):
+        self.node_info.gpu_name = gpu_name
+        self.node_info.gpu_vram = gpu_vram
+        self.node_info.model_ids = list(model_ids)
+        self.node_info.version = version
+        self.node_info.status = ChainNodeStatus.AVAILABLE
+        self.staking_amount = staking_amount
+
+    async def node_report_model_downloaded(self, model_id: str):
+        if model_id not in self.node_info.model_ids:
+            self.node_info.model_ids.append(model_id)
+
+    async def node_pause(self):
+        self.node_info.status = ChainNodeStatus.PAUSED
+
+    async def node_quit(self):
+        self.node_info.status = ChainNodeStatus.QUIT
+        self.staking_amount = 0
+
+    async def node_resume(self):
+        self.node_info.status = ChainNodeStatus.AVAILABLE
+
+    async def node_get_current_task(self) -> bytes:
+        return self.node_task
+
+    async def node_update_version(self, version: str):
+        self.node_info.version = version
+
+    async def get_balance(self, address: Optional[str] = None) -> int:
+        if address is None:
+            address = self.node_address
+        return self.balances[address]
+
+    async def get_staking_amount(self) -> int:
+        return self.staking_amount
+
+    async def transfer(self, amount: int, to_addr: str):
+        if self.balances[self.node_address] < amount:
+            raise RelayError(
+                status_code=400, method="transfer", message="insufficient balance"
+            )
+        self.balances[self.node_address] -= amount
+        self.balances[to_addr] += amount
+
+    # Add the event to the relay, and push it to the subscribers
+    async def add_event(self, event: Event) -> Event:
+        event.id = len(self.events) + 1
+        self.events.append(event)
+        async with self._event_condition:
+            self._event_condition.notify_all()
+        return event
+
+    async def get_events(
+        self,
+        start_id: int,
+        event_type: Optional[EventType] = None,
+        node_address: Optional[str] = None,
+        task_id_commitment: Optional[bytes] = None,
+        limit: Optional[int] = None,
+    ) -> List[Event]:
+        events = [
+            event
+            for event in self.events[start_id:]
+            if event_type is None or event.type == event_type
+        ]
+        if limit is not None:
+            events = events[:limit]
+        return events
+
+    async def get_current_event_id(
+        self,
+        event_type: Optional[EventType] = None,
+        node_address: Optional[str] = None,
+        task_id_commitment: Optional[bytes] = None,
+    ) -> int:
+        return len(self.events)
+
+    async def subscribe_events(
+        self,
+        start_id: int,
+        node_address: Optional[str] = None,
+    ) -> AsyncIterator[Event]:
+        next_id = start_id
+        while True:
+            async with self._event_condition:
+                while len(self.events) <= next_id:
+                    await self._event_condition.wait()
+            for event in self.events[next_id:]:
+                next_id = event.id
+                yield event
+
     async def close(self):
         if not self._closed:
             self.tasks = {}
@@ -0,0 +1,55 @@
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from crynux_server.config import RelayPoolConfig
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _make_timeout(config: RelayPoolConfig) -> httpx.Timeout:
+    return httpx.Timeout(config.timeout, pool=config.pool_timeout)
+
+
+# Client for the small control calls to the relay
+def create_control_client(
+    base_url: str,
+    config: RelayPoolConfig,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=_make_timeout(config),
+        limits=limits,
+        http2=config.http2 and http2_available(),
+        transport=transport,
+    )
+
+
+# Client for the task result uploads and downloads
+# Large bodies are sent over their own HTTP/1.1 connections, so that they are not
+# multiplexed with the control calls under a shared flow control window
+def create_upload_client(
+    base_url: str,
+    config: RelayPoolConfig,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=config.upload_max_connections,
+        max_keepalive_connections=config.upload_max_connections,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=_make_timeout(config),
+        limits=limits,
+        transport=transport,
+    )
@@ -1,33 +1,86 @@
 import json
 import time
-import logging
 from typing import Any, Dict, Optional, Tuple
 
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
-from web3 import Web3
+from eth_hash.auto import keccak
+from eth_keys import KeyAPI
+from eth_keys.backends import NativeECCBackend, is_coincurve_available
 
 from crynux_server.utils import sort_dict
 
+# Signatures kept for the current second
+SIGNATURE_CACHE_SIZE = 256
+
+
+def native_signing_available() -> bool:
+    return is_coincurve_available()
+
+
+def _has_nested_list_dict(value: Any) -> bool:
+    if isinstance(value, dict):
+        return any(_has_nested_list_dict(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(
+            isinstance(v, dict) or _has_nested_list_dict(v) for v in value
+        )
+    return False
+
+
+# The signed JSON has the keys of all the nested dicts sorted,
+# except the dicts in lists which keep their order
+def canonical_json(input: Dict[str, Any]) -> bytes:
+    if _has_nested_list_dict(input):
+        input = sort_dict(input)
+        sort_keys = False
+    else:
+        sort_keys = True
+    return json.dumps(
+        input, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys
+    ).encode("utf-8")
+
 
 class Signer(object):
-    def __init__(self, privkey: str) -> None:
+    def __init__(self, privkey: str, native: Optional[bool] = None) -> None:
         self.account: LocalAccount = Account.from_key(privkey)
+        if native is None:
+            native = native_signing_available()
+        if native:
+            # libsecp256k1 through coincurve
+            import coincurve
+
+            self._native_key = coincurve.PrivateKey(bytes(self.account.key))
+        else:
+            self._native_key = None
+            self._key = KeyAPI(backend=NativeECCBackend).PrivateKey(self.account.key)
+        self._cache_timestamp: Optional[int] = None
+        self._cache: Dict[bytes, str] = {}
 
     def sign(
         self, input: Dict[str, Any], timestamp: Optional[int] = None
     ) -> Tuple[int, str]:
-        ordered_input = sort_dict(input)
-
-        input_bytes = json.dumps(
-            ordered_input, ensure_ascii=False, separators=(",", ":")
-        ).encode("utf-8")
+        input_bytes = canonical_json(input)
         if timestamp is None:
             timestamp = int(time.time())
-        t_bytes = str(timestamp).encode("utf-8")
 
-        data_hash = Web3.keccak(input_bytes + t_bytes)
+        # the same input is signed once in a second
+        if timestamp != self._cache_timestamp:
+            self._cache_timestamp = timestamp
+            self._cache.clear()
+        signature = self._cache.get(input_bytes)
+        if signature is not None:
+            return timestamp, signature
+
+        t_bytes = str(timestamp).encode("utf-8")
+        data_hash = keccak(input_bytes + t_bytes)
+        # v of the signature is 0 or 1
+        if self._native_key is not None:
+            signature_bytes = self._native_key.sign_recoverable(data_hash, hasher=None)
+        else:
+            signature_bytes = self._key.sign_msg_hash(data_hash).to_bytes()
+        signature = "0x" + signature_bytes.hex()
 
-        res = bytearray(self.account.signHash(data_hash).signature)
-        res[-1] -= 27
-        return timestamp, "0x" + res.hex()
+        if len(self._cache) < SIGNATURE_CACHE_SIZE:
+            self._cache[input_bytes] = signature
+        return timestamp, signature
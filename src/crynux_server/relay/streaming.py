@@ -0,0 +1,760 @@
+import hashlib
+import os
+import queue
+import secrets
+import struct
+import tempfile
+import threading
+import zipfile
+import zlib
+from typing import (AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple,
+                    Union)
+
+from anyio import create_memory_object_stream, create_task_group, open_file, to_thread
+
+from crynux_server.models import TaskResultFile
+from crynux_server.utils import FILE_CHUNK_SIZE, iter_fileobj_chunks
+
+__all__ = [
+    "file_stream",
+    "zip_dir_stream",
+    "MultipartBody",
+    "TaskResultPayload",
+    "stage_task_result",
+    "StreamingUnzipper",
+    "unzip_stream",
+]
+
+# Files which are already compressed or compress poorly are stored as is,
+# deflating them only costs cpu time
+STORED_SUFFIXES = (
+    ".safetensors",
+    ".bin",
+    ".pt",
+    ".pth",
+    ".ckpt",
+    ".zip",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".webp",
+)
+
+# Number of chunks buffered between the zip thread and the request
+ZIP_STREAM_QUEUE_SIZE = 4
+
+
+class _ZipStreamClosed(Exception):
+    pass
+
+
+_EOF = object()
+
+
+# An unseekable file object, which collects the zip output into chunks
+# and hands the chunks to the consumer through a bounded queue
+class _ChunkWriter(object):
+    def __init__(
+        self, chunk_queue: queue.Queue, stop_event: threading.Event, chunk_size: int
+    ) -> None:
+        self._queue = chunk_queue
+        self._stop_event = stop_event
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+
+    def put(self, item: object):
+        while True:
+            if self._stop_event.is_set():
+                raise _ZipStreamClosed
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data: bytes) -> int:
+        self._buf += data
+        if len(self._buf) >= self._chunk_size:
+            self.put(bytes(self._buf))
+            self._buf.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if len(self._buf) > 0:
+            self.put(bytes(self._buf))
+            self._buf.clear()
+
+
+def _zip_dir(dirname: str, fileobj: BinaryIO):
+    with zipfile.ZipFile(fileobj, mode="w") as zf:
+        for root, dirs, files in os.walk(dirname):
+            dirs.sort()
+            files.sort()
+            for name in dirs:
+                path = os.path.join(root, name)
+                zf.write(path, os.path.relpath(path, dirname))
+            for name in files:
+                path = os.path.join(root, name)
+                if name.lower().endswith(STORED_SUFFIXES):
+                    compress_type = zipfile.ZIP_STORED
+                else:
+                    compress_type = zipfile.ZIP_DEFLATED
+                zf.write(
+                    path,
+                    os.path.relpath(path, dirname),
+                    compress_type=compress_type,
+                )
+
+
+def _write_zip(dirname: str, writer: _ChunkWriter):
+    try:
+        _zip_dir(dirname, writer)  # type: ignore
+        writer.close()
+        writer.put(_EOF)
+    except _ZipStreamClosed:
+        pass
+    except BaseException as e:
+        try:
+            writer.put(e)
+        except _ZipStreamClosed:
+            pass
+
+
+# Zip the directory while the archive is being consumed
+# No temporary file is written, and memory usage is bounded by the queue size
+async def zip_dir_stream(
+    dirname: str, chunk_size: int = FILE_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    chunk_queue: queue.Queue = queue.Queue(maxsize=ZIP_STREAM_QUEUE_SIZE)
+    stop_event = threading.Event()
+    writer = _ChunkWriter(chunk_queue, stop_event, chunk_size)
+    thread = threading.Thread(target=_write_zip, args=(dirname, writer), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await to_thread.run_sync(chunk_queue.get)
+            if item is _EOF:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+
+
+async def file_stream(
+    filename: str, chunk_size: int = FILE_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    async with await open_file(filename, mode="rb") as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22")
+
+
+# multipart/form-data request body, whose files are async byte streams
+# The body length is unknown, so it is sent with chunked transfer encoding
+class MultipartBody(object):
+    def __init__(
+        self,
+        fields: Dict[str, Union[str, int]],
+        files: List[Tuple[str, str, AsyncIterator[bytes]]],
+        file_sizes: Optional[List[int]] = None,
+    ) -> None:
+        self.fields = fields
+        self.files = files
+        self.file_sizes = file_sizes
+        self.boundary = secrets.token_hex(16)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    # The body length is only known when the sizes of all files are given
+    @property
+    def content_length(self) -> Optional[int]:
+        if self.file_sizes is None:
+            return None
+        size = len(self._end())
+        for name, value in self.fields.items():
+            size += len(self._field(name, value))
+        for (name, filename, _), file_size in zip(self.files, self.file_sizes):
+            size += len(self._file_header(name, filename)) + file_size + 2
+        return size
+
+    def _field(self, name: str, value: Union[str, int]) -> bytes:
+        return (
+            b"--"
+            + self.boundary.encode("ascii")
+            + b"\r\n"
+            + f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode(
+                "utf-8"
+            )
+            + str(value).encode("utf-8")
+            + b"\r\n"
+        )
+
+    def _file_header(self, name: str, filename: str) -> bytes:
+        return (
+            b"--"
+            + self.boundary.encode("ascii")
+            + b"\r\n"
+            + (
+                f'Content-Disposition: form-data; name="{_quote(name)}"; '
+                f'filename="{_quote(filename)}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode("utf-8")
+        )
+
+    def _end(self) -> bytes:
+        return b"--" + self.boundary.encode("ascii") + b"--\r\n"
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for name, value in self.fields.items():
+            yield self._field(name, value)
+        for name, filename, stream in self.files:
+            yield self._file_header(name, filename)
+            async for chunk in stream:
+                yield chunk
+            yield b"\r\n"
+        yield self._end()
+
+
+class _StagedFile(object):
+    def __init__(
+        self,
+        name: str,
+        filename: str,
+        fileobj: BinaryIO,
+        size: int,
+        sha256: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.filename = filename
+        self.fileobj = fileobj
+        self.size = size
+        self.sha256 = sha256
+        # guards the file position for the part reads from multiple threads
+        self.lock = threading.Lock()
+
+    # The file is hashed while it is read, if it is not hashed when staged
+    def _read_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        h = hashlib.sha256() if self.sha256 is None else None
+        size = 0
+        self.fileobj.seek(0)
+        for chunk in iter_fileobj_chunks(self.fileobj, chunk_size, self.size):
+            if h is not None:
+                h.update(chunk)
+            size += len(chunk)
+            # the request body may keep the chunks, so they are copied out of the buffer
+            yield bytes(chunk)
+        if h is not None and size == self.size:
+            self.sha256 = h.hexdigest()
+
+    async def stream(self, chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        chunks = self._read_chunks(chunk_size)
+        remaining = self.size
+        try:
+            while True:
+                chunk = await to_thread.run_sync(next, chunks, None)
+                if chunk is None:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            chunks.close()
+        if remaining > 0:
+            raise ValueError(f"Staged file {self.filename} is truncated")
+
+
+# Task result files prepared for uploading, which are kept open until closed
+# The checkpoint is zipped while the body is sent, unless it is staged for
+# the resumable upload, which needs the archive size and checksum in advance.
+# The files are hashed when staged for the resumable upload, otherwise they
+# are hashed while the body is sent
+class TaskResultPayload(object):
+    def __init__(
+        self, files: List[_StagedFile], checkpoint_dir: Optional[str] = None
+    ) -> None:
+        self._files = files
+        self._checkpoint_dir = checkpoint_dir
+
+    @property
+    def sizes(self) -> List[int]:
+        return [f.size for f in self._files]
+
+    # Checksums of the files hashed so far
+    @property
+    def checksums(self) -> Dict[str, str]:
+        return {f.filename: f.sha256 for f in self._files if f.sha256 is not None}
+
+    # The files of the resumable upload, which must be staged with resumable
+    @property
+    def result_files(self) -> List[TaskResultFile]:
+        assert self._checkpoint_dir is None, "The checkpoint is not staged"
+        result_files = []
+        for f in self._files:
+            assert f.sha256 is not None, f"Staged file {f.filename} is not hashed"
+            result_files.append(
+                TaskResultFile(
+                    name=f.name, filename=f.filename, size=f.size, sha256=f.sha256
+                )
+            )
+        return result_files
+
+    # Read a part of the index-th file, it is safe to call from multiple threads
+    def read_part(self, index: int, offset: int, size: int) -> bytes:
+        f = self._files[index]
+        size = min(size, f.size - offset)
+        # os.pread is not available on windows
+        with f.lock:
+            f.fileobj.seek(offset)
+            data = f.fileobj.read(size)
+        if len(data) != size:
+            raise ValueError(f"Staged file {f.filename} is truncated")
+        return data
+
+    # The body length is unknown when the checkpoint is zipped on the fly
+    def body(self, fields: Dict[str, Union[str, int]]) -> MultipartBody:
+        files = [(f.name, f.filename, f.stream()) for f in self._files]
+        file_sizes: Optional[List[int]] = self.sizes
+        if self._checkpoint_dir is not None:
+            files.append(
+                ("checkpoint", "checkpoint.zip", zip_dir_stream(self._checkpoint_dir))
+            )
+            file_sizes = None
+        return MultipartBody(fields=fields, files=files, file_sizes=file_sizes)
+
+    def close(self):
+        for f in self._files:
+            f.fileobj.close()
+        self._files = []
+
+
+def _stage_file(
+    name: str, filename: str, fileobj: BinaryIO, hash_file: bool
+) -> _StagedFile:
+    if not hash_file:
+        size = os.fstat(fileobj.fileno()).st_size
+        return _StagedFile(name=name, filename=filename, fileobj=fileobj, size=size)
+
+    fileobj.seek(0)
+    h = hashlib.sha256()
+    size = 0
+    for chunk in iter_fileobj_chunks(fileobj):
+        h.update(chunk)
+        size += len(chunk)
+    return _StagedFile(
+        name=name, filename=filename, fileobj=fileobj, size=size, sha256=h.hexdigest()
+    )
+
+
+def _stage_task_result(
+    file_paths: List[str], checkpoint_dir: Optional[str], resumable: bool
+) -> TaskResultPayload:
+    files: List[_StagedFile] = []
+    try:
+        for file_path in file_paths:
+            fileobj = open(file_path, mode="rb")
+            try:
+                files.append(
+                    _stage_file(
+                        "files", os.path.basename(file_path), fileobj, resumable
+                    )
+                )
+            except BaseException:
+                fileobj.close()
+                raise
+        if checkpoint_dir is not None and resumable:
+            fileobj = tempfile.TemporaryFile()
+            try:
+                _zip_dir(checkpoint_dir, fileobj)  # type: ignore
+                files.append(_stage_file("checkpoint", "checkpoint.zip", fileobj, True))  # type: ignore
+            except BaseException:
+                fileobj.close()
+                raise
+    except BaseException:
+        for f in files:
+            f.fileobj.close()
+        raise
+    if resumable:
+        checkpoint_dir = None
+    return TaskResultPayload(files, checkpoint_dir)
+
+
+# Open the result files before the upload is required
+# Only for the resumable upload, the checkpoint is zipped into a temporary
+# file and the files are hashed now, because the relay needs their sizes and
+# checksums before the parts. Otherwise the checkpoint is zipped and the
+# files are hashed while uploading, so each file is read once.
+async def stage_task_result(
+    file_paths: List[str],
+    checkpoint_dir: Optional[str] = None,
+    resumable: bool = False,
+) -> TaskResultPayload:
+    return await to_thread.run_sync(
+        _stage_task_result, file_paths, checkpoint_dir, resumable
+    )
+
+
+_LOCAL_FILE_HEADER_SIG = b"PK\x03\x04"
+_CENTRAL_DIR_SIG = b"PK\x01\x02"
+_DATA_DESCRIPTOR_SIG = b"PK\x07\x08"
+_LOCAL_FILE_HEADER = struct.Struct("<4sHHHHHLLLHH")
+_CENTRAL_DIR_HEADER = struct.Struct("<4sHHHHHHLLLHHHHHLL")
+_ZIP64_LIMIT = 0xFFFFFFFF
+
+_FLAG_ENCRYPTED = 0x1
+_FLAG_DATA_DESCRIPTOR = 0x8
+_FLAG_UTF8 = 0x800
+
+# Number of downloaded chunks buffered before the extractor
+UNZIP_STREAM_QUEUE_SIZE = 8
+
+
+class _ZipEntry(object):
+    def __init__(
+        self,
+        name: str,
+        flags: int,
+        method: int,
+        crc: int,
+        compress_size: int,
+        file_size: int,
+        zip64: bool,
+    ) -> None:
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.zip64 = zip64
+
+        self.file: Optional[BinaryIO] = None
+        self.decompressor = None
+        if method == zipfile.ZIP_DEFLATED:
+            self.decompressor = zlib.decompressobj(-15)
+
+        # compressed bytes consumed and uncompressed bytes written
+        self.read_size = 0
+        self.write_size = 0
+        self.write_crc = 0
+        # the compressed data is consumed, waiting for the data descriptor
+        self.data_done = False
+
+    @property
+    def has_data_descriptor(self) -> bool:
+        return (self.flags & _FLAG_DATA_DESCRIPTOR) != 0
+
+    def write(self, data: bytes):
+        self.read_size += len(data)
+        if self.decompressor is not None:
+            try:
+                data = self.decompressor.decompress(data)
+            except zlib.error as e:
+                raise zipfile.BadZipFile(f"Bad deflated data of zip entry {self.name}") from e
+        if len(data) > 0:
+            self.write_crc = zlib.crc32(data, self.write_crc)
+            self.write_size += len(data)
+            if self.file is not None:
+                self.file.write(data)
+
+
+def _parse_zip64_extra(extra: bytes) -> Optional[Tuple[int, int]]:
+    i = 0
+    while i + 4 <= len(extra):
+        tag, size = struct.unpack_from("<HH", extra, i)
+        if tag == 1 and size >= 16:
+            file_size, compress_size = struct.unpack_from("<QQ", extra, i + 4)
+            return file_size, compress_size
+        i += 4 + size
+    return None
+
+
+# Extract a zip archive while its bytes arrive
+# Entries are written to dst_dir as soon as their data is received,
+# and the crc of every entry is checked against the central directory at the end
+class StreamingUnzipper(object):
+    def __init__(self, dst_dir: str) -> None:
+        self.dst_dir = os.path.abspath(dst_dir)
+        os.makedirs(self.dst_dir, exist_ok=True)
+
+        self._buf = bytearray()
+        self._entry: Optional[_ZipEntry] = None
+        self._entries: Dict[str, int] = {}
+        self._central_dir: Optional[bytearray] = None
+
+    def _entry_path(self, name: str) -> str:
+        parts = [part for part in name.replace("\\", "/").split("/") if part != ""]
+        if (
+            name.startswith(("/", "\\"))
+            or any(part == ".." for part in parts)
+            or (len(parts) > 0 and ":" in parts[0])
+        ):
+            raise zipfile.BadZipFile(f"Unsafe zip entry name {name}")
+        return os.path.join(self.dst_dir, *parts)
+
+    def _read_local_header(self) -> bool:
+        if len(self._buf) < _LOCAL_FILE_HEADER.size:
+            return False
+        (
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compress_size,
+            file_size,
+            name_len,
+            extra_len,
+        ) = _LOCAL_FILE_HEADER.unpack_from(self._buf)
+        header_size = _LOCAL_FILE_HEADER.size + name_len + extra_len
+        if len(self._buf) < header_size:
+            return False
+
+        raw_name = bytes(self._buf[_LOCAL_FILE_HEADER.size : _LOCAL_FILE_HEADER.size + name_len])
+        name = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        extra = bytes(self._buf[_LOCAL_FILE_HEADER.size + name_len : header_size])
+        del self._buf[:header_size]
+
+        if flags & _FLAG_ENCRYPTED:
+            raise zipfile.BadZipFile(f"Encrypted zip entry {name} is not supported")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise zipfile.BadZipFile(
+                f"Compression method {method} of zip entry {name} is not supported"
+            )
+
+        zip64_sizes = _parse_zip64_extra(extra)
+        if zip64_sizes is not None:
+            if file_size == _ZIP64_LIMIT:
+                file_size = zip64_sizes[0]
+            if compress_size == _ZIP64_LIMIT:
+                compress_size = zip64_sizes[1]
+
+        entry = _ZipEntry(
+            name=name,
+            flags=flags,
+            method=method,
+            crc=crc,
+            compress_size=compress_size,
+            file_size=file_size,
+            zip64=zip64_sizes is not None,
+        )
+        path = self._entry_path(name)
+        if name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            entry.file = open(path, mode="wb")
+        self._entry = entry
+        return True
+
+    def _finish_entry(self, crc: int, file_size: int):
+        entry = self._entry
+        assert entry is not None
+        if entry.file is not None:
+            entry.file.close()
+            entry.file = None
+        if entry.write_crc != crc or entry.write_size != file_size:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for zip entry {entry.name}")
+        self._entries[entry.name] = crc
+        self._entry = None
+
+    def _read_sized_data(self) -> bool:
+        entry = self._entry
+        assert entry is not None
+        size = min(entry.compress_size - entry.read_size, len(self._buf))
+        if size > 0:
+            entry.write(bytes(self._buf[:size]))
+            del self._buf[:size]
+        if entry.read_size < entry.compress_size:
+            return False
+        if entry.decompressor is not None:
+            tail = entry.decompressor.flush()
+            if len(tail) > 0:
+                entry.write_crc = zlib.crc32(tail, entry.write_crc)
+                entry.write_size += len(tail)
+                if entry.file is not None:
+                    entry.file.write(tail)
+        self._finish_entry(entry.crc, entry.file_size)
+        return True
+
+    def _read_deflated_data(self) -> bool:
+        entry = self._entry
+        assert entry is not None and entry.decompressor is not None
+        if len(self._buf) == 0:
+            return False
+        data = bytes(self._buf)
+        self._buf.clear()
+        entry.write(data)
+        if entry.decompressor.eof:
+            unused = entry.decompressor.unused_data
+            entry.read_size -= len(unused)
+            self._buf[:0] = unused
+            entry.data_done = True
+            return True
+        return False
+
+    def _descriptor_size(self, entry: _ZipEntry, size: int) -> int:
+        if entry.zip64 or size >= _ZIP64_LIMIT:
+            return 20
+        return 12
+
+    def _read_data_descriptor(self) -> bool:
+        entry = self._entry
+        assert entry is not None
+        offset = 0
+        if self._buf[:4] == _DATA_DESCRIPTOR_SIG:
+            offset = 4
+        elif len(self._buf) < 4:
+            return False
+        size = offset + self._descriptor_size(
+            entry, max(entry.read_size, entry.write_size)
+        )
+        if len(self._buf) < size:
+            return False
+        if size - offset == 20:
+            crc, compress_size, file_size = struct.unpack_from("<LQQ", self._buf, offset)
+        else:
+            crc, compress_size, file_size = struct.unpack_from("<LLL", self._buf, offset)
+        del self._buf[:size]
+        if compress_size != entry.read_size:
+            raise zipfile.BadZipFile(f"Bad compressed size for zip entry {entry.name}")
+        self._finish_entry(crc, file_size)
+        return True
+
+    # Stored data of unknown size ends at the data descriptor,
+    # whose crc and sizes must match the data before it
+    def _read_stored_data(self) -> bool:
+        entry = self._entry
+        assert entry is not None
+        start = 0
+        while True:
+            pos = self._buf.find(_DATA_DESCRIPTOR_SIG, start)
+            if pos < 0:
+                size = max(len(self._buf) - len(_DATA_DESCRIPTOR_SIG) + 1, 0)
+                entry.write(bytes(self._buf[:size]))
+                del self._buf[:size]
+                return False
+
+            data_size = entry.write_size + pos
+            descriptor_size = self._descriptor_size(entry, data_size)
+            if len(self._buf) < pos + 4 + descriptor_size:
+                entry.write(bytes(self._buf[:pos]))
+                del self._buf[:pos]
+                return False
+
+            if descriptor_size == 20:
+                crc, compress_size, file_size = struct.unpack_from(
+                    "<LQQ", self._buf, pos + 4
+                )
+            else:
+                crc, compress_size, file_size = struct.unpack_from(
+                    "<LLL", self._buf, pos + 4
+                )
+            if (
+                compress_size == data_size
+                and file_size == data_size
+                and crc == zlib.crc32(self._buf[:pos], entry.write_crc)
+            ):
+                entry.write(bytes(self._buf[:pos]))
+                del self._buf[: pos + 4 + descriptor_size]
+                self._finish_entry(crc, file_size)
+                return True
+            start = pos + 1
+
+    def _step(self) -> bool:
+        if self._entry is None:
+            if len(self._buf) < 4:
+                return False
+            sig = bytes(self._buf[:4])
+            if sig == _CENTRAL_DIR_SIG:
+                self._central_dir = self._buf
+                self._buf = bytearray()
+                return False
+            if sig != _LOCAL_FILE_HEADER_SIG:
+                raise zipfile.BadZipFile("Bad magic number for zip local file header")
+            return self._read_local_header()
+
+        entry = self._entry
+        if not entry.has_data_descriptor:
+            return self._read_sized_data()
+        if entry.data_done:
+            return self._read_data_descriptor()
+        if entry.decompressor is not None:
+            return self._read_deflated_data()
+        return self._read_stored_data()
+
+    def feed(self, data: bytes):
+        if self._central_dir is not None:
+            self._central_dir += data
+            return
+        self._buf += data
+        while self._step():
+            pass
+
+    # Check the extracted entries against the central directory
+    def close(self):
+        if self._entry is not None or self._central_dir is None:
+            self.abort()
+            raise zipfile.BadZipFile("Zip archive is truncated")
+
+        central_entries: Dict[str, int] = {}
+        buf = self._central_dir
+        offset = 0
+        while buf[offset : offset + 4] == _CENTRAL_DIR_SIG:
+            if len(buf) < offset + _CENTRAL_DIR_HEADER.size:
+                raise zipfile.BadZipFile("Zip central directory is truncated")
+            header = _CENTRAL_DIR_HEADER.unpack_from(buf, offset)
+            flags, crc = header[3], header[7]
+            name_len, extra_len, comment_len = header[10], header[11], header[12]
+            name_start = offset + _CENTRAL_DIR_HEADER.size
+            raw_name = bytes(buf[name_start : name_start + name_len])
+            name = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+            central_entries[name] = crc
+            offset = name_start + name_len + extra_len + comment_len
+
+        if central_entries != self._entries:
+            raise zipfile.BadZipFile(
+                "Extracted zip entries do not match the central directory"
+            )
+
+    def abort(self):
+        if self._entry is not None and self._entry.file is not None:
+            self._entry.file.close()
+            self._entry.file = None
+
+
+# Extract the zip archive to dst_dir while it is being downloaded
+async def unzip_stream(chunks: AsyncIterator[bytes], dst_dir: str):
+    unzipper = await to_thread.run_sync(StreamingUnzipper, dst_dir)
+    send_stream, receive_stream = create_memory_object_stream(
+        UNZIP_STREAM_QUEUE_SIZE, item_type=bytes
+    )
+
+    async def _extract():
+        async with receive_stream:
+            async for chunk in receive_stream:
+                await to_thread.run_sync(unzipper.feed, chunk)
+        await to_thread.run_sync(unzipper.close)
+
+    try:
+        async with create_task_group() as tg:
+            tg.start_soon(_extract)
+            async with send_stream:
+                async for chunk in chunks:
+                    await send_stream.send(chunk)
+    except BaseException:
+        unzipper.abort()
+        raise
@@ -0,0 +1,76 @@
+import logging
+from typing import List, Tuple
+
+from anyio import CapacityLimiter, create_task_group, to_thread
+from tenacity import (before_sleep_log, retry, stop_after_attempt,
+                      wait_exponential)
+
+from .abc import Relay
+from .exceptions import RelayError
+from .streaming import TaskResultPayload
+
+__all__ = [
+    "RESULT_UPLOAD_PART_SIZE",
+    "RESULT_UPLOAD_CONCURRENCY",
+    "RESULT_UPLOAD_PART_ATTEMPTS",
+    "upload_task_result_resumable",
+]
+
+_logger = logging.getLogger(__name__)
+
+
+RESULT_UPLOAD_PART_SIZE = 8 * 1024 * 1024
+RESULT_UPLOAD_CONCURRENCY = 4
+RESULT_UPLOAD_PART_ATTEMPTS = 5
+
+
+# Upload the staged task result in parts
+# Parts are sent concurrently and a failed part is retried alone.
+# When the whole upload fails, calling it again only sends the parts
+# which the relay has not received yet.
+async def upload_task_result_resumable(
+    relay: Relay,
+    task_id_commitment: bytes,
+    payload: TaskResultPayload,
+    part_size: int = RESULT_UPLOAD_PART_SIZE,
+    concurrency: int = RESULT_UPLOAD_CONCURRENCY,
+    part_attempts: int = RESULT_UPLOAD_PART_ATTEMPTS,
+):
+    result_files = payload.result_files
+    received = await relay.start_task_result_upload(task_id_commitment, result_files)
+    if len(received) != len(result_files):
+        raise RelayError(
+            500,
+            "startTaskResultUpload",
+            f"Received sizes of {len(received)} files are returned for {len(result_files)} result files",
+        )
+
+    parts: List[Tuple[int, int]] = []
+    for index, (result_file, received_size) in enumerate(zip(result_files, received)):
+        for offset in range(received_size, result_file.size, part_size):
+            parts.append((index, offset))
+    _logger.info(
+        f"Task {task_id_commitment.hex()} uploads {len(parts)} result parts, "
+        f"{sum(received)} bytes are already received"
+    )
+
+    limiter = CapacityLimiter(concurrency)
+
+    @retry(
+        stop=stop_after_attempt(part_attempts),
+        wait=wait_exponential(multiplier=1, max=30),
+        before_sleep=before_sleep_log(_logger, logging.WARNING),
+        reraise=True,
+    )
+    async def upload_part(index: int, offset: int):
+        async with limiter:
+            data = await to_thread.run_sync(
+                payload.read_part, index, offset, part_size
+            )
+            await relay.upload_task_result_part(task_id_commitment, index, offset, data)
+
+    async with create_task_group() as tg:
+        for index, offset in parts:
+            tg.start_soon(upload_part, index, offset)
+
+    await relay.complete_task_result_upload(task_id_commitment)
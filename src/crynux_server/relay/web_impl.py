@@ -1,27 +1,33 @@
 from inspect import signature
 import json
+import logging
 import os
-import shutil
-import tempfile
-from contextlib import ExitStack
 from datetime import datetime
-from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Protocol
+from typing import (Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, List,
+                    Optional, Protocol)
 from functools import wraps
 
 import httpx
-from anyio import open_file, to_thread, wrap_file
+from anyio import wrap_file
 from hexbytes import HexBytes
 from web3 import Web3
 
+from crynux_server.config import RelayPoolConfig
 from crynux_server.models import (Event, EventType, TaskAbortReason, TaskError,
-                                  load_event)
+                                  TaskResultFile, load_event)
 from crynux_server.models.node import ChainNodeStatus, NodeInfo
 from crynux_server.models.task import RelayTask
-from crynux_server.utils import get_address_from_privkey
+from crynux_server.utils import FILE_CHUNK_SIZE, get_address_from_privkey
 
 from .abc import Relay
+from .coalesce import CoalesceStats, RequestCoalescer
 from .exceptions import RelayError
+from .pool import create_control_client, create_upload_client
 from .sign import Signer
+from .streaming import (MultipartBody, TaskResultPayload, file_stream,
+                        unzip_stream, zip_dir_stream)
+
+_logger = logging.getLogger(__name__)
 
 
 def _process_resp(resp: httpx.Response, method: str):
@@ -57,17 +63,102 @@ def _web_relay_restart_pool_error(func):
     return wrapper
 
 
+# Seconds the results of the polled relay resources are shared between callers
+RELAY_TASK_TTL = 1
+RELAY_NODE_TTL = 2
+
+# Seconds the event stream can be silent before it is taken as broken
+# The relay sends a keep alive comment to an idle stream well within it
+RELAY_EVENT_STREAM_READ_TIMEOUT = 60
+
+
+def _call_key(sig, args, kwargs):
+    bound = sig.bind(None, *args, **kwargs)
+    bound.apply_defaults()
+    return tuple(bound.arguments.values())[1:]
+
+
+# Concurrent identical calls of the idempotent method share one request,
+# and the result is reused for ttl seconds
+def _web_relay_coalesce(ttl: float):
+    def decorator(func):
+        sig = signature(func)
+
+        @wraps(func)
+        async def wrapper(self: 'WebRelay', *args: Any, **kwargs: Any) -> Any:
+            key = _call_key(sig, args, kwargs)
+            return await self.coalescer.call(
+                func.__name__, key, lambda: func(self, *args, **kwargs), ttl=ttl
+            )
+
+        return wrapper
+
+    return decorator
+
+
+# Drop the cached results of the methods changed by the call,
+# keyed by the key_arg argument of the call or all of them
+def _web_relay_invalidate(*methods: str, key_arg: Optional[str] = None):
+    def decorator(func):
+        sig = signature(func)
+
+        @wraps(func)
+        async def wrapper(self: 'WebRelay', *args: Any, **kwargs: Any) -> Any:
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                key = None
+                if key_arg is not None:
+                    bound = sig.bind(self, *args, **kwargs)
+                    key = (bound.arguments[key_arg],)
+                for method in methods:
+                    self.coalescer.invalidate(method, key)
+
+        return wrapper
+
+    return decorator
+
+
 class WebRelay(Relay):
-    def __init__(self, base_url: str, privkey: str) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        privkey: str,
+        pool_config: Optional[RelayPoolConfig] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
         super().__init__()
         self.base_url = base_url
-        self.client = httpx.AsyncClient(base_url=base_url, timeout=30)
+        if pool_config is None:
+            pool_config = RelayPoolConfig()
+        self.pool_config = pool_config
+        self._transport = transport
+        # small control calls and large task result transfers use separate pools,
+        # so that a slow upload never holds the connections of the control calls
+        self.client = create_control_client(base_url, pool_config, transport)
+        self.upload_client = create_upload_client(base_url, pool_config, transport)
         self.signer = Signer(privkey=privkey)
         self._node_address = get_address_from_privkey(privkey)
+        self.coalescer = RequestCoalescer()
+        # set to False once the relay is found without the event stream
+        self.supports_event_push = True
 
+    # Rebuild the clients after a pool timeout, which drops the connections
+    # left busy by the responses never closed, and the in-flight requests
     async def restart_client(self):
         await self.client.aclose()
-        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=30)
+        self.client = create_control_client(
+            self.base_url, self.pool_config, self._transport
+        )
+        await self.upload_client.aclose()
+        self.upload_client = create_upload_client(
+            self.base_url, self.pool_config, self._transport
+        )
+        _logger.warning("Relay pool timeout, restart the relay clients")
+
+    # Hit and miss counters of the coalesced methods
+    def coalesce_stats(self) -> Dict[str, CoalesceStats]:
+        return self.coalescer.stats()
 
     @property
     def node_address(self):
@@ -75,6 +166,7 @@ class WebRelay(Relay):
 
     """ task related """
 
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
     @_web_relay_restart_pool_error
     async def create_task(
         self,
@@ -91,22 +183,16 @@ class WebRelay(Relay):
         input.update({"timestamp": timestamp, "signature": signature})
 
         if checkpoint_dir is not None:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                checkpoint_file = os.path.join(tmp_dir, "checkpoint.zip")
-                await to_thread.run_sync(
-                    shutil.make_archive, checkpoint_file[:-4], "zip", checkpoint_dir
-                )
-            with ExitStack() as stack:
-                filename = os.path.basename(checkpoint_file)
-                file_obj = stack.enter_context(open(checkpoint_file, "rb"))
-                files = [("checkpoint", (filename, file_obj))]
-
-                resp = await self.client.post(
-                    f"/v1/inference_tasks/{task_id_commitment_hex}",
-                    data=input,
-                    files=files,
-                    timeout=None,
-                )
+            body = MultipartBody(
+                fields=input,
+                files=[("checkpoint", "checkpoint.zip", zip_dir_stream(checkpoint_dir))],
+            )
+            resp = await self.upload_client.post(
+                f"/v1/inference_tasks/{task_id_commitment_hex}",
+                content=body,
+                headers={"Content-Type": body.content_type},
+                timeout=None,
+            )
         else:
             resp = await self.client.post(
                 f"/v1/inference_tasks/{task_id_commitment_hex}", data=input
@@ -124,21 +210,20 @@ class WebRelay(Relay):
         input = {"task_id_commitment": task_id_commitment_hex}
         timestamp, signature = self.signer.sign(input)
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            checkpoint_file = os.path.join(tmp_dir, "checkpoint.zip")
-            async with await open_file(checkpoint_file, mode="wb") as f:
-                resp = await self.client.get(
-                    f"/v1/inference_tasks/{task_id_commitment_hex}/checkpoint",
-                    params={"timestamp": timestamp, "signature": signature},
-                )
-                resp = _process_resp(resp, "getCheckpoint")
-                async for chunk in resp.aiter_bytes(4096):
-                    await f.write(chunk)
-
-            await to_thread.run_sync(
-                shutil.unpack_archive, checkpoint_file, result_checkpoint_dir
+        # the archive is extracted while it is being downloaded
+        async with self.upload_client.stream(
+            "GET",
+            f"/v1/inference_tasks/{task_id_commitment_hex}/checkpoint",
+            params={"timestamp": timestamp, "signature": signature},
+        ) as resp:
+            if resp.is_error:
+                await resp.aread()
+            resp = _process_resp(resp, "getCheckpoint")
+            await unzip_stream(
+                resp.aiter_bytes(FILE_CHUNK_SIZE), result_checkpoint_dir
             )
 
+    @_web_relay_coalesce(RELAY_TASK_TTL)
     @_web_relay_restart_pool_error
     async def get_task(self, task_id_commitment: bytes) -> RelayTask:
         task_id_commitment_hex = HexBytes(task_id_commitment).hex()
@@ -154,6 +239,7 @@ class WebRelay(Relay):
         data = content["data"]
         return RelayTask.model_validate(data)
 
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
     @_web_relay_restart_pool_error
     async def report_task_error(self, task_id_commitment: bytes, task_error: TaskError):
         task_id_commitment_hex = HexBytes(task_id_commitment).hex()
@@ -170,6 +256,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "reportTaskError")
 
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
     @_web_relay_restart_pool_error
     async def submit_task_score(self, task_id_commitment: bytes, score: bytes):
         task_id_commitment_hex = HexBytes(task_id_commitment).hex()
@@ -183,6 +270,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "submitTaskScore")
 
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
     @_web_relay_restart_pool_error
     async def abort_task(
         self, task_id_commitment: bytes, abort_reason: TaskAbortReason
@@ -204,46 +292,101 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "abortTask")
 
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
     @_web_relay_restart_pool_error
     async def upload_task_result(
         self,
         task_id_commitment: bytes,
         file_paths: List[str],
         checkpoint_dir: Optional[str] = None,
+        payload: Optional[TaskResultPayload] = None,
     ):
         task_id_commitment_hex = HexBytes(task_id_commitment).hex()
         input = {"task_id_commitment": task_id_commitment_hex}
         timestamp, signature = self.signer.sign(input)
 
-        with ExitStack() as stack:
-            files = []
-            for file_path in file_paths:
-                filename = os.path.basename(file_path)
-                file_obj = stack.enter_context(open(file_path, "rb"))
-                files.append(("files", (filename, file_obj)))
-
+        fields = {"timestamp": timestamp, "signature": signature}
+        if payload is not None:
+            body = payload.body(fields)
+        else:
+            files = [
+                ("files", os.path.basename(file_path), file_stream(file_path))
+                for file_path in file_paths
+            ]
             if checkpoint_dir is not None:
-                tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
-                checkpoint_file = os.path.join(tmp_dir, "checkpoint.zip")
-                await to_thread.run_sync(
-                    shutil.make_archive, checkpoint_file[:-4], "zip", checkpoint_dir
+                files.append(
+                    ("checkpoint", "checkpoint.zip", zip_dir_stream(checkpoint_dir))
                 )
-                filename = os.path.basename(checkpoint_file)
-                file_obj = stack.enter_context(open(checkpoint_file, "rb"))
-                files.append(("checkpoint", (filename, file_obj)))
+            body = MultipartBody(fields=fields, files=files)
+
+        headers = {"Content-Type": body.content_type}
+        content_length = body.content_length
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        # disable timeout because there may be many images or image size may be very large
+        resp = await self.upload_client.post(
+            f"/v1/inference_tasks/{task_id_commitment_hex}/results",
+            content=body,
+            headers=headers,
+            timeout=None,
+        )
+        resp = _process_resp(resp, "uploadTaskResult")
+        content = resp.json()
+        message = content["message"]
+        if message != "success":
+            raise RelayError(resp.status_code, "uploadTaskResult", message)
 
-            # disable timeout because there may be many images or image size may be very large
-            resp = await self.client.post(
-                f"/v1/inference_tasks/{task_id_commitment_hex}/results",
-                data={"timestamp": timestamp, "signature": signature},
-                files=files,
-                timeout=None,
-            )
-            resp = _process_resp(resp, "uploadTaskResult")
-            content = resp.json()
-            message = content["message"]
-            if message != "success":
-                raise RelayError(resp.status_code, "uploadTaskResult", message)
+    @_web_relay_restart_pool_error
+    async def start_task_result_upload(
+        self, task_id_commitment: bytes, files: List[TaskResultFile]
+    ) -> List[int]:
+        task_id_commitment_hex = HexBytes(task_id_commitment).hex()
+        files_input = [f.model_dump() for f in files]
+        input = {"task_id_commitment": task_id_commitment_hex, "files": files_input}
+        timestamp, signature = self.signer.sign(input)
+
+        resp = await self.client.post(
+            f"/v1/inference_tasks/{task_id_commitment_hex}/results/uploads",
+            json={"files": files_input, "timestamp": timestamp, "signature": signature},
+        )
+        resp = _process_resp(resp, "startTaskResultUpload")
+        content = resp.json()
+        data = content["data"]
+        return [int(size) for size in data["received"]]
+
+    @_web_relay_restart_pool_error
+    async def upload_task_result_part(
+        self, task_id_commitment: bytes, index: int, offset: int, data: bytes
+    ):
+        task_id_commitment_hex = HexBytes(task_id_commitment).hex()
+        input = {
+            "task_id_commitment": task_id_commitment_hex,
+            "index": str(index),
+            "offset": str(offset),
+        }
+        timestamp, signature = self.signer.sign(input)
+
+        resp = await self.upload_client.put(
+            f"/v1/inference_tasks/{task_id_commitment_hex}/results/uploads/{index}",
+            params={"offset": offset, "timestamp": timestamp, "signature": signature},
+            content=data,
+            headers={"Content-Type": "application/octet-stream"},
+            timeout=None,
+        )
+        resp = _process_resp(resp, "uploadTaskResultPart")
+
+    @_web_relay_invalidate("get_task", key_arg="task_id_commitment")
+    @_web_relay_restart_pool_error
+    async def complete_task_result_upload(self, task_id_commitment: bytes):
+        task_id_commitment_hex = HexBytes(task_id_commitment).hex()
+        input = {"task_id_commitment": task_id_commitment_hex}
+        timestamp, signature = self.signer.sign(input)
+
+        resp = await self.client.post(
+            f"/v1/inference_tasks/{task_id_commitment_hex}/results/uploads/complete",
+            json={"timestamp": timestamp, "signature": signature},
+        )
+        resp = _process_resp(resp, "completeTaskResultUpload")
 
     @_web_relay_restart_pool_error
     async def get_result(self, task_id_commitment: bytes, index: int, dst: BinaryIO):
@@ -253,7 +396,7 @@ class WebRelay(Relay):
 
         async_dst = wrap_file(dst)
 
-        async with self.client.stream(
+        async with self.upload_client.stream(
             "GET",
             f"/v1/inference_tasks/{task_id_commitment_hex}/results/{index}",
             params={"timestamp": timestamp, "signature": signature},
@@ -270,19 +413,17 @@ class WebRelay(Relay):
         input = {"task_id_commitment": task_id_commitment_hex}
         timestamp, signature = self.signer.sign(input)
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            checkpoint_file = os.path.join(tmp_dir, "checkpoint.zip")
-            async with await open_file(checkpoint_file, mode="wb") as f:
-                resp = await self.client.get(
-                    f"/v1/inference_tasks/{task_id_commitment_hex}/results/checkpoint",
-                    params={"timestamp": timestamp, "signature": signature},
-                )
-                resp = _process_resp(resp, "getResultCheckpoint")
-                async for chunk in resp.aiter_bytes(4096):
-                    await f.write(chunk)
-
-            await to_thread.run_sync(
-                shutil.unpack_archive, checkpoint_file, result_checkpoint_dir
+        # the archive is extracted while it is being downloaded
+        async with self.upload_client.stream(
+            "GET",
+            f"/v1/inference_tasks/{task_id_commitment_hex}/results/checkpoint",
+            params={"timestamp": timestamp, "signature": signature},
+        ) as resp:
+            if resp.is_error:
+                await resp.aread()
+            resp = _process_resp(resp, "getResultCheckpoint")
+            await unzip_stream(
+                resp.aiter_bytes(FILE_CHUNK_SIZE), result_checkpoint_dir
             )
 
     """ auxiliary """
@@ -296,12 +437,13 @@ class WebRelay(Relay):
         now = data["now"]
         return now
 
-    @_web_relay_restart_pool_error
     async def close(self):
         await self.client.aclose()
+        await self.upload_client.aclose()
 
     """ node related """
 
+    @_web_relay_coalesce(RELAY_NODE_TTL)
     @_web_relay_restart_pool_error
     async def node_get_node_info(self) -> NodeInfo:
         input = {"address": self.node_address}
@@ -315,6 +457,7 @@ class WebRelay(Relay):
         data = content["data"]
         return NodeInfo.model_validate(data)
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_join(
         self, network: str, gpu_name: str, gpu_vram: int, model_ids: List[str], version: str, staking_amount: int
@@ -344,6 +487,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "nodeJoin")
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_report_model_downloaded(self, model_id: str):
         input = {"address": self.node_address, "model_id": model_id}
@@ -358,6 +502,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "nodeReportModelDownload")
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_pause(self):
         input = {"address": self.node_address}
@@ -368,6 +513,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "nodePause")
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_quit(self):
         input = {"address": self.node_address}
@@ -378,6 +524,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "nodeQuit")
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_resume(self):
         input = {"address": self.node_address}
@@ -388,6 +535,7 @@ class WebRelay(Relay):
         )
         resp = _process_resp(resp, "nodeResume")
 
+    @_web_relay_coalesce(RELAY_TASK_TTL)
     @_web_relay_restart_pool_error
     async def node_get_current_task(self) -> bytes:
         resp = await self.client.get(
@@ -401,6 +549,7 @@ class WebRelay(Relay):
         )
         return bytes.fromhex(task_id_commitment[2:])
 
+    @_web_relay_invalidate("node_get_node_info", "node_get_current_task")
     @_web_relay_restart_pool_error
     async def node_update_version(self, version: str):
         input = {"address": self.node_address, "version": version}
@@ -413,6 +562,7 @@ class WebRelay(Relay):
 
     """ balance related """
 
+    @_web_relay_coalesce(RELAY_NODE_TTL)
     @_web_relay_restart_pool_error
     async def get_balance(self, address: Optional[str] = None) -> int:
         if address is None:
@@ -425,6 +575,7 @@ class WebRelay(Relay):
         balance = content["data"]
         return Web3.to_wei(balance, "wei")
     
+    @_web_relay_coalesce(RELAY_NODE_TTL)
     @_web_relay_restart_pool_error
     async def get_staking_amount(self) -> int:
         resp = await self.client.get(
@@ -435,6 +586,7 @@ class WebRelay(Relay):
         staking_amount = content["data"]
         return Web3.to_wei(staking_amount, "wei")
 
+    @_web_relay_invalidate("get_balance")
     @_web_relay_restart_pool_error
     async def transfer(self, amount: int, to_addr: str):
         input = {"from": self.node_address, "value": str(amount), "to": to_addr}
@@ -502,4 +654,56 @@ class WebRelay(Relay):
         content = resp.json()
         data = content["data"]
 
-        return data
\ No newline at end of file
+        return data
+
+    # Events pushed by the relay as server-sent events, one event json in each data field
+    # The stream ends at once if the relay does not push events
+    async def subscribe_events(
+        self,
+        start_id: int,
+        node_address: Optional[str] = None,
+    ) -> AsyncIterator[Event]:
+        input: Dict[str, Any] = {"start": start_id}
+        if node_address is not None:
+            input["node_address"] = node_address
+
+        # the stream is idle until an event happens, but the keep alive comments
+        # of the relay arrive within the read timeout on a live connection
+        timeout = httpx.Timeout(
+            self.pool_config.timeout,
+            read=RELAY_EVENT_STREAM_READ_TIMEOUT,
+            pool=self.pool_config.pool_timeout,
+        )
+        # the generator is not wrapped by _web_relay_restart_pool_error,
+        # so the pool timeout is handled here
+        try:
+            async with self.client.stream(
+                "GET",
+                "/v1/events/stream",
+                params=input,
+                headers={"Accept": "text/event-stream"},
+                timeout=timeout,
+            ) as resp:
+                if resp.status_code in (404, 405, 501):
+                    self.supports_event_push = False
+                    return
+                if resp.is_error:
+                    await resp.aread()
+                resp = _process_resp(resp, "subscribeEvents")
+
+                data_lines: List[str] = []
+                try:
+                    async for line in resp.aiter_lines():
+                        if line.startswith("data:"):
+                            data_lines.append(line[5:].lstrip(" "))
+                        elif line == "" and len(data_lines) > 0:
+                            e = json.loads("\n".join(data_lines))
+                            data_lines = []
+                            yield load_event(e["id"], e["type"], e["args"])
+                except httpx.ReadTimeout as e:
+                    raise RelayError(
+                        408, "subscribeEvents", "The event stream is silent for too long"
+                    ) from e
+        except httpx.PoolTimeout:
+            await self.restart_client()
+            raise
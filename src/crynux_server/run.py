@@ -18,8 +18,9 @@ from anyio.abc import TaskGroup, TaskStatus
 from crynux_server import db, log, utils
 from crynux_server.config import get_config, with_proxy
 from crynux_server.node_manager import NodeManager, set_node_manager
-from crynux_server.server import Server, set_server
+from crynux_server.server import Server, WorkerServer, set_server
 from crynux_server.worker_manager import WorkerManager, set_worker_manager
+from crynux_server.worker_manager.utils import get_worker_socket
 
 _logger = logging.getLogger(__name__)
 
@@ -36,6 +37,7 @@ class CrynuxRunner(object):
         _logger.debug("Logger init completed.")
 
         self._server: Optional[Server] = None
+        self._worker_server: Optional[WorkerServer] = None
         self._node_manager: Optional[NodeManager] = None
         self._tg: Optional[TaskGroup] = None
 
@@ -86,6 +88,10 @@ class CrynuxRunner(object):
             set_server(self._server)
             _logger.info("Web server init completed.")
 
+            worker_socket = get_worker_socket(self.config)
+            if worker_socket is not None:
+                self._worker_server = WorkerServer()
+
             gpu_info = await utils.get_gpu_info()
             gpu_name = gpu_info.model
             gpu_vram_gb = math.ceil(gpu_info.vram_total_mb / 1024)
@@ -117,6 +123,10 @@ class CrynuxRunner(object):
                         self.config.log.level == "DEBUG",
                     )
                     _logger.info("Crynux server started.")
+                    if self._worker_server is not None:
+                        assert worker_socket is not None
+                        await tg.start(self._worker_server.start, worker_socket)
+                        _logger.info(f"Worker server started on {worker_socket}.")
                     task_status.started()
                     tg.start_soon(self._node_manager.run)
             except get_cancelled_exc_class() as e:
@@ -142,6 +152,9 @@ class CrynuxRunner(object):
         if self._server is not None:
             self._server.stop()
             _logger.info("stop server")
+        if self._worker_server is not None:
+            self._worker_server.stop()
+            _logger.info("stop worker server")
         if self._node_manager is not None:
             with move_on_after(10, shield=True):
                 await self._node_manager.stop()
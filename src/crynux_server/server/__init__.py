@@ -1,8 +1,8 @@
 from typing import Optional
 
-from .app import Server
+from .app import Server, WorkerServer
 
-__all__ = ["Server", "get_server", "set_server"]
+__all__ = ["Server", "WorkerServer", "get_server", "set_server"]
 
 _server: Optional[Server] = None
 
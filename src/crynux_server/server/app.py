@@ -1,4 +1,6 @@
 import logging
+import os
+from contextlib import suppress
 from functools import partial
 from typing import Optional
 
@@ -9,9 +11,12 @@ from fastapi.staticfiles import StaticFiles
 from hypercorn.asyncio import serve
 from hypercorn.config import Config
 
+from crynux_server.worker_manager.protocol import WORKER_PING_INTERVAL
+
 from .lifespan import Lifespan
 from .middleware import add_middleware
 from .v1 import router as v1_router
+from .v1.worker import router as worker_router
 
 _logger = logging.getLogger(__name__)
 
@@ -57,6 +62,8 @@ class Server(object):
         if access_log:
             config.accesslog = "-"
         config.errorlog = "-"
+        # keep idle worker connections alive with ping frames
+        config.websocket_ping_interval = WORKER_PING_INTERVAL
 
         try:
             async with create_task_group() as tg:
@@ -74,3 +81,51 @@ class Server(object):
     @property
     def app(self):
         return self._app
+
+
+# Serve only the worker endpoint on a unix socket dedicated to the workers,
+# so worker messages don't share the listener and middlewares with the web UI
+class WorkerServer(object):
+    def __init__(self) -> None:
+        self._app = FastAPI()
+        self._app.include_router(worker_router, prefix="/manager/v1")
+
+        self._shutdown_event: Optional[Event] = None
+
+    async def start(
+        self,
+        socket_path: str,
+        *,
+        task_status: TaskStatus[None] = TASK_STATUS_IGNORED,
+    ):
+        assert self._shutdown_event is None, "Worker server has already been started."
+
+        self._shutdown_event = Event()
+        # remove the socket file left by the last run
+        with suppress(FileNotFoundError):
+            os.remove(socket_path)
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+        config = Config()
+        config.bind = [f"unix:{socket_path}"]
+        config.errorlog = "-"
+        config.websocket_ping_interval = WORKER_PING_INTERVAL
+
+        try:
+            async with create_task_group() as tg:
+                serve_func = partial(serve, self._app, config, shutdown_trigger=self._shutdown_event.wait)  # type: ignore
+                tg.start_soon(serve_func)
+                task_status.started()
+        finally:
+            self._shutdown_event = None
+            with suppress(FileNotFoundError):
+                os.remove(socket_path)
+            _logger.info("worker server stopped")
+
+    def stop(self) -> None:
+        assert self._shutdown_event is not None, "Worker server has not been started."
+        self._shutdown_event.set()
+
+    @property
+    def app(self):
+        return self._app
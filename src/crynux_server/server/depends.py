@@ -11,7 +11,10 @@ from crynux_server.node_manager import (
     get_manager_state_cache,
     get_node_state_manager,
 )
-from crynux_server.task import InferenceTaskStateCache, get_inference_task_state_cache
+from crynux_server.relay import Relay, get_relay
+from crynux_server.task import (InferenceTaskStateCache, TaskSystem,
+                                get_inference_task_state_cache, get_task_system)
+from crynux_server.watcher import EventWatcher, get_watcher
 from crynux_server.worker_manager import WorkerManager, get_worker_manager
 
 from .system import get_system_info, SystemInfo
@@ -21,6 +24,9 @@ __all__ = [
     "ConfigDep",
     "NodeStateManagerDep",
     "TaskStateCacheDep",
+    "TaskSystemDep",
+    "RelayDep",
+    "WatcherDep",
     "WorkerManagerDep",
     "SystemInfoDep",
 ]
@@ -52,6 +58,33 @@ async def _get_task_state_cache():
         raise
 
 
+async def _get_task_system():
+    try:
+        return get_task_system()
+    except AssertionError as e:
+        if "TaskSystem has not been set" in str(e):
+            return None
+        raise
+
+
+async def _get_relay():
+    try:
+        return get_relay()
+    except AssertionError as e:
+        if "Relay has not been set" in str(e):
+            return None
+        raise
+
+
+async def _get_watcher():
+    try:
+        return get_watcher()
+    except AssertionError as e:
+        if "EventWatcher has not been set" in str(e):
+            return None
+        raise
+
+
 async def _get_worker_manager():
     return get_worker_manager()
 
@@ -75,6 +108,9 @@ NodeStateManagerDep = Annotated[
 TaskStateCacheDep = Annotated[
     Optional[InferenceTaskStateCache], Depends(_get_task_state_cache)
 ]
+TaskSystemDep = Annotated[Optional[TaskSystem], Depends(_get_task_system)]
+RelayDep = Annotated[Optional[Relay], Depends(_get_relay)]
+WatcherDep = Annotated[Optional[EventWatcher], Depends(_get_watcher)]
 WorkerManagerDep = Annotated[WorkerManager, Depends(_get_worker_manager)]
 SystemInfoDep = Annotated[SystemInfo, Depends(_get_system_info)]
 AccountInfoDep = Annotated[AccountInfo, Depends(_get_account_info)]
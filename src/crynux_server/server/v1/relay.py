@@ -0,0 +1,34 @@
+from typing import Dict
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from crynux_server.relay import CoalesceStats, WebRelay
+from crynux_server.watcher import EventLagStats
+
+from ..depends import RelayDep, WatcherDep
+
+router = APIRouter(prefix="/relay")
+
+
+class RelayRequestStats(BaseModel):
+    # coalesced calls of each relay method
+    methods: Dict[str, CoalesceStats]
+
+
+# How many relay calls are answered without sending a request
+@router.get("/requests", response_model=RelayRequestStats)
+async def get_relay_request_stats(*, relay: RelayDep):
+    if not isinstance(relay, WebRelay):
+        return RelayRequestStats(methods={})
+
+    return RelayRequestStats(methods=relay.coalesce_stats())
+
+
+# How far the node is behind the events on the relay
+@router.get("/events", response_model=EventLagStats)
+async def get_relay_event_lag(*, watcher: WatcherDep):
+    if watcher is None:
+        return EventLagStats()
+
+    return watcher.lag_stats()
@@ -1,13 +1,16 @@
 import time
 from datetime import datetime
-from typing import Literal
+from typing import List, Literal
 
 from fastapi import APIRouter
 from pydantic import BaseModel
 
 from crynux_server.models import NodeStatus, InferenceTaskStatus
+from crynux_server.task import TaskPriority, TaskQueueDepth
+from crynux_server.worker_manager import TaskProgressState
 
-from ..depends import ManagerStateCacheDep, TaskStateCacheDep
+from ..depends import (ManagerStateCacheDep, TaskStateCacheDep, TaskSystemDep,
+                       WorkerManagerDep)
 
 router = APIRouter(prefix="/tasks")
 
@@ -69,3 +72,33 @@ async def get_task_stats(
         num_total = len(total_states)
 
     return TaskStats(status=status, num_today=num_today, num_total=num_total)
+
+
+class TaskQueue(BaseModel):
+    inference: TaskQueueDepth
+    download: TaskQueueDepth
+    preload: TaskQueueDepth
+
+
+@router.get("/queue", response_model=TaskQueue)
+async def get_task_queue(*, task_system: TaskSystemDep):
+    if task_system is None:
+        empty = TaskQueueDepth(queued=0, running=0)
+        return TaskQueue(inference=empty, download=empty, preload=empty)
+
+    depth = task_system.queue_depth()
+    return TaskQueue(
+        inference=depth[TaskPriority.Inference],
+        download=depth[TaskPriority.Download],
+        preload=depth[TaskPriority.Preload],
+    )
+
+
+class TasksProgress(BaseModel):
+    tasks: List[TaskProgressState]
+
+
+# Progress of the tasks running in the workers
+@router.get("/progress", response_model=TasksProgress)
+async def get_tasks_progress(*, worker_manager: WorkerManagerDep):
+    return TasksProgress(tasks=worker_manager.task_progress())
@@ -1,12 +1,19 @@
 import logging
+from typing import List
 
 from anyio import create_task_group, fail_after
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
 
-from crynux_server.models import TaskResult
-from crynux_server.worker_manager import (TaskDownloadError,
+from crynux_server.models import TaskProgress, TaskResult
+from crynux_server.worker_manager import (ModelAffinityStats,
+                                          TaskDownloadError,
                                           TaskExecutionError, TaskInvalid,
-                                          WorkerManager, is_task_invalid)
+                                          WorkerManager, WorkerProcessState,
+                                          WorkerState, is_task_invalid)
+from crynux_server.worker_manager.protocol import (WorkerChannel,
+                                                   choose_protocol,
+                                                   create_worker_channel)
 
 from ..depends import WorkerManagerDep
 
@@ -16,35 +23,58 @@ router = APIRouter(prefix="/worker")
 
 
 async def task_producer(
-    worker_id: int, websocket: WebSocket, worker_manager: WorkerManager
+    worker_id: int, channel: WorkerChannel, worker_manager: WorkerManager
 ):
     while True:
+        if not channel.heartbeat:
+            task_input, _ = await worker_manager.get_task(worker_id)
+            await channel.send("task", task_input.model_dump())
+            continue
         try:
             with fail_after(1):
                 task_input, _ = await worker_manager.get_task(worker_id)
-                await websocket.send_json(task_input.model_dump())
+                await channel.send("task", task_input.model_dump())
         except TimeoutError:
             try:
-                await websocket.send_text("")
+                await channel.ping()
                 continue
             except WebSocketDisconnect:
                 raise
 
 
+# Send control messages like task cancel to the worker
+async def control_producer(
+    worker_id: int, channel: WorkerChannel, worker_manager: WorkerManager
+):
+    while True:
+        msg = await worker_manager.get_control_message(worker_id)
+        await channel.send("control", msg)
+
+
 async def result_consumer(
-    worker_id: int, websocket: WebSocket, worker_manager: WorkerManager
+    worker_id: int, channel: WorkerChannel, worker_manager: WorkerManager
 ):
     while True:
-        raw_result = await websocket.receive_json()
+        raw_result = await channel.receive()
+        if "progress" in raw_result:
+            progress = TaskProgress.model_validate(raw_result["progress"])
+            worker_manager.report_progress(worker_id, progress)
+            continue
         result = TaskResult.model_validate(raw_result)
+        if result.resident_models is not None:
+            worker_manager.report_resident_models(worker_id, result.resident_models)
         with worker_manager.task_future(worker_id, result.task_id_commitment) as fut:
-            if fut.cancelled():
+            if result.result.status == "cancelled":
+                _logger.info(f"Task {result.task_id_commitment} is stopped by the worker")
+                if not fut.done():
+                    fut.cancel()
+            elif fut.cancelled():
                 _logger.info(f"Task {result.task_id_commitment} has been cancelled before")
             elif fut.done():
                 _logger.info(f"Task {result.task_id_commitment} has been done before")
             else:
                 if result.result.status == "success":
-                    fut.set_result(None)
+                    fut.set_result(result.result)
                 elif result.result.status == "error":
                     err_msg = result.result.traceback
                     if result.task_name == "inference":
@@ -56,6 +86,8 @@ async def result_consumer(
                     elif result.task_name == "download":
                         exc = TaskDownloadError(err_msg)
                         fut.set_error(exc)
+                    elif result.task_name == "warmup":
+                        fut.set_error(TaskExecutionError(err_msg))
 
 
 @router.websocket("/")
@@ -63,13 +95,23 @@ async def worker(websocket: WebSocket, worker_manager: WorkerManagerDep):
     await websocket.accept()
     version_msg = await websocket.receive_json()
     version = version_msg["version"]
-    worker_id = await worker_manager.connect(version)
-    await websocket.send_json({"worker_id": worker_id})
-    _logger.info(f"worker {worker_id} connects")
+    # features are sent by newer workers only
+    features = version_msg.get("features", [])
+    device = websocket.query_params.get("device")
+    worker_id = await worker_manager.connect(version, device=device, features=features)
+    # the handshake is always in JSON, messages after it are in the chosen protocol
+    protocol = choose_protocol(features)
+    if "features" in version_msg:
+        await websocket.send_json({"worker_id": worker_id, "protocol": protocol})
+    else:
+        await websocket.send_json({"worker_id": worker_id})
+    channel = create_worker_channel(websocket, protocol)
+    _logger.info(f"worker {worker_id} of device {device} connects, protocol: {protocol}")
     try:
         async with create_task_group() as tg:
-            tg.start_soon(task_producer, worker_id, websocket, worker_manager)
-            tg.start_soon(result_consumer, worker_id, websocket, worker_manager)
+            tg.start_soon(task_producer, worker_id, channel, worker_manager)
+            tg.start_soon(control_producer, worker_id, channel, worker_manager)
+            tg.start_soon(result_consumer, worker_id, channel, worker_manager)
     except WebSocketDisconnect:
         _logger.error(f"worker {worker_id} disconnects")
         pass
@@ -79,3 +121,18 @@ async def worker(websocket: WebSocket, worker_manager: WorkerManagerDep):
         raise
     finally:
         await worker_manager.disconnect(worker_id)
+
+
+class WorkersState(BaseModel):
+    workers: List[WorkerState]
+    processes: List[WorkerProcessState]
+    model_affinity: ModelAffinityStats
+
+
+@router.get("/states", response_model=WorkersState)
+async def get_worker_states(worker_manager: WorkerManagerDep):
+    return WorkersState(
+        workers=worker_manager.worker_states(),
+        processes=worker_manager.worker_process_states(),
+        model_affinity=worker_manager.model_affinity_stats(),
+    )
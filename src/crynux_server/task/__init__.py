@@ -6,13 +6,23 @@ from .state_cache import (DbDownloadTaskStateCache, DbInferenceTaskStateCache,
                           get_inference_task_state_cache,
                           set_download_task_state_cache,
                           set_inference_task_state_cache)
+from .scheduler import (TASK_CONCURRENCY_LIMITS,
+                        TASK_CONCURRENCY_LIMITS_DURING_INFERENCE, TaskPriority,
+                        TaskQueueDepth, TaskScheduler)
 from .task_runner import InferenceTaskRunner, MockInferenceTaskRunner, InferenceTaskRunnerBase
-from .task_system import TaskSystem, get_task_system, set_task_system
+from .task_system import (INFERENCE_TASK_EVENT_STATUS, TaskSystem,
+                          get_task_system, set_task_system)
 
 __all__ = [
     "TaskSystem",
+    "INFERENCE_TASK_EVENT_STATUS",
     "get_task_system",
     "set_task_system",
+    "TaskScheduler",
+    "TaskPriority",
+    "TaskQueueDepth",
+    "TASK_CONCURRENCY_LIMITS",
+    "TASK_CONCURRENCY_LIMITS_DURING_INFERENCE",
     "InferenceTaskStateCache",
     "DownloadTaskStateCache",
     "DbDownloadTaskStateCache",
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import logging
+import math
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from anyio import Event, create_task_group
+from pydantic import BaseModel
+
+_logger = logging.getLogger(__name__)
+
+
+class TaskPriority(IntEnum):
+    Inference = 0
+    Download = 1
+    Preload = 2
+
+
+# Max number of running tasks of each priority class, None means no limit
+# An inference task runner lives until the task ends, so inference tasks are not limited
+TASK_CONCURRENCY_LIMITS: Dict[TaskPriority, Optional[int]] = {
+    TaskPriority.Inference: None,
+    TaskPriority.Download: 2,
+    TaskPriority.Preload: 1,
+}
+
+# Max number of running tasks of each class while inference tasks are running,
+# so that model downloads do not compete with them for bandwidth and the worker
+# Downloads requested by the relay still run one at a time, preloads wait
+TASK_CONCURRENCY_LIMITS_DURING_INFERENCE: Dict[TaskPriority, Optional[int]] = {
+    TaskPriority.Download: 1,
+    TaskPriority.Preload: 0,
+}
+
+
+class TaskQueueDepth(BaseModel):
+    queued: int
+    running: int
+
+
+TaskFunc = Callable[[], Awaitable[None]]
+
+# (deadline, sequence, name, func)
+_QueueItem = Tuple[float, int, str, TaskFunc]
+
+
+# Start queued tasks by priority class, and by deadline in the same class
+# A task of a lower class is not started while a task of a higher class is waiting,
+# and downloads are limited further while inference tasks are running.
+# Running downloads are not interrupted when an inference task starts
+class TaskScheduler(object):
+    def __init__(
+        self,
+        limits: Optional[Dict[TaskPriority, Optional[int]]] = None,
+        inference_limits: Optional[Dict[TaskPriority, Optional[int]]] = None,
+    ) -> None:
+        if limits is None:
+            limits = TASK_CONCURRENCY_LIMITS
+        self._limits = dict(limits)
+        if inference_limits is None:
+            inference_limits = TASK_CONCURRENCY_LIMITS_DURING_INFERENCE
+        self._inference_limits = dict(inference_limits)
+
+        self._queues: Dict[TaskPriority, List[_QueueItem]] = {
+            p: [] for p in TaskPriority
+        }
+        self._counter = itertools.count()
+        self._running: Dict[TaskPriority, int] = {p: 0 for p in TaskPriority}
+
+        self._wakeup = Event()
+
+    # deadline is a unix timestamp, tasks without deadline are run last in their class
+    def submit(
+        self,
+        priority: TaskPriority,
+        name: str,
+        func: TaskFunc,
+        deadline: Optional[float] = None,
+    ):
+        if deadline is None or deadline <= 0:
+            deadline = math.inf
+        heapq.heappush(
+            self._queues[priority], (deadline, next(self._counter), name, func)
+        )
+        self._wakeup.set()
+
+    def queue_depth(self) -> Dict[TaskPriority, TaskQueueDepth]:
+        return {
+            p: TaskQueueDepth(queued=len(self._queues[p]), running=self._running[p])
+            for p in TaskPriority
+        }
+
+    def _limit(self, priority: TaskPriority) -> Optional[int]:
+        limit = self._limits.get(priority)
+        if priority != TaskPriority.Inference and self._running[TaskPriority.Inference] > 0:
+            inference_limit = self._inference_limits.get(priority)
+            if inference_limit is not None and (limit is None or inference_limit < limit):
+                limit = inference_limit
+        return limit
+
+    def _pop_runnable(self) -> Optional[Tuple[TaskPriority, _QueueItem]]:
+        for priority in TaskPriority:
+            queue = self._queues[priority]
+            if len(queue) == 0:
+                continue
+            limit = self._limit(priority)
+            if limit is not None and self._running[priority] >= limit:
+                # lower classes wait for this class
+                return None
+            return priority, heapq.heappop(queue)
+        return None
+
+    async def _run_task(self, priority: TaskPriority, item: _QueueItem):
+        deadline, _, name, func = item
+        try:
+            if deadline < time.time():
+                _logger.warning(f"Task {name} is started after its deadline")
+            await func()
+        finally:
+            self._running[priority] -= 1
+            self._wakeup.set()
+
+    async def run(self):
+        async with create_task_group() as tg:
+            while True:
+                runnable = self._pop_runnable()
+                if runnable is None:
+                    await self._wakeup.wait()
+                    self._wakeup = Event()
+                    continue
+                priority, item = runnable
+                self._running[priority] += 1
+                _logger.debug(f"Start task {item[2]} of class {priority.name}")
+                tg.start_soon(self._run_task, priority, item)
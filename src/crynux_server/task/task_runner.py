@@ -10,8 +10,9 @@ from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Awaitable, Callable, List, Optional
 
-from anyio import (create_memory_object_stream, create_task_group, fail_after,
-                   get_cancelled_exc_class, move_on_after, sleep, to_thread)
+from anyio import (Event, create_memory_object_stream, create_task_group,
+                   fail_after, get_cancelled_exc_class, move_on_after, sleep,
+                   to_thread)
 from anyio.streams.memory import (MemoryObjectReceiveStream,
                                   MemoryObjectSendStream)
 from hexbytes import HexBytes
@@ -22,15 +23,19 @@ from crynux_server import models
 from crynux_server.config import Config, get_config
 from crynux_server.contracts import Contracts, get_contracts
 from crynux_server.download_model_cache import (DownloadModelCache,
-                                                get_download_model_cache)
+                                                get_download_model_cache,
+                                                model_files_exist)
 from crynux_server.relay import Relay, get_relay
 from crynux_server.relay.exceptions import RelayError
+from crynux_server.relay.streaming import TaskResultPayload, stage_task_result
+from crynux_server.relay.upload import upload_task_result_resumable
 from crynux_server.worker_manager import TaskExecutionError, TaskInvalid
 
 from .state_cache import (DownloadTaskStateCache, InferenceTaskStateCache,
                           get_download_task_state_cache,
                           get_inference_task_state_cache)
-from .utils import run_download_task, run_inference_task, validate_score
+from .utils import (cancel_worker_task, run_download_task, run_inference_task,
+                    send_warmup_task, validate_score)
 
 _logger = logging.getLogger(__name__)
 
@@ -38,6 +43,13 @@ _logger = logging.getLogger(__name__)
 OkCallback = Callable[[bool], Awaitable[None]]
 ErrCallback = Callable[[Exception], Awaitable[None]]
 
+# Task status changes are pushed to the runner by the event watcher,
+# polling the relay is only a safety net for missed events
+TASK_STATUS_RECONCILE_INTERVAL = 30
+
+# Max seconds to wait for the worker to stop the execution of an ended task
+WORKER_CANCEL_TIMEOUT = 10
+
 
 # Manage the lifestyle of one task
 class InferenceTaskRunnerBase(ABC):
@@ -58,6 +70,11 @@ class InferenceTaskRunnerBase(ABC):
 
         self._state: Optional[models.InferenceTaskState] = None
         self._invalidated_result_uploaded = False
+        self._warmup_sent = False
+
+        self._pushed_statuses: List[models.InferenceTaskStatus] = []
+        self._status_pushed = Event()
+        self.status_reconcile_interval: float = TASK_STATUS_RECONCILE_INTERVAL
 
     @property
     def state(self) -> models.InferenceTaskState:
@@ -121,10 +138,47 @@ class InferenceTaskRunnerBase(ABC):
             if self.state.task_type != task.task_type:
                 self.state.task_type = task.task_type
                 need_dump = True
+
+            # models are known before the parameters are uploaded,
+            # so the worker can load them in the meantime
+            if (
+                not self._warmup_sent
+                and self.state.status
+                in [models.InferenceTaskStatus.Queued, models.InferenceTaskStatus.Started]
+                and len(self.state.files) == 0
+            ):
+                self._warmup_sent = True
+                await self.warmup(task)
         finally:
             if self._state is not None and need_dump:
                 await self.cache.dump(self.state)
 
+    # Receive task status pushed from the event watcher
+    # The status will be applied in order by task_status_producer
+    def push_status(self, status: models.InferenceTaskStatus):
+        self._pushed_statuses.append(status)
+        self._status_pushed.set()
+
+    def _take_pushed_statuses(self) -> List[models.InferenceTaskStatus]:
+        self._status_pushed = Event()
+        statuses = self._pushed_statuses
+        self._pushed_statuses = []
+        return statuses
+
+    async def _apply_pushed_status(self, status: models.InferenceTaskStatus):
+        if self.state.status == status:
+            return
+        async with self.state_context():
+            self.state.status = status
+
+    # Prepare the worker for the task, it is only a hint and never fails the task
+    async def warmup(self, task: models.RelayTask):
+        pass
+
+    # Stop the execution of the task in the worker if it is still queued or running
+    async def cancel_execution(self):
+        pass
+
     @abstractmethod
     async def cleanup(self): ...
 
@@ -137,6 +191,10 @@ class InferenceTaskRunnerBase(ABC):
     @abstractmethod
     async def execute_task(self): ...
 
+    # Prepare the result for uploading before it is required
+    async def stage_result(self):
+        pass
+
     @abstractmethod
     async def upload_result(self): ...
 
@@ -157,6 +215,7 @@ class InferenceTaskRunnerBase(ABC):
 
     # Receive task status from task_status_producer
     # If task is started and not executed, execute it
+    # If task score is ready, prepare the result for uploading
     # If task is validated or group validated, upload result
     # Ignore task in other status
     async def task_status_consumer(
@@ -174,6 +233,8 @@ class InferenceTaskRunnerBase(ABC):
                 ) and not executed:
                     await self.execute_task()
                     executed = True
+                elif status == models.InferenceTaskStatus.ScoreReady:
+                    await self.stage_result()
                 elif (
                     status == models.InferenceTaskStatus.Validated
                     or status == models.InferenceTaskStatus.GroupValidated
@@ -184,6 +245,8 @@ class InferenceTaskRunnerBase(ABC):
                         self._invalidated_result_uploaded = True
 
     # Send task status when it changes
+    # Status is pushed by the event watcher, and the task is synced from relay
+    # every interval seconds in case some events are missed
     # task_status_consumer will receive and handle the status
     async def task_status_producer(
         self,
@@ -191,16 +254,31 @@ class InferenceTaskRunnerBase(ABC):
         interval: float,
     ):
         async with status_sender:
-            await status_sender.send(self.state.status)
+            last_status = self.state.status
+            await status_sender.send(last_status)
             while not self.should_stop():
-                last_status = self.state.status
-                await self.sync_state()
-                if last_status != self.state.status:
-                    await status_sender.send(self.state.status)
-                await sleep(interval)
-
-    async def run(self, interval: float = 1):
+                with move_on_after(interval):
+                    await self._status_pushed.wait()
+                if self._status_pushed.is_set():
+                    # every pushed status is sent, so that quick transitions
+                    # like ScoreReady and Validated are all handled
+                    for status in self._take_pushed_statuses():
+                        await self._apply_pushed_status(status)
+                        if last_status != self.state.status:
+                            last_status = self.state.status
+                            await status_sender.send(last_status)
+                else:
+                    await self.sync_state()
+                    if last_status != self.state.status:
+                        last_status = self.state.status
+                        await status_sender.send(last_status)
+
+    async def run(self, interval: Optional[float] = None):
+        if interval is None:
+            interval = self.status_reconcile_interval
         try:
+            # status pushed before this run is outdated by the sync below
+            self._take_pushed_statuses()
             await self.sync_state()
             if self.should_stop():
                 return
@@ -214,8 +292,16 @@ class InferenceTaskRunnerBase(ABC):
             )
             with fail_after(delay, shield=False):
                 async with create_task_group() as tg:
+
+                    async def produce_task_status():
+                        await self.task_status_producer(status_sender, interval)
+                        # the aborted task will never be finished,
+                        # so stop waiting for the execution
+                        if self.state.status == models.InferenceTaskStatus.EndAborted:
+                            tg.cancel_scope.cancel()
+
                     tg.start_soon(self.task_status_consumer, status_receiver)
-                    tg.start_soon(self.task_status_producer, status_sender, interval)
+                    tg.start_soon(produce_task_status)
         except TimeoutError:
             # cancel task
             if not self.should_stop():
@@ -224,6 +310,8 @@ class InferenceTaskRunnerBase(ABC):
                     self.state.status = models.InferenceTaskStatus.EndAborted
         finally:
             if self.should_stop():
+                with move_on_after(WORKER_CANCEL_TIMEOUT, shield=True):
+                    await self.cancel_execution()
                 with move_on_after(5, shield=True):
                     await self.cleanup()
 
@@ -249,8 +337,12 @@ class InferenceTaskRunner(InferenceTaskRunnerBase):
         if config is None:
             config = get_config()
         self.config = config
+        self.status_reconcile_interval = (
+            self.config.task_config.status_reconcile_interval
+        )
 
         self._cleaned = False
+        self._result_payload: Optional[TaskResultPayload] = None
 
     # Report task error(ParametersValidationFailed)
     async def _report_error(self):
@@ -287,6 +379,34 @@ class InferenceTaskRunner(InferenceTaskRunnerBase):
             raise ValueError("Task not found")
         return task
 
+    async def warmup(self, task: models.RelayTask):
+        try:
+            task_models = [
+                models.ModelConfig.from_model_id(model_id) for model_id in task.model_ids
+            ]
+            if await send_warmup_task(
+                task_id_commitment=self.task_id_commitment,
+                task_type=task.task_type,
+                models=task_models,
+            ):
+                _logger.info(f"Warm up models of task {self.task_id_commitment.hex()}")
+        except get_cancelled_exc_class():
+            raise
+        except Exception as e:
+            _logger.warning(
+                f"Warm up models of task {self.task_id_commitment.hex()} failed: {e}"
+            )
+
+    async def cancel_execution(self):
+        try:
+            await cancel_worker_task(self.task_id_commitment)
+        except get_cancelled_exc_class():
+            raise
+        except Exception as e:
+            _logger.warning(
+                f"Cancel execution of task {self.task_id_commitment.hex()} failed: {e}"
+            )
+
     async def cancel_task(self):
         try:
             await self.relay.abort_task(
@@ -362,6 +482,7 @@ class InferenceTaskRunner(InferenceTaskRunnerBase):
                     models=task_models,
                     task_args=task.task_args,
                     task_dir=task_dir,
+                    verify_hash=self.config.task_config.verify_result_hash,
                 )
                 _logger.info(f"Task {self.task_id_commitment.hex()} execution success")
                 score = b"".join(hashes)
@@ -423,17 +544,55 @@ class InferenceTaskRunner(InferenceTaskRunnerBase):
 
         await submit_task_score()
 
+    # Open result files while waiting for validation, so that uploading only
+    # costs network time after the task is validated
+    # The checkpoint is zipped in advance only for the resumable upload
+    async def stage_result(self) -> None:
+        if self._result_payload is not None or len(self.state.files) == 0:
+            return
+        try:
+            self._result_payload = await stage_task_result(
+                self.state.files,
+                self.state.checkpoint,
+                resumable=self.config.task_config.resumable_result_upload,
+            )
+            _logger.info(f"Task {self.task_id_commitment.hex()} results are staged")
+        except Exception as e:
+            # results will be read again when uploading
+            _logger.exception(e)
+            _logger.error(f"Staging task {self.task_id_commitment.hex()} results failed")
+
+    def _close_result_payload(self):
+        if self._result_payload is not None:
+            self._result_payload.close()
+            self._result_payload = None
+
     # Upload full task result to relay
     async def upload_result(self) -> None:
         _logger.info(f"Task {self.task_id_commitment.hex()} start uploading results")
-        await self.relay.upload_task_result(
-            self.task_id_commitment, self.state.files, self.state.checkpoint
-        )
+        if self.config.task_config.resumable_result_upload:
+            await self.stage_result()
+        if (
+            self.config.task_config.resumable_result_upload
+            and self._result_payload is not None
+        ):
+            await upload_task_result_resumable(
+                self.relay, self.task_id_commitment, self._result_payload
+            )
+        else:
+            await self.relay.upload_task_result(
+                self.task_id_commitment,
+                self.state.files,
+                self.state.checkpoint,
+                payload=self._result_payload,
+            )
+        self._close_result_payload()
         _logger.info(f"Task {self.task_id_commitment.hex()} success")
 
     # Clean up task files when task is finished
     async def cleanup(self):
         if not self._cleaned:
+            self._close_result_payload()
 
             def delete_result_files(files: List[str]) -> None:
                 if len(files) > 0:
@@ -502,6 +661,9 @@ class MockInferenceTaskRunner(InferenceTaskRunnerBase):
             self.state.files = [""]
             self.state.score = random.randbytes(4)
 
+    async def stage_result(self):
+        pass
+
     async def upload_result(self):
         pass
 
@@ -518,6 +680,7 @@ class DownloadTaskRunner(object):
         contracts: Optional[Contracts] = None,
         relay: Optional[Relay] = None,
         download_model_cache: Optional[DownloadModelCache] = None,
+        config: Optional[Config] = None,
     ):
         self.task_id = task_id
         if state_cache is None:
@@ -532,6 +695,9 @@ class DownloadTaskRunner(object):
         if download_model_cache is None:
             download_model_cache = get_download_model_cache()
         self.download_model_cache = download_model_cache
+        if config is None:
+            config = get_config()
+        self.config = config
 
         self._state: models.DownloadTaskState = state
 
@@ -554,13 +720,18 @@ class DownloadTaskRunner(object):
 
         model = models.ModelConfig.from_model_id(self._state.model_id)
         if self._state.status == models.DownloadTaskStatus.Started:
-            _logger.info(f"start downloading model {self._state.model_id}")
-            await run_download_task(
-                task_id=self.task_id, task_type=self._state.task_type, model=model
-            )
+            # Models in the download cache whose files are still on disk
+            # are reported without asking the worker
+            if await self._is_model_downloaded(model):
+                _logger.info(f"model {self._state.model_id} is already downloaded")
+            else:
+                _logger.info(f"start downloading model {self._state.model_id}")
+                await run_download_task(
+                    task_id=self.task_id, task_type=self._state.task_type, model=model
+                )
+                _logger.info(f"Download model {self._state.model_id} successfully")
             async with self.state_context():
                 self._state.status = models.DownloadTaskStatus.Executed
-            _logger.info(f"Download model {self._state.model_id} successfully")
 
         if self._state.status == models.DownloadTaskStatus.Executed:
             await self.relay.node_report_model_downloaded(self._state.model_id)
@@ -572,6 +743,13 @@ class DownloadTaskRunner(object):
                 models.DownloadedModel(task_type=self._state.task_type, model=model)
             )
 
+    async def _is_model_downloaded(self, model: models.ModelConfig) -> bool:
+        if self.config.task_config is None:
+            return False
+        return await self.download_model_cache.has(model) and model_files_exist(
+            model, self.config.task_config.hf_cache_dir
+        )
+
     async def mark_failed(self):
         async with self.state_context():
             self._state.status = models.DownloadTaskStatus.Failed
@@ -1,15 +1,15 @@
 import logging
-import asyncio
+from functools import partial
 from typing import Dict, Optional
 
-from anyio import create_task_group, get_cancelled_exc_class, sleep
-from anyio.abc import TaskGroup
+from anyio import CancelScope, create_task_group, get_cancelled_exc_class, sleep
 from tenacity import retry, stop_after_attempt, stop_never, wait_exponential, wait_fixed
 
 from crynux_server.contracts import Contracts
-from crynux_server.models import InferenceTaskStatus, DownloadTaskStatus, TaskType, DownloadTaskState
+from crynux_server.models import InferenceTaskStatus, DownloadTaskStatus, TaskType, DownloadTaskState, Event, EventType
 from crynux_server.relay.abc import Relay
 
+from .scheduler import TaskPriority, TaskQueueDepth, TaskScheduler
 from .state_cache import InferenceTaskStateCache, DownloadTaskStateCache
 from .task_runner import InferenceTaskRunner, DownloadTaskRunner
 
@@ -19,6 +19,17 @@ DOWNLOAD_TASK_MAX_ATTEMPTS = 3
 DOWNLOAD_TASK_BACKOFF_MULTIPLIER_SECONDS = 30
 DOWNLOAD_TASK_BACKOFF_MAX_SECONDS = 300
 
+# The inference task status after the event is emitted
+INFERENCE_TASK_EVENT_STATUS: Dict[EventType, InferenceTaskStatus] = {
+    "TaskErrorReported": InferenceTaskStatus.ErrorReported,
+    "TaskScoreReady": InferenceTaskStatus.ScoreReady,
+    "TaskValidated": InferenceTaskStatus.Validated,
+    "TaskEndInvalidated": InferenceTaskStatus.EndInvalidated,
+    "TaskEndSuccess": InferenceTaskStatus.EndSuccess,
+    "TaskEndAborted": InferenceTaskStatus.EndAborted,
+    "TaskEndGroupSuccess": InferenceTaskStatus.EndGroupSuccess,
+    "TaskEndGroupRefund": InferenceTaskStatus.EndGroupRefund,
+}
 
 
 def _is_task_id_commitment_empty(task_id_commitment: bytes):
@@ -33,6 +44,7 @@ class TaskSystem(object):
         contracts: Contracts,
         relay: Relay,
         retry: bool = True,
+        scheduler: Optional[TaskScheduler] = None,
     ) -> None:
         self._inference_state_cache = inference_state_cache
         self._download_state_cache = download_state_cache
@@ -40,12 +52,14 @@ class TaskSystem(object):
         self._relay = relay
         self._retry = retry
 
-        self._tg: Optional[TaskGroup] = None
+        self._cancel_scope: Optional[CancelScope] = None
 
         self._inference_runners: Dict[bytes, InferenceTaskRunner] = {}
         self._download_runners: Dict[str, DownloadTaskRunner] = {}
 
-        self._task_queue = asyncio.Queue()
+        if scheduler is None:
+            scheduler = TaskScheduler()
+        self._scheduler = scheduler
 
     # Run inference task with the given task_id_commitment
     async def _run_inference_task(self, task_id_commitment: bytes):
@@ -119,7 +133,24 @@ class TaskSystem(object):
     async def _get_node_task(self):
         return await self._relay.node_get_current_task()
 
-    async def _recover_inference_task(self, tg: TaskGroup):
+    # The timeout of the task is its deadline in the inference class,
+    # it is only known for the tasks recovered from the state cache
+    def _schedule_inference_task(self, task_id_commitment: bytes, deadline: Optional[float] = None):
+        self._scheduler.submit(
+            TaskPriority.Inference,
+            name=task_id_commitment.hex(),
+            func=partial(self._run_inference_task, task_id_commitment),
+            deadline=deadline,
+        )
+
+    def _schedule_download_task(self, task_id: str, preload: bool = False):
+        self._scheduler.submit(
+            TaskPriority.Preload if preload else TaskPriority.Download,
+            name=task_id,
+            func=partial(self._run_download_task, task_id),
+        )
+
+    async def _recover_inference_task(self):
         running_status = [
             InferenceTaskStatus.Queued,
             InferenceTaskStatus.Started,
@@ -137,7 +168,7 @@ class TaskSystem(object):
             )
             runner.state = state
             self._inference_runners[state.task_id_commitment] = runner
-            tg.start_soon(self._run_inference_task, state.task_id_commitment)
+            self._schedule_inference_task(state.task_id_commitment, state.timeout)
             _logger.debug(f"Rerun inference task {state.task_id_commitment.hex()}")
         
         task_id_commitment = await self._get_node_task()
@@ -148,10 +179,10 @@ class TaskSystem(object):
                 contracts=self._contracts
             )
             self._inference_runners[task_id_commitment] = runner
-            tg.start_soon(self._run_inference_task, task_id_commitment)
+            self._schedule_inference_task(task_id_commitment)
             _logger.debug(f"Rerun inference task {task_id_commitment.hex()}")
 
-    async def _recover_download_task(self, tg: TaskGroup):
+    async def _recover_download_task(self):
         running_status = [
             DownloadTaskStatus.Started, DownloadTaskStatus.Executed
         ]
@@ -165,7 +196,7 @@ class TaskSystem(object):
                 relay=self._relay
             )
             self._download_runners[state.task_id] = runner
-            tg.start_soon(self._run_download_task, state.task_id)
+            self._schedule_download_task(state.task_id)
             _logger.debug(f"Rerun download task {state.task_id}")
 
     # Create inference task on node with the given task_id_commitment
@@ -177,10 +208,27 @@ class TaskSystem(object):
                 contracts=self._contracts
             )
             self._inference_runners[task_id_commitment] = runner
-            await self._task_queue.put(("inference", task_id_commitment))
+            self._schedule_inference_task(task_id_commitment)
+
+    # Push the task status carried by the event to the running inference task
+    # Events of tasks not running on this node are ignored
+    async def update_inference_task_status(self, event: Event):
+        if event.type not in INFERENCE_TASK_EVENT_STATUS:
+            return
+        task_id_commitment = getattr(event, "task_id_commitment", None)
+        if task_id_commitment is None:
+            return
+        runner = self._inference_runners.get(task_id_commitment)
+        if runner is not None:
+            status = INFERENCE_TASK_EVENT_STATUS[event.type]
+            runner.push_status(status)
+            _logger.debug(f"Push task {task_id_commitment.hex()} status {status.name}")
 
     # Create download task with the given task_id
-    async def create_download_task(self, task_id: str, task_type: TaskType, model_id: str):
+    # Preload tasks are run after the downloads requested by the relay
+    async def create_download_task(
+        self, task_id: str, task_type: TaskType, model_id: str, preload: bool = False
+    ):
         if task_id not in self._download_runners:
             if await self._download_state_cache.has(task_id):
                 old_state = await self._download_state_cache.load(task_id)
@@ -201,7 +249,15 @@ class TaskSystem(object):
                 relay=self._relay
             )
             self._download_runners[task_id] = runner
-            await self._task_queue.put(("download", task_id))
+            self._schedule_download_task(task_id, preload)
+
+    # Whether any inference task is waiting for its next events
+    def has_active_tasks(self) -> bool:
+        return len(self._inference_runners) > 0
+
+    # Number of queued and running tasks of each priority class
+    def queue_depth(self) -> Dict[TaskPriority, TaskQueueDepth]:
+        return self._scheduler.queue_depth()
 
     async def start(self):
         @retry(
@@ -210,21 +266,14 @@ class TaskSystem(object):
             reraise=True,
         )
         async def _start():
-            assert self._tg is None, "The TaskSystem has already been started."
+            assert self._cancel_scope is None, "The TaskSystem has already been started."
 
             try:
                 async with create_task_group() as tg:
-                    self._tg = tg
-                    await self._recover_inference_task(tg)
-                    await self._recover_download_task(tg)
-                    while True:
-                        task_name, task_id = await self._task_queue.get()
-                        if task_name == "inference":
-                            assert isinstance(task_id, bytes)
-                            tg.start_soon(self._run_inference_task, task_id)
-                        elif task_name == "download":
-                            assert isinstance(task_id, str)
-                            tg.start_soon(self._run_download_task, task_id)
+                    self._cancel_scope = tg.cancel_scope
+                    await self._recover_inference_task()
+                    await self._recover_download_task()
+                    tg.start_soon(self._scheduler.run)
 
             except get_cancelled_exc_class():
                 raise
@@ -233,13 +282,13 @@ class TaskSystem(object):
                 _logger.exception(e)
                 raise
             finally:
-                self._tg = None
+                self._cancel_scope = None
 
         await _start()
 
     def stop(self):
-        if self._tg is not None and not self._tg.cancel_scope.cancel_called:
-            self._tg.cancel_scope.cancel()
+        if self._cancel_scope is not None and not self._cancel_scope.cancel_called:
+            self._cancel_scope.cancel()
 
 
 _default_task_system: Optional[TaskSystem] = None
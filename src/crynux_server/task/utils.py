@@ -1,26 +1,112 @@
-import hashlib
+import logging
 import os
 import re
-from typing import List, Literal
+import sys
+from typing import List, Literal, Optional
 
 import imhash
+from anyio import (BrokenWorkerProcess, CapacityLimiter,
+                   create_task_group, to_process, to_thread)
+
 from crynux_server.models import (
     InferenceTaskInput,
     TaskInput,
     TaskType,
     ModelConfig,
     DownloadTaskInput,
+    SuccessResult,
+    WarmupTaskInput,
 )
-from crynux_server.worker_manager import get_worker_manager
+from crynux_server.utils import SingleFlight, sha256_file
+from crynux_server.worker_manager import (TaskExecutionError, TaskFuture,
+                                         WorkerManager, get_worker_manager)
+
+_logger = logging.getLogger(__name__)
+
+
+# imhash holds the GIL while hashing, so images are hashed in worker processes
+IMAGE_HASH_MAX_WORKERS = min(os.cpu_count() or 1, 8)
+
+_image_hash_limiter: Optional[CapacityLimiter] = None
 
 
 def get_image_hash(filename: str) -> bytes:
     return bytes.fromhex(imhash.getPHash(filename)[2:])  # type: ignore
 
 
+def _get_image_hash_limiter() -> CapacityLimiter:
+    global _image_hash_limiter
+
+    if _image_hash_limiter is None:
+        _image_hash_limiter = CapacityLimiter(IMAGE_HASH_MAX_WORKERS)
+    return _image_hash_limiter
+
+
+def _get_image_hashes_sync(filenames: List[str]) -> List[bytes]:
+    return [get_image_hash(filename) for filename in filenames]
+
+
+# Hash images of one task in parallel
+# A single image is hashed in a thread to avoid the process round trip.
+# Frozen builds cannot start the python worker processes, so they hash in a thread
+async def get_image_hashes(filenames: List[str]) -> List[bytes]:
+    if len(filenames) <= 1 or getattr(sys, "frozen", False):
+        return await to_thread.run_sync(_get_image_hashes_sync, filenames)
+
+    limiter = _get_image_hash_limiter()
+    hashes: List[bytes] = [b""] * len(filenames)
+
+    async def _hash(index: int, filename: str):
+        try:
+            phash = await to_process.run_sync(
+                imhash.getPHash, filename, limiter=limiter  # type: ignore
+            )
+            hashes[index] = bytes.fromhex(phash[2:])
+        except BrokenWorkerProcess:
+            # the worker process exited, hash the image in a thread instead
+            hashes[index] = await to_thread.run_sync(get_image_hash, filename)
+
+    async with create_task_group() as tg:
+        for index, filename in enumerate(filenames):
+            tg.start_soon(_hash, index, filename)
+    return hashes
+
+
 def get_gpt_resp_hash(filename: str) -> bytes:
-    with open(filename, mode="rb") as f:
-        return hashlib.sha256(f.read()).digest()
+    return sha256_file(filename)
+
+
+def get_result_files(task_type: TaskType, task_dir: str) -> List[str]:
+    if task_type == TaskType.LLM:
+        result_dir = task_dir
+        pattern = r"[0-9]+\.json"
+    elif task_type == TaskType.SD_FT_LORA:
+        result_dir = os.path.join(task_dir, "validation")
+        pattern = r"[0-9]+\.png"
+    else:
+        result_dir = task_dir
+        pattern = r"[0-9]+\.png"
+
+    files = [f for f in os.listdir(result_dir) if re.match(pattern, f)]
+    files.sort(key=lambda f: int(f.split(".")[0]))
+    return [os.path.join(result_dir, f) for f in files]
+
+
+def _get_gpt_resp_hashes_sync(filenames: List[str]) -> List[bytes]:
+    return [get_gpt_resp_hash(filename) for filename in filenames]
+
+
+async def get_result_hashes(task_type: TaskType, files: List[str]) -> List[bytes]:
+    if task_type == TaskType.LLM:
+        return await to_thread.run_sync(_get_gpt_resp_hashes_sync, files)
+    else:
+        return await get_image_hashes(files)
+
+
+def _hash_from_hex(value: str) -> bytes:
+    if value.startswith("0x"):
+        value = value[2:]
+    return bytes.fromhex(value)
 
 
 async def run_inference_task(
@@ -29,8 +115,11 @@ async def run_inference_task(
     models: List[ModelConfig],
     task_args: str,
     task_dir: str,
+    verify_hash: bool = False,
+    worker_manager: Optional[WorkerManager] = None,
 ):
-    worker_manager = get_worker_manager()
+    if worker_manager is None:
+        worker_manager = get_worker_manager()
     task_input = TaskInput(
         task=InferenceTaskInput(
             task_name="inference",
@@ -42,44 +131,160 @@ async def run_inference_task(
         )
     )
     task_result = await worker_manager.send_task(task_input)
-    await task_result.get()
+    result = await task_result.get()
 
     files: List[str] = []
     hashes: List[bytes] = []
     checkpoint: str | None = None
-    if task_type == TaskType.SD:
-        files = [f for f in os.listdir(task_dir) if re.match(r"[0-9]+\.png", f)]
-        files.sort(key=lambda f: int(f.split(".")[0]))
-        files = [os.path.join(task_dir, f) for f in files]
-        hashes = [get_image_hash(filename) for filename in files]
-    elif task_type == TaskType.LLM:
-        files = [f for f in os.listdir(task_dir) if re.match(r"[0-9]+\.json", f)]
-        files.sort(key=lambda f: int(f.split(".")[0]))
-        files = [os.path.join(task_dir, f) for f in files]
-        hashes = [get_gpt_resp_hash(filename) for filename in files]
-    elif task_type == TaskType.SD_FT_LORA:
-        img_dir = os.path.join(task_dir, "validation")
-        files = [f for f in os.listdir(img_dir) if re.match(r"[0-9]+\.png", f)]
-        files.sort(key=lambda f: int(f.split(".")[0]))
-        files = [os.path.join(img_dir, f) for f in files]
-        hashes = [get_image_hash(filename) for filename in files]
+    if isinstance(result, SuccessResult) and len(result.files) > 0:
+        # use the results hashed by the worker
+        if len(result.files) != len(result.hashes):
+            raise TaskExecutionError(
+                f"Task {task_id_commitment.hex()} result files and hashes mismatch"
+            )
+        files = [os.path.join(task_dir, f) for f in result.files]
+        hashes = [_hash_from_hex(h) for h in result.hashes]
+        if verify_hash:
+            local_hashes = await get_result_hashes(task_type, files)
+            if local_hashes != hashes:
+                raise TaskExecutionError(
+                    f"Task {task_id_commitment.hex()} result hashes from worker are incorrect"
+                )
+    else:
+        # older workers only write the result files
+        files = await to_thread.run_sync(get_result_files, task_type, task_dir)
+        hashes = await get_result_hashes(task_type, files)
+
+    if task_type == TaskType.SD_FT_LORA:
         checkpoint = os.path.join(task_dir, "checkpoint")
 
     return files, hashes, checkpoint
 
 
+# Let the worker load the task models while the task parameters are being uploaded
+# The warmup task is not waited, return whether it is sent
+async def send_warmup_task(
+    task_id_commitment: bytes,
+    task_type: TaskType,
+    models: List[ModelConfig],
+    worker_manager: Optional[WorkerManager] = None,
+) -> bool:
+    if worker_manager is None:
+        worker_manager = get_worker_manager()
+    task_input = TaskInput(
+        task=WarmupTaskInput(
+            task_name="warmup",
+            task_type=task_type,
+            task_id=task_id_commitment.hex(),
+            models=models,
+        )
+    )
+    task_result = await worker_manager.send_warmup(task_input)
+    if task_result is None:
+        return False
+
+    def log_error(fut: TaskFuture):
+        if not fut.cancelled() and fut.exception() is not None:
+            _logger.warning(
+                f"Warmup of task {task_id_commitment.hex()} failed: {fut.exception()}"
+            )
+
+    task_result.add_done_callback(log_error)
+    return True
+
+
+# Stop the task in the worker, and wait until the worker is free
+async def cancel_worker_task(
+    task_id_commitment: bytes, worker_manager: Optional[WorkerManager] = None
+):
+    if worker_manager is None:
+        worker_manager = get_worker_manager()
+    await worker_manager.cancel_task(task_id_commitment.hex())
+
+
+# Concurrency and bandwidth shared by all the model downloads of the node,
+# from preloading and relay events alike
+# Each running download is given an equal share of the bandwidth, so that
+# the downloads never use more than the total together
+class DownloadBudget(object):
+    def __init__(self, concurrency: int, bandwidth: Optional[int] = None) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.bandwidth = bandwidth
+        self.limiter = CapacityLimiter(self.concurrency)
+
+    # max bandwidth of one download in bytes per second, None for no limit.
+    # It is a fixed share of each slot rather than split among the running
+    # downloads, because the workers cannot change the limit of a started download
+    @property
+    def download_bandwidth(self) -> Optional[int]:
+        if self.bandwidth is None:
+            return None
+        return max(self.bandwidth // self.concurrency, 1)
+
+
+_download_budget: Optional[DownloadBudget] = None
+
+
+def get_download_budget() -> Optional[DownloadBudget]:
+    return _download_budget
+
+
+def set_download_budget(budget: Optional[DownloadBudget]):
+    global _download_budget
+
+    _download_budget = budget
+
+
+# Model downloads which are running in the worker, keyed by model id
+_model_downloads = SingleFlight()
+
+
+# Concurrent downloads of the same model, e.g. from preloading and relay events,
+# are coalesced into one worker task
+# The worker tasks wait for a slot of the download budget if it is set
 async def run_download_task(
     task_id: str,
     task_type: TaskType,
     model: ModelConfig,
+    worker_manager: Optional[WorkerManager] = None,
+    budget: Optional[DownloadBudget] = None,
+):
+    model_id = model.to_model_id()
+    if _model_downloads.running(model_id):
+        _logger.info(f"Model {model_id} is being downloaded, wait for it")
+
+    async def download():
+        nonlocal worker_manager, budget
+
+        if worker_manager is None:
+            worker_manager = get_worker_manager()
+        if budget is None:
+            budget = get_download_budget()
+        if budget is None:
+            await _send_download_task(task_id, task_type, model, worker_manager, None)
+        else:
+            async with budget.limiter:
+                await _send_download_task(
+                    task_id, task_type, model, worker_manager, budget.download_bandwidth
+                )
+
+    await _model_downloads.call(model_id, download)
+
+
+async def _send_download_task(
+    task_id: str,
+    task_type: TaskType,
+    model: ModelConfig,
+    worker_manager: WorkerManager,
+    max_bandwidth: Optional[int],
 ):
-    worker_manager = get_worker_manager()
     task_input = TaskInput(
         task=DownloadTaskInput(
             task_name="download",
             task_type=task_type,
             task_id=task_id,
             model=model,
+            max_bandwidth=max_bandwidth,
         )
     )
     task_result = await worker_manager.send_task(task_input)
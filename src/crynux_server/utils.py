@@ -1,11 +1,14 @@
+import copy
+import hashlib
 import os.path
 import platform
 import re
 from collections import OrderedDict
-from typing import Any, Dict
+from typing import (Any, Awaitable, BinaryIO, Callable, Dict, Hashable, Iterator,
+                    Optional, TypeVar)
 
 import psutil
-from anyio import Path, run_process, to_thread
+from anyio import Event, Path, get_cancelled_exc_class, run_process, to_thread
 from eth_account import Account
 from pydantic import BaseModel
 from web3 import Web3
@@ -22,8 +25,18 @@ __all__ = [
     "get_memory_info",
     "DiskInfo",
     "get_disk_info",
+    "FILE_CHUNK_SIZE",
+    "iter_file_chunks",
+    "iter_fileobj_chunks",
+    "sha256_file",
+    "SingleFlight",
+    "copy_error",
 ]
 
+T = TypeVar("T")
+
+FILE_CHUNK_SIZE = 1024 * 1024
+
 
 def sort_dict(input: Dict[str, Any]) -> Dict[str, Any]:
     keys = sorted(input.keys())
@@ -38,6 +51,43 @@ def sort_dict(input: Dict[str, Any]) -> Dict[str, Any]:
     return res
 
 
+# Read the file object from its current position through one fixed size buffer,
+# until the end of the file or size bytes are read
+# The yielded chunk is only valid until the next one is read
+def iter_fileobj_chunks(
+    fileobj: BinaryIO, chunk_size: int = FILE_CHUNK_SIZE, size: Optional[int] = None
+) -> Iterator[memoryview]:
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    remaining = size
+    while remaining is None or remaining > 0:
+        if remaining is not None and remaining < chunk_size:
+            n = fileobj.readinto(view[:remaining])
+        else:
+            n = fileobj.readinto(buf)
+        if not n:
+            break
+        if remaining is not None:
+            remaining -= n
+        yield view[:n]
+
+
+# Read the file through one fixed size buffer
+# The yielded chunk is only valid until the next one is read
+def iter_file_chunks(
+    filename: str, chunk_size: int = FILE_CHUNK_SIZE
+) -> Iterator[memoryview]:
+    with open(filename, mode="rb", buffering=0) as f:
+        yield from iter_fileobj_chunks(f, chunk_size)  # type: ignore
+
+
+def sha256_file(filename: str, chunk_size: int = FILE_CHUNK_SIZE) -> bytes:
+    h = hashlib.sha256()
+    for chunk in iter_file_chunks(filename, chunk_size):
+        h.update(chunk)
+    return h.digest()
+
+
 def get_task_hash(task_args: str):
     res = Web3.keccak(task_args.encode("utf-8"))
     return res.hex()
@@ -239,3 +289,60 @@ async def get_disk_info(
 def get_address_from_privkey(privkey: str):
     addrLowcase = Account.from_key(privkey).address
     return Web3.to_checksum_address(addrLowcase)
+
+
+# A copy of the error without its traceback, so that the error can be raised
+# to many callers without their tracebacks piling up on one instance
+def copy_error(error: BaseException) -> BaseException:
+    try:
+        res = type(error).__new__(type(error), *error.args)
+        res.__dict__.update(error.__dict__)
+        return res
+    except Exception:
+        return error
+
+
+class _Flight(object):
+    def __init__(self) -> None:
+        self.done = Event()
+        self.success = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# Concurrent calls with the same key share one running call
+# Each caller gets its own deep copy of the result, and the waiting callers
+# get a copy of the error raised from the original one.
+# A cancelled call is run again by the next waiting caller
+class SingleFlight(object):
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def call(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        while key in self._flights:
+            flight = self._flights[key]
+            await flight.done.wait()
+            if flight.success:
+                return copy.deepcopy(flight.result)
+            if flight.error is not None:
+                raise copy_error(flight.error) from flight.error
+            # the running call was cancelled, run a new one
+
+        flight = _Flight()
+        self._flights[key] = flight
+        try:
+            result = await func()
+            flight.result = result
+            flight.success = True
+            return copy.deepcopy(result)
+        except get_cancelled_exc_class():
+            raise
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            del self._flights[key]
+            flight.done.set()
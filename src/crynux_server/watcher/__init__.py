@@ -1,9 +1,10 @@
 from typing import Optional
 
-from .watcher import EventWatcher
+from .watcher import EventLagStats, EventWatcher
 
 __all__ = [
     "EventWatcher",
+    "EventLagStats",
     "get_watcher",
     "set_watcher",
 ]
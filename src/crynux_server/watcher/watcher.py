@@ -1,12 +1,15 @@
 import logging
+import time
 from collections import defaultdict
 from typing import Awaitable, Callable, Dict, List, Optional
 
 from anyio import (TASK_STATUS_IGNORED, CancelScope,
-                   create_memory_object_stream, create_task_group, sleep)
+                   create_memory_object_stream, create_task_group,
+                   get_cancelled_exc_class, sleep)
 from anyio.abc import TaskStatus
 from anyio.streams.memory import (MemoryObjectReceiveStream,
                                   MemoryObjectSendStream)
+from pydantic import BaseModel
 
 from crynux_server.models import Event, EventType
 from crynux_server.relay import Relay
@@ -14,6 +17,15 @@ from crynux_server.relay.abc import Relay
 
 EventCallback = Callable[[Event], Awaitable[None]]
 
+# Longest seconds between two polls when no events happen
+WATCHER_MAX_FETCH_INTERVAL = 4
+# Seconds between two polls while tasks are running
+WATCHER_ACTIVE_FETCH_INTERVAL = 0.5
+# Events fetched in one request
+WATCHER_PAGE_SIZE = 100
+# Seconds to poll events before subscribing again after the subscription is broken
+WATCHER_RESUBSCRIBE_INTERVAL = 30
+
 _logger = logging.getLogger(__name__)
 
 
@@ -46,18 +58,43 @@ class EventFilter(object):
         await wrap_callback(self.callback)(event)
 
 
+class EventLagStats(BaseModel):
+    # id of the latest event known on the relay
+    head_event_id: Optional[int] = None
+    # id of the latest event processed by the watcher
+    processed_event_id: Optional[int] = None
+    # events on the relay which are not processed yet
+    lag_ids: int = 0
+    # seconds since the watcher fell behind the relay, 0 when it is at the head
+    lag_seconds: float = 0
+
+
 # Watch all events related to node self.relay.node_address
 # And manages all event filters to process these events
 class EventWatcher(object):
     def __init__(
         self,
         relay: Relay,
-        fetch_interval: int = 1,
+        fetch_interval: float = 1,
+        max_fetch_interval: float = WATCHER_MAX_FETCH_INTERVAL,
+        active_fetch_interval: float = WATCHER_ACTIVE_FETCH_INTERVAL,
+        resubscribe_interval: float = WATCHER_RESUBSCRIBE_INTERVAL,
+        page_size: int = WATCHER_PAGE_SIZE,
     ):
         self._relay = relay
 
         self._last_event_id: Optional[int] = None
         self._fetch_interval = fetch_interval
+        self._max_fetch_interval = max(max_fetch_interval, fetch_interval)
+        self._active_fetch_interval = min(active_fetch_interval, fetch_interval)
+        self._resubscribe_interval = resubscribe_interval
+        self._page_size = page_size
+        # whether the node is running tasks, which wait for the next events
+        self._is_active: Optional[Callable[[], bool]] = None
+
+        self._head_event_id: Optional[int] = None
+        self._processed_event_id: Optional[int] = None
+        self._behind_since: Optional[float] = None
 
         self._next_filter_id = 0
         self._event_filters: Dict[EventType, Dict[int, EventFilter]] = defaultdict(dict)
@@ -65,44 +102,160 @@ class EventWatcher(object):
 
         self._cancel_scope: Optional[CancelScope] = None
 
+    # Poll events more often while is_active returns True
+    def set_active_check(self, is_active: Callable[[], bool]):
+        self._is_active = is_active
+
+    def _active(self) -> bool:
+        return self._is_active is not None and self._is_active()
+
+    def _update_head(self, event_id: int):
+        if self._head_event_id is None or event_id > self._head_event_id:
+            self._head_event_id = event_id
+        self._update_lag()
+
+    def _update_lag(self):
+        if (
+            self._head_event_id is not None
+            and self._processed_event_id is not None
+            and self._processed_event_id < self._head_event_id
+        ):
+            if self._behind_since is None:
+                self._behind_since = time.monotonic()
+        else:
+            self._behind_since = None
+
+    def lag_stats(self) -> EventLagStats:
+        lag_ids = 0
+        if self._head_event_id is not None and self._processed_event_id is not None:
+            lag_ids = max(self._head_event_id - self._processed_event_id, 0)
+        lag_seconds = 0.0
+        if self._behind_since is not None:
+            lag_seconds = time.monotonic() - self._behind_since
+        return EventLagStats(
+            head_event_id=self._head_event_id,
+            processed_event_id=self._processed_event_id,
+            lag_ids=lag_ids,
+            lag_seconds=lag_seconds,
+        )
+
+    # Fetch one page of events after self._last_event_id
     async def _fetch_events(self) -> List[Event]:
         start_id = self._last_event_id
         if start_id is None:
             start_id = await self._relay.get_current_event_id(
                 node_address=self._relay.node_address
             )
+            self._processed_event_id = start_id
+            self._update_head(start_id)
 
         events = await self._relay.get_events(
             start_id=start_id,
             node_address=self._relay.node_address,
+            limit=self._page_size,
         )
         _logger.debug(
             f"fetched events for node {self._relay.node_address} from {start_id}, events: {events}"
         )
         if len(events) > 0:
             self._last_event_id = events[-1].id
+            self._update_head(events[-1].id)
         else:
             self._last_event_id = start_id
         return events
 
-    # Fetch events evrey self._fetch_interval seconds
-    # Send the fetched events to the event_sender
+    # Fetch pages of events back to back until the head of the relay is reached,
+    # each page is sent once it is fetched
+    # Return the number of the fetched events
+    async def _catch_up(self, event_sender: MemoryObjectSendStream[Event]) -> int:
+        count = 0
+        while True:
+            events = await self._fetch_events()
+            count += len(events)
+            if len(events) >= self._page_size and count == len(events):
+                # the watcher is behind, find how far the head is
+                head_event_id = await self._relay.get_current_event_id(
+                    node_address=self._relay.node_address
+                )
+                self._update_head(head_event_id)
+                _logger.info(
+                    f"Catching up events from {events[0].id} to {head_event_id}"
+                )
+            for event in events:
+                await event_sender.send(event)
+            if len(events) < self._page_size:
+                return count
+
+    # Poll events until the deadline, or forever if it is None
+    # While tasks are running, events are polled every self._active_fetch_interval.
+    # Otherwise the interval starts from self._fetch_interval, and doubles up to
+    # self._max_fetch_interval while no events happen
+    async def _poll_events(
+        self,
+        event_sender: MemoryObjectSendStream[Event],
+        deadline: Optional[float] = None,
+    ):
+        interval = self._fetch_interval
+        while deadline is None or time.monotonic() < deadline:
+            count = await self._catch_up(event_sender)
+            if self._active():
+                interval = self._active_fetch_interval
+            elif count > 0:
+                interval = self._fetch_interval
+            else:
+                interval = min(interval * 2, self._max_fetch_interval)
+            await sleep(interval)
+
+    # Receive the events pushed by the relay after self._last_event_id,
+    # until the subscription ends
+    async def _receive_pushed_events(self, event_sender: MemoryObjectSendStream[Event]):
+        assert self._last_event_id is not None
+        async for event in self._relay.subscribe_events(
+            start_id=self._last_event_id,
+            node_address=self._relay.node_address,
+        ):
+            if event.id <= self._last_event_id:
+                continue
+            self._last_event_id = event.id
+            self._update_head(event.id)
+            await event_sender.send(event)
+
+    # Fetch the events missed before, then receive the events pushed by the relay
+    # Poll events instead if the relay does not push events, or when the subscription
+    # is broken until subscribing again
+    # Send the events to the event_sender
     # The _event_processor will process these events
     async def _event_fetcher(
         self,
         event_sender: MemoryObjectSendStream[Event],
         task_status: TaskStatus[None],
     ):
-        started = False
         async with event_sender:
+            events = await self._fetch_events()
+            task_status.started()
+            for event in events:
+                await event_sender.send(event)
+            if len(events) >= self._page_size:
+                await self._catch_up(event_sender)
+
             while True:
-                events = await self._fetch_events()
-                if not started:
-                    task_status.started()
-                    started = True
-                for event in events:
-                    await event_sender.send(event)
-                await sleep(self._fetch_interval)
+                if not self._relay.supports_event_push:
+                    _logger.info("The relay does not push events, poll events instead")
+                    await self._poll_events(event_sender)
+                    continue
+
+                try:
+                    await self._receive_pushed_events(event_sender)
+                except get_cancelled_exc_class():
+                    raise
+                except Exception as e:
+                    _logger.warning(f"Event subscription is broken: {e}")
+                else:
+                    if not self._relay.supports_event_push:
+                        continue
+                    _logger.warning("Event subscription is closed by the relay")
+                deadline = time.monotonic() + self._resubscribe_interval
+                await self._poll_events(event_sender, deadline)
 
     # Get events from event_receiver, which are send by the _event_fetcher
     # Process the events fetched one by one
@@ -114,6 +267,8 @@ class EventWatcher(object):
                     event_filters = self._event_filters[event.type].values()
                     for event_filter in event_filters:
                         tg.start_soon(event_filter.process_event, event)
+                self._processed_event_id = event.id
+                self._update_lag()
 
     # Add a filter to process events with a specific event type
     # The callback function will be called when the event is fetched
@@ -1,10 +1,21 @@
+from .affinity import ModelAffinityStats
 from .error import (TaskDownloadError, TaskCancelled, TaskError,
                     TaskExecutionError, TaskInvalid, is_task_invalid)
-from .manager import WorkerManager, get_worker_manager, set_worker_manager
+from .manager import (WORKER_FEATURE_CANCEL, WORKER_FEATURE_PROGRESS,
+                      WORKER_FEATURE_WARMUP, TaskProgressState, WorkerManager,
+                      WorkerProcessState, WorkerState, get_worker_manager,
+                      set_worker_manager)
 from .task import TaskFuture
 
 __all__ = [
     "WorkerManager",
+    "WorkerState",
+    "WorkerProcessState",
+    "WORKER_FEATURE_WARMUP",
+    "WORKER_FEATURE_CANCEL",
+    "WORKER_FEATURE_PROGRESS",
+    "TaskProgressState",
+    "ModelAffinityStats",
     "get_worker_manager",
     "set_worker_manager",
     "TaskFuture",
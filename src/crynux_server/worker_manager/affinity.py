@@ -0,0 +1,79 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from crynux_server.models import (InferenceTaskInput, TaskInput,
+                                  WarmupTaskInput)
+
+# Max seconds a task waits for a busy worker which has its models loaded,
+# before it is sent to another idle worker
+MODEL_AFFINITY_MAX_WAIT = 10
+
+
+def get_task_model_ids(task_input: TaskInput) -> List[str]:
+    if isinstance(task_input.task, (InferenceTaskInput, WarmupTaskInput)):
+        return [model.to_model_id() for model in task_input.task.models]
+    return []
+
+
+class ModelAffinityStats(BaseModel):
+    # inference tasks sent to a worker which has the task models loaded
+    hits: int = 0
+    # inference tasks sent to a worker which needs to load the task models
+    misses: int = 0
+    # misses caused by the warm worker being busy longer than the max wait
+    fallbacks: int = 0
+    hit_rate: float = 0
+    avg_hit_seconds: float = 0
+    avg_miss_seconds: float = 0
+    # estimated model loading time saved by the hits
+    load_time_saved_seconds: float = 0
+
+
+class ModelAffinityMetrics(object):
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+        self._hit_seconds = 0.0
+        self._hit_count = 0
+        self._miss_seconds = 0.0
+        self._miss_count = 0
+
+    def record_dispatch(self, hit: bool, fallback: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if fallback:
+                self.fallbacks += 1
+
+    # record the execution time of a successful inference task
+    def record_execution(self, hit: bool, seconds: float):
+        if hit:
+            self._hit_seconds += seconds
+            self._hit_count += 1
+        else:
+            self._miss_seconds += seconds
+            self._miss_count += 1
+
+    def stats(self) -> ModelAffinityStats:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0
+        avg_hit_seconds = self._hit_seconds / self._hit_count if self._hit_count > 0 else 0
+        avg_miss_seconds = (
+            self._miss_seconds / self._miss_count if self._miss_count > 0 else 0
+        )
+        load_time_saved = 0.0
+        if self._hit_count > 0 and self._miss_count > 0:
+            load_time_saved = self.hits * max(avg_miss_seconds - avg_hit_seconds, 0)
+        return ModelAffinityStats(
+            hits=self.hits,
+            misses=self.misses,
+            fallbacks=self.fallbacks,
+            hit_rate=hit_rate,
+            avg_hit_seconds=avg_hit_seconds,
+            avg_miss_seconds=avg_miss_seconds,
+            load_time_saved_seconds=load_time_saved,
+        )
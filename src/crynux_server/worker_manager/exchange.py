@@ -1,27 +1,65 @@
+import time
 from collections import deque
-from typing import Deque, Tuple
+from typing import Callable, Deque, List, Optional, Tuple
 
-from anyio import Condition
+from anyio import Event, move_on_after
 from crynux_server.models import TaskInput
 
 from .task import TaskFuture
 
+# accept(task_input, queued_seconds) decides whether the worker takes the task
+TaskFilter = Callable[[TaskInput, float], bool]
+
 
 class TaskExchange(object):
     def __init__(self) -> None:
-        self._condition = Condition()
-        self._task_queue: Deque[Tuple[TaskInput, TaskFuture]] = deque()
+        self._changed = Event()
+        self._task_queue: Deque[Tuple[TaskInput, TaskFuture, float]] = deque()
+
+    # Wake all the waiting workers to check the queue again,
+    # when the queue or the tasks the workers accept are changed
+    def wake(self):
+        self._changed.set()
+        self._changed = Event()
 
     async def send_task(self, task_input: TaskInput):
         task_result = TaskFuture()
-
-        async with self._condition:
-            self._task_queue.append((task_input, task_result))
-            self._condition.notify(1)
+        self._task_queue.append((task_input, task_result, time.monotonic()))
+        # waiting workers may accept different tasks, so wake them all
+        self.wake()
         return task_result
 
-    async def get_task(self) -> Tuple[TaskInput, TaskFuture]:
-        async with self._condition:
-            while len(self._task_queue) == 0:
-                await self._condition.wait()
-            return self._task_queue.popleft()
+    # Get the first queued task accepted by accept
+    # Rejected tasks are checked again every recheck_interval seconds
+    async def get_task(
+        self, accept: Optional[TaskFilter] = None, recheck_interval: float = 1
+    ) -> Tuple[TaskInput, TaskFuture]:
+        while True:
+            now = time.monotonic()
+            for i, (task_input, task_result, queued_at) in enumerate(self._task_queue):
+                if accept is None or accept(task_input, now - queued_at):
+                    del self._task_queue[i]
+                    return task_input, task_result
+            changed = self._changed
+            if len(self._task_queue) == 0:
+                await changed.wait()
+            else:
+                with move_on_after(recheck_interval):
+                    await changed.wait()
+
+    # Remove the queued tasks matched by match, and return them
+    def remove(
+        self, match: Callable[[TaskInput], bool]
+    ) -> List[Tuple[TaskInput, TaskFuture]]:
+        removed: List[Tuple[TaskInput, TaskFuture]] = []
+        remained: Deque[Tuple[TaskInput, TaskFuture, float]] = deque()
+        for task_input, task_result, queued_at in self._task_queue:
+            if match(task_input):
+                removed.append((task_input, task_result))
+            else:
+                remained.append((task_input, task_result, queued_at))
+        self._task_queue = remained
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._task_queue)
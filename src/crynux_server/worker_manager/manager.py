@@ -2,22 +2,206 @@ import json
 import logging
 import os
 import subprocess
+import time
 from contextlib import asynccontextmanager, contextmanager, suppress
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set, Union
+from urllib.parse import urlencode
 
 import psutil
-from anyio import Condition, fail_after, sleep
+from anyio import (Condition, Event, create_memory_object_stream,
+                   create_task_group, fail_after, sleep)
+from pydantic import BaseModel
 
 from crynux_server.config import Config, get_config
-from crynux_server.models import TaskInput
+from crynux_server.models import (DownloadTaskInput, InferenceTaskInput,
+                                  ModelConfig, TaskCancel, TaskInput,
+                                  TaskProgress, WarmupTaskInput)
 
+from .affinity import (MODEL_AFFINITY_MAX_WAIT, ModelAffinityMetrics,
+                       ModelAffinityStats, get_task_model_ids)
+from .error import TaskExecutionError
 from .exchange import TaskExchange
+from .process import wait_process_exit
 from .task import TaskFuture
-from .utils import get_exe_head
+from .utils import get_exe_head, get_node_url
+from .watchdog import WORKER_WATCHDOG_INTERVAL, ProgressHistory
 
 _logger = logging.getLogger(__name__)
 
+# The worker loads models on warmup tasks
+WORKER_FEATURE_WARMUP = "warmup"
+# The worker stops the running task on cancel messages
+WORKER_FEATURE_CANCEL = "cancel"
+# The worker sends progress of the running task
+WORKER_FEATURE_PROGRESS = "progress"
+# The worker runs several download tasks at the same time
+WORKER_FEATURE_PARALLEL_DOWNLOAD = "parallel_download"
+
+# Min seconds between two starts of the worker process of one device,
+# to avoid restarting a crashing worker in a tight loop
+WORKER_RESTART_MIN_INTERVAL = 10
+
+
+class WorkerState(BaseModel):
+    worker_id: int
+    device: Optional[str] = None
+    version: Optional[str] = None
+    # id of the task running on the worker
+    task_id: Optional[str] = None
+    num_tasks: int = 0
+    # ids of the models loaded in the worker
+    resident_models: List[str] = []
+    # optional protocol features supported by the worker
+    features: List[str] = []
+
+
+class WorkerProcessState(BaseModel):
+    device: Optional[str] = None
+    pid: int
+    alive: bool
+    standby: bool = False
+    # times the worker process of the device has been restarted
+    restarts: int = 0
+
+
+class TaskProgressState(BaseModel):
+    task_id: str
+    worker_id: int
+    device: Optional[str] = None
+    phase: Optional[str] = None
+    step: int = 0
+    total: int = 0
+    elapsed_seconds: float
+    # seconds since the last progress of the task
+    stalled_seconds: float
+
+
+class _RunningTask(object):
+    def __init__(self, task_input: TaskInput, future: TaskFuture, hit: bool) -> None:
+        self.task_input = task_input
+        self.future = future
+        self.hit = hit
+        self.start_time = time.monotonic()
+        # set when the worker stops running the task
+        self.stopped = Event()
+
+        self.progress: Optional[TaskProgress] = None
+        self.last_progress_at = self.start_time
+
+    # the phase before the first progress is ""
+    @property
+    def phase(self) -> str:
+        if self.progress is None:
+            return ""
+        return self.progress.phase
+
+
+class _Worker(object):
+    def __init__(
+        self,
+        worker_id: int,
+        version: str,
+        device: Optional[str],
+        features: List[str],
+        download_slots: int = 1,
+    ) -> None:
+        self.worker_id = worker_id
+        self.version = version
+        self.device = device
+        self.features = set(features)
+        self.tasks: Dict[str, _RunningTask] = {}
+        self.num_tasks = 0
+        # set when the worker can take another task
+        self.ready = Event()
+        self.ready.set()
+
+        self.download_slots = 1
+        if WORKER_FEATURE_PARALLEL_DOWNLOAD in self.features:
+            self.download_slots = max(download_slots, 1)
+
+        # messages sent to the worker besides tasks, e.g. cancel
+        self.control_sender, self.control_receiver = create_memory_object_stream(
+            10, item_type=dict
+        )
+
+        self.resident_models: Set[str] = set()
+        # whether the worker reports its resident models,
+        # otherwise the models of its last inference task are assumed resident
+        self.reports_models = False
+
+        # the worker process is killed by the watchdog
+        self.killed = False
+
+    def is_warm(self, model_ids: List[str]) -> bool:
+        return len(model_ids) > 0 and self.resident_models.issuperset(model_ids)
 
+    # A worker runs one task at a time, except that workers supporting
+    # parallel downloads run up to download_slots download tasks together
+    def can_take(self, task_input: Optional[TaskInput] = None) -> bool:
+        if len(self.tasks) == 0:
+            return True
+        if task_input is not None and not isinstance(task_input.task, DownloadTaskInput):
+            return False
+        return len(self.tasks) < self.download_slots and all(
+            isinstance(task.task_input.task, DownloadTaskInput)
+            for task in self.tasks.values()
+        )
+
+    def update_ready(self):
+        if self.can_take():
+            self.ready.set()
+        elif self.ready.is_set():
+            self.ready = Event()
+
+    def state(self) -> WorkerState:
+        task_id = None
+        if len(self.tasks) > 0:
+            task_id = next(iter(self.tasks))
+        return WorkerState(
+            worker_id=self.worker_id,
+            device=self.device,
+            version=self.version,
+            task_id=task_id,
+            num_tasks=self.num_tasks,
+            resident_models=sorted(self.resident_models),
+            features=sorted(self.features),
+        )
+
+
+def _worker_pid_file(worker_pid_file: str, index: Union[int, str]) -> str:
+    if index == 0:
+        return worker_pid_file
+    root, ext = os.path.splitext(worker_pid_file)
+    return f"{root}_{index}{ext}"
+
+
+class _WorkerProcess(object):
+    def __init__(
+        self,
+        device: Optional[str],
+        pid_file: str,
+        process: subprocess.Popen,
+        standby: bool = False,
+    ) -> None:
+        self.device = device
+        self.pid_file = pid_file
+        self.process = process
+        self.standby = standby
+        self.restarts = 0
+        self.started_at = time.monotonic()
+
+    def state(self) -> WorkerProcessState:
+        return WorkerProcessState(
+            device=self.device,
+            pid=self.process.pid,
+            alive=self.process.poll() is None,
+            standby=self.standby,
+            restarts=self.restarts,
+        )
+
+
+# Supervise the worker processes, one for each configured device
+# Tasks are dispatched to the first ready worker
 class WorkerManager(object):
     def __init__(self, config: Optional[Config] = None) -> None:
         if config is None:
@@ -27,18 +211,40 @@ class WorkerManager(object):
         self._exchange = TaskExchange()
 
         self._next_worker_id = 1
-        self._task_futures: Dict[str, TaskFuture] = {}
-        self._current_worker_id = 0
+        self._workers: Dict[int, _Worker] = {}
 
-        self._worker_process: Optional[subprocess.Popen] = None
+        self._worker_processes: List[_WorkerProcess] = []
+        self._standby: Optional[_WorkerProcess] = None
+        self._standby_promoted = Event()
 
-        self._version: Optional[str] = None
+        self._worker_args: List[str] = []
+        self._worker_envs: Dict[str, str] = {}
+        self._worker_pid_file = ""
 
         self._connect_condition = Condition()
 
+        self.model_affinity_max_wait: float = MODEL_AFFINITY_MAX_WAIT
+        self._affinity_metrics = ModelAffinityMetrics()
+
+        self.progress_history = ProgressHistory()
+
     @property
-    def version(self):
-        return self._version
+    def version(self) -> Optional[str]:
+        for worker in self._workers.values():
+            return worker.version
+        return None
+
+    @property
+    def download_concurrency(self) -> int:
+        if self.config.task_config is not None:
+            return self.config.task_config.download_concurrency
+        return 1
+
+    @property
+    def devices(self) -> List[Optional[str]]:
+        if self.config.task_config is not None and len(self.config.task_config.worker_devices) > 0:
+            return list(self.config.task_config.worker_devices)
+        return [None]
 
     def _kill_process_tree(self, pid: int):
         try:
@@ -72,6 +278,14 @@ class WorkerManager(object):
             self._kill_process_tree(pid)
             self._remove_worker_pid_file(worker_pid_file)
 
+    def _kill_worker_processes(self):
+        for p in self._worker_processes:
+            self._kill_process_tree(p.process.pid)
+        self._worker_processes = []
+        if self._standby is not None:
+            self._kill_process_tree(self._standby.process.pid)
+            self._standby = None
+
     @contextmanager
     def start(self):
         if self.config.task_config is not None:
@@ -101,7 +315,6 @@ class WorkerManager(object):
                 "cw_data_dir__models__huggingface": hf_cache_dir,
                 "cw_data_dir__models__external": external_cache_dir,
                 "cw_output_dir": output_dir,
-                "cw_pid_file": worker_pid_file,
                 "cw_worker_url": cw_worker_url,
             }
         )
@@ -118,79 +331,281 @@ class WorkerManager(object):
         ):
             envs["cw_proxy"] = self.config.task_config.proxy.model_dump_json()
 
-        node_url = f"ws://127.0.0.1:{self.config.server_port}/manager/v1/worker/"
-        envs["cw_node_url"] = node_url
-
         log_config = {"dir": self.config.log.dir, "level": self.config.log.level}
         envs["cw_log"] = json.dumps(log_config)
 
-        self._clear_old_worker_process(worker_pid_file)
+        self._worker_args = args
+        self._worker_envs = envs
+        self._worker_pid_file = worker_pid_file
+
+        try:
+            for index, device in enumerate(self.devices):
+                self._worker_processes.append(self._spawn_worker(index, device))
+            if self.config.task_config is not None and self.config.task_config.standby_worker:
+                self._standby = self._spawn_standby()
+        except BaseException:
+            self._kill_worker_processes()
+            raise
+
+        try:
+            yield
+        finally:
+            self._kill_worker_processes()
+
+    # The envs which tell the worker process its device and how to connect to the node
+    def _slot_envs(self, index: int, device: Optional[str]) -> Dict[str, str]:
+        node_url = get_node_url(self.config)
+        envs = {"cw_pid_file": _worker_pid_file(self._worker_pid_file, index)}
+        if device is None:
+            envs["cw_node_url"] = node_url
+        else:
+            # pin the worker to the device, the device in url tells
+            # the node which worker is connected
+            envs["CUDA_VISIBLE_DEVICES"] = device
+            envs["cw_node_url"] = f"{node_url}?{urlencode({'device': device})}"
+        return envs
+
+    def _spawn_worker(self, index: int, device: Optional[str]) -> _WorkerProcess:
+        slot_envs = self._slot_envs(index, device)
+        pid_file = slot_envs["cw_pid_file"]
+        self._clear_old_worker_process(pid_file)
+
+        worker_envs = self._worker_envs.copy()
+        worker_envs.update(slot_envs)
+        p = subprocess.Popen(args=self._worker_args, env=worker_envs)
+        worker_process = _WorkerProcess(device=device, pid_file=pid_file, process=p)
 
-        p = subprocess.Popen(args=args, env=envs)
-        self._worker_process = p
-        
         # Check if process is still alive immediately after start
         if p.poll() is not None:
             # Process has already terminated
             raise RuntimeError(f"Worker process failed to start. Exit code: {p.returncode}")
-        
+        return worker_process
+
+    # The standby worker imports the libraries and waits for a JSON line of the envs
+    # from _slot_envs on its stdin, then it connects to the node as a normal worker
+    def _spawn_standby(self) -> _WorkerProcess:
+        pid_file = _worker_pid_file(self._worker_pid_file, "standby")
+        self._clear_old_worker_process(pid_file)
+
+        worker_envs = self._worker_envs.copy()
+        worker_envs["cw_pid_file"] = pid_file
+        worker_envs["cw_standby"] = "1"
+        p = subprocess.Popen(args=self._worker_args, env=worker_envs, stdin=subprocess.PIPE)
+        return _WorkerProcess(device=None, pid_file=pid_file, process=p, standby=True)
+
+    # Take the standby worker as the worker of the device, return None if there is
+    # no live standby worker
+    def _promote_standby(self, index: int, device: Optional[str]) -> Optional[_WorkerProcess]:
+        standby = self._standby
+        if standby is None or standby.process.poll() is not None:
+            return None
+        self._standby = None
+
+        slot_envs = self._slot_envs(index, device)
+        p = standby.process
+        assert p.stdin is not None
         try:
-            yield
-        finally:
-            if self._worker_process is not None:
-                self._kill_process_tree(self._worker_process.pid)
-                self._worker_process = None
+            p.stdin.write((json.dumps(slot_envs) + "\n").encode("utf-8"))
+            p.stdin.close()
+        except OSError as e:
+            _logger.error(f"Cannot promote the standby worker: {e}")
+            self._kill_process_tree(p.pid)
+            return None
+        with suppress(FileNotFoundError):
+            os.replace(standby.pid_file, slot_envs["cw_pid_file"])
+        self._standby_promoted.set()
+        return _WorkerProcess(device=device, pid_file=slot_envs["cw_pid_file"], process=p)
+
+    async def _supervise_worker(self, index: int):
+        restarts = 0
+        while True:
+            worker_process = self._worker_processes[index]
+            device = worker_process.device
+            exit_code = await wait_process_exit(worker_process.process)
+            _logger.error(f"Worker process of device {device} exits with code {exit_code}")
+            self._remove_worker_pid_file(worker_process.pid_file)
+            restarts += 1
+
+            promoted = self._promote_standby(index, device)
+            if promoted is not None:
+                _logger.info(f"Standby worker {promoted.process.pid} takes over device {device}")
+                promoted.restarts = restarts
+                self._worker_processes[index] = promoted
+                continue
+
+            await sleep(worker_process.started_at + WORKER_RESTART_MIN_INTERVAL - time.monotonic())
+            while True:
+                try:
+                    new_process = self._spawn_worker(index, device)
+                    break
+                except RuntimeError as e:
+                    _logger.error(str(e))
+                    await sleep(WORKER_RESTART_MIN_INTERVAL)
+            _logger.info(f"Worker process of device {device} restarts")
+            new_process.restarts = restarts
+            self._worker_processes[index] = new_process
+
+    async def _supervise_standby(self):
+        while True:
+            standby = self._standby
+            if standby is None:
+                self._standby = self._spawn_standby()
+                continue
+
+            self._standby_promoted = Event()
+            async with create_task_group() as tg:
+
+                async def wait_exit():
+                    await wait_process_exit(standby.process)
+                    tg.cancel_scope.cancel()
+
+                async def wait_promoted():
+                    await self._standby_promoted.wait()
+                    tg.cancel_scope.cancel()
+
+                tg.start_soon(wait_exit)
+                tg.start_soon(wait_promoted)
+
+            if self._standby is standby:
+                # the standby worker exits before it is promoted
+                _logger.error(
+                    f"Standby worker exits with code {standby.process.returncode}"
+                )
+                self._standby = None
+                self._remove_worker_pid_file(standby.pid_file)
+                await sleep(standby.started_at + WORKER_RESTART_MIN_INTERVAL - time.monotonic())
+
+    # Watch the worker processes, and restart the exited ones
+    # The standby worker takes over at once if it is enabled,
+    # otherwise a new worker process is started
+    async def supervise(self):
+        async with create_task_group() as tg:
+            for index in range(len(self._worker_processes)):
+                tg.start_soon(self._supervise_worker, index)
+            if self._standby is not None:
+                tg.start_soon(self._supervise_standby)
+            tg.start_soon(self.watchdog)
+
+    # Kill the workers whose running inference task has no progress for longer than
+    # the stall threshold of its phase, they are restarted by the supervisor
+    # Only workers which send progress are watched. Model downloads are not watched,
+    # a large download may send no progress for a long time and killing the worker
+    # would fail every task running on it
+    async def watchdog(self, interval: float = WORKER_WATCHDOG_INTERVAL):
+        while True:
+            await sleep(interval)
+            self._check_stalled_workers()
+
+    def _check_stalled_workers(self):
+        now = time.monotonic()
+        for worker in list(self._workers.values()):
+            if worker.killed or WORKER_FEATURE_PROGRESS not in worker.features:
+                continue
+            for task_id, task in worker.tasks.items():
+                if task.task_input.task.task_name != "inference":
+                    continue
+                stalled = now - task.last_progress_at
+                if stalled <= self.progress_history.stall_threshold(task.phase):
+                    continue
+
+                msg = f"Worker {worker.worker_id} has no progress of task {task_id} in phase {task.phase} for {stalled:.0f}s"
+                _logger.error(msg + ", kill the worker")
+                if not task.future.done():
+                    task.future.set_error(TaskExecutionError(msg))
+                worker.killed = True
+                self._kill_worker_process(worker.device)
+                break
+
+    def _kill_worker_process(self, device: Optional[str]):
+        for p in self._worker_processes:
+            if p.device == device:
+                self._kill_process_tree(p.process.pid)
 
     def is_worker_process_alive(self) -> bool:
         """
-        Check if the worker process is still alive.
-        Returns True if process is running, False otherwise.
+        Check if all the worker processes are still alive.
+        Returns True if processes are running, False otherwise.
         """
-        if self._worker_process is None:
+        if len(self._worker_processes) == 0:
             return False
-        return self._worker_process.poll() is None
+        return all(p.process.poll() is None for p in self._worker_processes)
 
     def get_worker_process_exit_code(self) -> Optional[int]:
         """
-        Get the exit code of the worker process.
-        Returns None if process is still running, otherwise returns the exit code.
+        Get the exit code of the first exited worker process.
+        Returns None if all processes are still running.
         """
-        if self._worker_process is None:
-            return None
-        return self._worker_process.poll()
-
-    async def connect(self, version: str) -> int:
+        for p in self._worker_processes:
+            exit_code = p.process.poll()
+            if exit_code is not None:
+                return exit_code
+        return None
+
+    def worker_process_states(self) -> List[WorkerProcessState]:
+        processes = list(self._worker_processes)
+        if self._standby is not None:
+            processes.append(self._standby)
+        return [p.state() for p in processes]
+
+    def worker_states(self) -> List[WorkerState]:
+        return [worker.state() for worker in self._workers.values()]
+
+    def _get_worker(self, worker_id: int) -> _Worker:
+        assert worker_id in self._workers, f"Worker {worker_id} is disconnected"
+        return self._workers[worker_id]
+
+    async def connect(
+        self,
+        version: str,
+        device: Optional[str] = None,
+        features: Optional[List[str]] = None,
+    ) -> int:
         worker_id = self._next_worker_id
         self._next_worker_id += 1
+        if features is None:
+            features = []
         async with self._connect_condition:
-            self._current_worker_id = worker_id
-            self._version = version
+            self._workers[worker_id] = _Worker(
+                worker_id=worker_id,
+                version=version,
+                device=device,
+                features=features,
+                download_slots=self.download_concurrency,
+            )
             self._connect_condition.notify_all()
         return worker_id
 
     async def disconnect(self, worker_id: int):
-        assert (
-            worker_id == self._current_worker_id
-        ), f"Worker {worker_id} is disconnected"
+        worker = self._get_worker(worker_id)
         # cancel the worker's running task
-        for task_result in self._task_futures.values():
-            if not task_result.done():
-                task_result.cancel()
-        self._task_futures.clear()
+        for task in worker.tasks.values():
+            if not task.future.done():
+                task.future.cancel()
+            task.stopped.set()
+        worker.tasks.clear()
+        worker.ready.set()
+        worker.control_sender.close()
+        worker.control_receiver.close()
 
         async with self._connect_condition:
-            self._current_worker_id = 0
-            self._version = None
+            del self._workers[worker_id]
             self._connect_condition.notify_all()
 
+        # queued warmup tasks cannot be taken by the remaining workers
+        if not self.supports(WORKER_FEATURE_WARMUP):
+            for _, fut in self._exchange.remove(
+                lambda task_input: isinstance(task_input.task, WarmupTaskInput)
+            ):
+                fut.cancel()
+
     async def is_connected(self) -> bool:
-        return self._current_worker_id > 0
+        return len(self._workers) > 0
 
     @asynccontextmanager
     async def wait_connected(self, timeout: Optional[float] = None):
         with fail_after(timeout):
             async with self._connect_condition:
-                while self._current_worker_id == 0:
+                while len(self._workers) == 0:
                     await self._connect_condition.wait()
                 yield
 
@@ -203,30 +618,176 @@ class WorkerManager(object):
     async def send_task(self, input: TaskInput):
         return await self._exchange.send_task(input)
 
+    # whether any connected worker supports the feature
+    def supports(self, feature: str) -> bool:
+        return any(feature in worker.features for worker in self._workers.values())
+
+    # Send the warmup task when it is useful, return None if it is not sent
+    # The warmup task is skipped when a worker has the models loaded already,
+    # or no worker supports it
+    async def send_warmup(self, input: TaskInput) -> Optional[TaskFuture]:
+        assert isinstance(input.task, WarmupTaskInput)
+        if not self.supports(WORKER_FEATURE_WARMUP):
+            return None
+        model_ids = get_task_model_ids(input)
+        if len(model_ids) == 0 or any(
+            worker.is_warm(model_ids) for worker in self._workers.values()
+        ):
+            return None
+        return await self._exchange.send_task(input)
+
+    # Cancel the task, whether it is queued or running in a worker
+    # Waiters of the task are released at once, and this method returns when
+    # the workers have stopped the task, i.e. they are free for the next task
+    # Workers not supporting cancel stop the task only when it is finished
+    async def cancel_task(self, task_id: str):
+        for _, fut in self._exchange.remove(
+            lambda task_input: task_input.task.task_id == task_id
+        ):
+            fut.cancel()
+
+        stopped: List[Event] = []
+        for worker in list(self._workers.values()):
+            if task_id not in worker.tasks:
+                continue
+            task = worker.tasks[task_id]
+            if not task.future.done():
+                task.future.cancel()
+            if WORKER_FEATURE_CANCEL in worker.features:
+                msg = {"cancel": TaskCancel(task_id=task_id).model_dump()}
+                await worker.control_sender.send(msg)
+                _logger.info(f"Cancel task {task_id} in worker {worker.worker_id}")
+            stopped.append(task.stopped)
+
+        for event in stopped:
+            await event.wait()
+
+    async def get_control_message(self, worker_id: int) -> dict:
+        worker = self._get_worker(worker_id)
+        return await worker.control_receiver.receive()
+
+    def model_affinity_stats(self) -> ModelAffinityStats:
+        return self._affinity_metrics.stats()
+
+    # Tasks are preferred to be run on the worker which has the task models loaded
+    # A cold worker takes the task only if no other worker has the models loaded,
+    # or the task has waited for the warm worker longer than model_affinity_max_wait
+    def _accept_task(self, worker: _Worker, task_input: TaskInput, waited: float) -> bool:
+        if isinstance(task_input.task, WarmupTaskInput) and (
+            WORKER_FEATURE_WARMUP not in worker.features
+        ):
+            return False
+        model_ids = get_task_model_ids(task_input)
+        if len(model_ids) == 0 or worker.is_warm(model_ids):
+            return True
+        if waited >= self.model_affinity_max_wait:
+            return True
+        return not any(
+            w.is_warm(model_ids) for w in self._workers.values() if w is not worker
+        )
+
+    # The worker only gets the next task when it can take one (see _Worker.can_take),
+    # so a queued task goes to the first ready worker which accepts it
     async def get_task(self, worker_id: int):
         await sleep(0)
-        assert (
-            worker_id == self._current_worker_id
-        ), f"Worker {worker_id} is disconnected"
-        task_input, task_future = await self._exchange.get_task()
+        worker = self._get_worker(worker_id)
+        await worker.ready.wait()
+        worker = self._get_worker(worker_id)
+
+        def accept(task_input: TaskInput, waited: float) -> bool:
+            return worker.can_take(task_input) and self._accept_task(
+                worker, task_input, waited
+            )
+
+        # recheck rejected tasks in time to fall back after the max wait
+        recheck_interval = min(max(self.model_affinity_max_wait, 0.01), 1)
+        task_input, task_future = await self._exchange.get_task(
+            accept, recheck_interval=recheck_interval
+        )
         task_id_commitment = task_input.task.task_id
-        self._task_futures[task_id_commitment] = task_future
+
+        model_ids = get_task_model_ids(task_input)
+        hit = worker.is_warm(model_ids)
+        if isinstance(task_input.task, InferenceTaskInput) and len(model_ids) > 0:
+            fallback = not hit and any(
+                w.is_warm(model_ids) for w in self._workers.values() if w is not worker
+            )
+            self._affinity_metrics.record_dispatch(hit=hit, fallback=fallback)
+
+        worker.tasks[task_id_commitment] = _RunningTask(task_input, task_future, hit)
+        worker.num_tasks += 1
+        worker.update_ready()
 
         return task_input, task_future
 
+    # Update the models loaded in the worker, which are reported after each task
+    def report_resident_models(self, worker_id: int, models: List[ModelConfig]):
+        worker = self._get_worker(worker_id)
+        worker.reports_models = True
+        worker.resident_models = set(model.to_model_id() for model in models)
+
+    def report_progress(self, worker_id: int, progress: TaskProgress):
+        worker = self._get_worker(worker_id)
+        if progress.task_id not in worker.tasks:
+            return
+        task = worker.tasks[progress.task_id]
+        now = time.monotonic()
+        self.progress_history.record(task.phase, now - task.last_progress_at)
+        task.progress = progress
+        task.last_progress_at = now
+
+    def task_progress(self) -> List[TaskProgressState]:
+        now = time.monotonic()
+        res = []
+        for worker in self._workers.values():
+            for task_id, task in worker.tasks.items():
+                state = TaskProgressState(
+                    task_id=task_id,
+                    worker_id=worker.worker_id,
+                    device=worker.device,
+                    elapsed_seconds=now - task.start_time,
+                    stalled_seconds=now - task.last_progress_at,
+                )
+                if task.progress is not None:
+                    state.phase = task.progress.phase
+                    state.step = task.progress.step
+                    state.total = task.progress.total
+                res.append(state)
+        return res
+
+    def _finish_task(self, worker: _Worker, task: _RunningTask):
+        if task.progress is not None and not task.future.failed():
+            self.progress_history.record(
+                task.phase, time.monotonic() - task.last_progress_at
+            )
+        model_ids = get_task_model_ids(task.task_input)
+        if len(model_ids) == 0 or task.future.failed():
+            return
+        if isinstance(task.task_input.task, InferenceTaskInput):
+            self._affinity_metrics.record_execution(
+                hit=task.hit, seconds=time.monotonic() - task.start_time
+            )
+        if not worker.reports_models:
+            worker.resident_models = set(model_ids)
+
     @contextmanager
     def task_future(self, worker_id: int, task_id_commitment: str):
-        assert (
-            worker_id == self._current_worker_id
-        ), f"Worker {worker_id} is disconnected"
-        assert task_id_commitment in self._task_futures, f"No such task future {task_id_commitment}"
+        worker = self._get_worker(worker_id)
+        assert task_id_commitment in worker.tasks, f"No such task future {task_id_commitment}"
 
-        fut = self._task_futures[task_id_commitment]
+        task = worker.tasks[task_id_commitment]
+        fut = task.future
         try:
             yield fut
         finally:
             if fut.done():
-                del self._task_futures[task_id_commitment]
+                del worker.tasks[task_id_commitment]
+                task.stopped.set()
+                self._finish_task(worker, task)
+                worker.update_ready()
+                # the worker may accept the tasks it rejected when busy
+                self._exchange.wake()
+
 
 _default_worker_manager: Optional[WorkerManager] = None
 
@@ -0,0 +1,11 @@
+import subprocess
+
+from anyio import to_thread
+
+
+# Wait for the process to exit and return its exit code
+# The process is waited in a worker thread, so the event loop is not blocked
+async def wait_process_exit(p: subprocess.Popen) -> int:
+    if p.returncode is not None:
+        return p.returncode
+    return await to_thread.run_sync(p.wait, cancellable=True)
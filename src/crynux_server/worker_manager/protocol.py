@@ -0,0 +1,151 @@
+import logging
+from typing import Any, Dict, List, Literal, Optional
+
+import msgpack
+from anyio import Lock
+from pydantic import BaseModel
+
+_logger = logging.getLogger(__name__)
+
+# Messages between the node and the worker are JSON texts by default
+PROTOCOL_JSON = "json"
+# Binary msgpack frames, negotiated by the "msgpack" worker feature
+# Idle connections are kept alive by websocket ping frames instead of empty texts
+PROTOCOL_MSGPACK = "msgpack"
+
+FRAME_VERSION = 1
+
+# Seconds between the websocket ping frames sent to the workers
+WORKER_PING_INTERVAL = 5
+
+
+class Frame(BaseModel):
+    v: int = FRAME_VERSION
+    # sequence number of the frame from its sender
+    id: int
+    # id of the frame this frame answers
+    reply_to: Optional[int] = None
+    type: Literal["task", "control", "result", "progress"]
+    data: Dict[str, Any]
+
+
+# Choose the protocol from the features sent by the worker
+def choose_protocol(features: List[str]) -> str:
+    if PROTOCOL_MSGPACK in features:
+        return PROTOCOL_MSGPACK
+    return PROTOCOL_JSON
+
+
+def encode_frame(frame: Frame) -> bytes:
+    # the data is already plain, so skip model_dump which copies it deeply
+    obj = {
+        "v": frame.v,
+        "id": frame.id,
+        "reply_to": frame.reply_to,
+        "type": frame.type,
+        "data": frame.data,
+    }
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def decode_frame(data: bytes) -> Frame:
+    frame = Frame.model_validate(msgpack.unpackb(data, raw=False))
+    if frame.v != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {frame.v}")
+    return frame
+
+
+# Send and receive the worker messages over the websocket in JSON texts
+class WorkerChannel(object):
+    protocol = PROTOCOL_JSON
+    # send empty texts to keep the idle connection alive
+    heartbeat = True
+
+    def __init__(self, websocket) -> None:
+        self.websocket = websocket
+        self._send_lock = Lock()
+
+    # return the request id of the sent message, if the protocol has one
+    async def send(self, type: str, data: Dict[str, Any]) -> Optional[int]:
+        async with self._send_lock:
+            await self.websocket.send_json(data)
+        return None
+
+    async def receive(self) -> Dict[str, Any]:
+        return await self.websocket.receive_json()
+
+    async def ping(self):
+        async with self._send_lock:
+            await self.websocket.send_text("")
+
+
+# Send and receive the worker messages over the websocket in msgpack frames
+class FrameWorkerChannel(WorkerChannel):
+    protocol = PROTOCOL_MSGPACK
+    heartbeat = False
+
+    def __init__(self, websocket) -> None:
+        super().__init__(websocket)
+        self._next_id = 1
+        self.last_received_id: Optional[int] = None
+        # ids of the task frames waiting for their result frames, to their task ids
+        self.pending_requests: Dict[int, str] = {}
+        # frames the worker sent but never reached the node
+        self.missing_frames = 0
+
+    async def send(self, type: str, data: Dict[str, Any]) -> Optional[int]:
+        async with self._send_lock:
+            frame = Frame(id=self._next_id, type=type, data=data)  # type: ignore
+            self._next_id += 1
+            if type == "task":
+                self.pending_requests[frame.id] = data["task"]["task_id"]
+            await self.websocket.send_bytes(encode_frame(frame))
+        return frame.id
+
+    # Frames from the worker are numbered one by one, a gap means lost frames
+    def _check_sequence(self, frame: Frame):
+        if self.last_received_id is not None and frame.id > self.last_received_id + 1:
+            missing = frame.id - self.last_received_id - 1
+            self.missing_frames += missing
+            _logger.warning(
+                f"{missing} frames from the worker are missing before frame {frame.id}"
+            )
+        self.last_received_id = frame.id
+
+    # A result frame answers the task frame of reply_to, so the result may leave out
+    # its task id, and a result of another task is reported
+    def _correlate_reply(self, frame: Frame):
+        if frame.reply_to is None:
+            # older workers do not reply to frames, forget the requests of the task
+            task_id = frame.data.get("task_id_commitment")
+            for request_id, request_task_id in list(self.pending_requests.items()):
+                if request_task_id == task_id:
+                    del self.pending_requests[request_id]
+            return
+        task_id = self.pending_requests.pop(frame.reply_to, None)
+        if task_id is None:
+            _logger.warning(f"Frame {frame.id} replies to unknown frame {frame.reply_to}")
+        elif "task_id_commitment" not in frame.data:
+            frame.data["task_id_commitment"] = task_id
+        elif task_id != frame.data["task_id_commitment"]:
+            _logger.warning(
+                f"Frame {frame.id} replies to frame {frame.reply_to} of task {task_id}, "
+                f"but it is the result of task {frame.data['task_id_commitment']}"
+            )
+
+    async def receive(self) -> Dict[str, Any]:
+        frame = decode_frame(await self.websocket.receive_bytes())
+        self._check_sequence(frame)
+        if frame.type == "result":
+            self._correlate_reply(frame)
+        return frame.data
+
+    async def ping(self):
+        # the connection is kept alive by websocket ping frames
+        pass
+
+
+def create_worker_channel(websocket, protocol: str) -> WorkerChannel:
+    if protocol == PROTOCOL_MSGPACK:
+        return FrameWorkerChannel(websocket)
+    return WorkerChannel(websocket)
@@ -1,33 +1,71 @@
-import asyncio
-from typing import Any, Callable
+from typing import Any, Callable, List, Optional, Type, Union
+
+from anyio import Event, get_cancelled_exc_class
 
 from .error import TaskCancelled
 
+
+# Result of a task sent to the worker
+# The future is cancelled when the caller waiting for the result is cancelled
 class TaskFuture(object):
     def __init__(self) -> None:
-        loop = asyncio.get_running_loop()
-        self._future = loop.create_future()
+        self._done = Event()
+        self._result: Any = None
+        self._error: Optional[Union[BaseException, Type[BaseException]]] = None
+        self._cancelled = False
+        self._callbacks: List[Callable[["TaskFuture"], None]] = []
+
+    def _finish(self):
+        self._done.set()
+        callbacks = self._callbacks
+        self._callbacks = []
+        for callback in callbacks:
+            callback(self)
 
     def set_result(self, result):
-        if not self._future.cancelled():
-            self._future.set_result(result)
+        if not self.done():
+            self._result = result
+            self._finish()
 
     def set_error(self, exc: Exception):
-        if not self._future.cancelled():
-            self._future.set_exception(exc)
+        if not self.done():
+            self._error = exc
+            self._finish()
 
     def cancel(self):
-        if not self._future.cancelled():
-            self._future.set_exception(TaskCancelled)
+        if not self.done():
+            self._error = TaskCancelled
+            self._finish()
 
-    def add_done_callback(self, callback: Callable[[asyncio.Future[Any]], None]):
-        self._future.add_done_callback(callback)
+    def add_done_callback(self, callback: Callable[["TaskFuture"], None]):
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
 
     async def get(self):
-        return await self._future
+        try:
+            await self._done.wait()
+        except get_cancelled_exc_class():
+            if not self.done():
+                self._cancelled = True
+                self._finish()
+            raise
+        if self._cancelled:
+            raise get_cancelled_exc_class()()
+        if self._error is not None:
+            raise self._error
+        return self._result
 
     def done(self):
-        return self._future.done()
-    
+        return self._done.is_set()
+
     def cancelled(self):
-        return self._future.cancelled()
+        return self._cancelled
+
+    def exception(self) -> Optional[Union[BaseException, Type[BaseException]]]:
+        return self._error
+
+    # whether the done task is failed or cancelled
+    def failed(self) -> bool:
+        return self._cancelled or self._error is not None
@@ -1,8 +1,12 @@
 import logging
 import os
 import platform
+import socket
 import sys
-from typing import List
+from typing import List, Optional
+from urllib.parse import quote
+
+from crynux_server.config import Config
 
 _logger = logging.getLogger(__name__)
 
@@ -75,3 +79,23 @@ def get_exe_head(script_dir: str = "") -> List[str]:
 
     else:
         return _script_cmd_head(script_dir)
+
+
+# Path of the unix socket serving the worker endpoint, None if it is disabled
+def get_worker_socket(config: Config) -> Optional[str]:
+    if config.task_config is None or not config.task_config.worker_socket:
+        return None
+    if not hasattr(socket, "AF_UNIX") or platform.system() == "Windows":
+        _logger.warning("Unix sockets are not supported, workers connect by tcp")
+        return None
+    return os.path.abspath(config.task_config.worker_socket)
+
+
+# The url for workers to connect to the node
+# The socket path is quoted as the host of ws+unix urls
+def get_node_url(config: Config) -> str:
+    path = "/manager/v1/worker/"
+    worker_socket = get_worker_socket(config)
+    if worker_socket is not None:
+        return f"ws+unix://{quote(worker_socket, safe='')}{path}"
+    return f"ws://127.0.0.1:{config.server_port}{path}"
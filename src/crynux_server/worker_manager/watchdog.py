@@ -0,0 +1,40 @@
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+# Seconds without progress before a worker is taken as hung,
+# when there is no history of the phase yet
+WORKER_STALL_DEFAULT_SECONDS = 600
+# The stall threshold is never lower than this
+WORKER_STALL_MIN_SECONDS = 120
+# The stall threshold is this times the longest recent gap between progress frames
+WORKER_STALL_FACTOR = 4
+# Gaps kept for each phase
+WORKER_STALL_HISTORY_SIZE = 100
+
+# Seconds between two checks of the watchdog
+WORKER_WATCHDOG_INTERVAL = 5
+
+
+# Gaps between the progress frames of each task phase, which scale the
+# threshold for a worker to be taken as hung
+class ProgressHistory(object):
+    def __init__(
+        self,
+        default_threshold: float = WORKER_STALL_DEFAULT_SECONDS,
+        min_threshold: float = WORKER_STALL_MIN_SECONDS,
+        factor: float = WORKER_STALL_FACTOR,
+        size: int = WORKER_STALL_HISTORY_SIZE,
+    ) -> None:
+        self.default_threshold = default_threshold
+        self.min_threshold = min_threshold
+        self.factor = factor
+        self._gaps: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=size))
+
+    def record(self, phase: str, gap: float):
+        self._gaps[phase].append(gap)
+
+    def stall_threshold(self, phase: str) -> float:
+        gaps = self._gaps.get(phase)
+        if gaps is None or len(gaps) == 0:
+            return self.default_threshold
+        return max(self.min_threshold, self.factor * max(gaps))
@@ -0,0 +1,57 @@
+"""
+Compare hashing task images one by one on the event loop with the worker processes.
+
+Run from the repository root:
+
+    python tests/benchmark/image_hash_benchmark.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import anyio
+
+sys.path.insert(0, os.path.abspath("src"))
+
+from crynux_server.task.utils import get_image_hash, get_image_hashes  # noqa: E402
+
+
+async def benchmark(image: str, num_images: int, rounds: int = 5):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for i in range(num_images):
+            dst = os.path.join(tmp_dir, f"{i}.png")
+            shutil.copyfile(image, dst)
+            files.append(dst)
+
+        # warm up the worker processes
+        await get_image_hashes(files)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            inline_hashes = [get_image_hash(f) for f in files]
+        inline_cost = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            pool_hashes = await get_image_hashes(files)
+        pool_cost = (time.perf_counter() - start) / rounds
+
+        assert inline_hashes == pool_hashes
+        print(
+            f"{num_images:>3} images: inline {inline_cost * 1000:8.1f} ms, "
+            f"pool {pool_cost * 1000:8.1f} ms, speedup {inline_cost / pool_cost:.2f}x"
+        )
+
+
+async def main():
+    image = "test.png"
+    for num_images in [1, 4, 16]:
+        await benchmark(image, num_images)
+
+
+if __name__ == "__main__":
+    anyio.run(main)
@@ -0,0 +1,142 @@
+"""
+Compare the relay connection pools: one default client shared by all the calls,
+and the tuned control and upload pools of WebRelay.
+
+A stub relay in another process answers the now calls at once and accepts the result part uploads.
+Control calls are sent concurrently while result parts are being uploaded,
+and their requests per second and p99 latency are reported.
+
+Run from the repository root:
+
+    python tests/benchmark/relay_pool_benchmark.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import anyio
+import httpx
+from anyio import create_task_group, sleep
+from fastapi import FastAPI, Request
+from starlette.requests import ClientDisconnect
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HyperConfig
+
+sys.path.insert(0, os.path.abspath("src"))
+
+from crynux_server.config import RelayPoolConfig  # noqa: E402
+from crynux_server.relay import WebRelay  # noqa: E402
+from crynux_server.relay.pool import http2_available  # noqa: E402
+
+PORT = 17413
+PRIVKEY = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+
+CONTROL_CALLS = 2000
+CONTROL_CONCURRENCY = 10
+UPLOAD_CONCURRENCY = 4
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+
+
+def make_stub_relay() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/v1/now")
+    async def now():
+        return {"data": {"now": int(time.time())}}
+
+    @app.put("/v1/inference_tasks/{task_id}/results/uploads/{index}")
+    async def upload_part(task_id: str, index: int, request: Request):
+        try:
+            async for _ in request.stream():
+                pass
+        except ClientDisconnect:
+            pass
+        return {"message": "success"}
+
+    return app
+
+
+async def run_control_calls(relay: WebRelay, name: str):
+    part = os.urandom(UPLOAD_PART_SIZE)
+    uploaded = 0
+    costs = []
+
+    async def upload():
+        nonlocal uploaded
+        while True:
+            await relay.upload_task_result_part(bytes([1] * 32), 0, 0, part)
+            uploaded += 1
+
+    async def control(count: int):
+        for _ in range(count):
+            start = time.perf_counter()
+            await relay.now()
+            costs.append(time.perf_counter() - start)
+
+    async with create_task_group() as upload_tg:
+        for _ in range(UPLOAD_CONCURRENCY):
+            upload_tg.start_soon(upload)
+        await sleep(0.5)
+
+        start = time.perf_counter()
+        async with create_task_group() as tg:
+            for _ in range(CONTROL_CONCURRENCY):
+                tg.start_soon(control, CONTROL_CALLS // CONTROL_CONCURRENCY)
+        duration = time.perf_counter() - start
+        upload_tg.cancel_scope.cancel()
+
+    costs.sort()
+    print(
+        f"{name:8s} {len(costs) / duration:8.1f} req/s, "
+        f"p50 {costs[len(costs) // 2] * 1e3:6.1f} ms, "
+        f"p99 {costs[int(len(costs) * 0.99)] * 1e3:6.1f} ms, "
+        f"{uploaded} parts uploaded"
+    )
+
+
+def run_stub_relay():
+    hyper_config = HyperConfig()
+    hyper_config.bind = [f"127.0.0.1:{PORT}"]
+    hyper_config.loglevel = "WARNING"
+    asyncio.run(serve(make_stub_relay(), hyper_config))  # type: ignore
+
+
+async def main():
+    base_url = f"http://127.0.0.1:{PORT}"
+
+    # the pool before: one client with the default limits for all the calls
+    relay = WebRelay(base_url=base_url, privkey=PRIVKEY)
+    await relay.client.aclose()
+    await relay.upload_client.aclose()
+    relay.client = httpx.AsyncClient(base_url=base_url, timeout=30)
+    relay.upload_client = relay.client
+    try:
+        await run_control_calls(relay, "shared")
+    finally:
+        await relay.client.aclose()
+
+    # hypercorn only speaks HTTP/2 over tls or with an upgrade, so the stub
+    # relay is called over HTTP/1.1 here
+    relay = WebRelay(
+        base_url=base_url, privkey=PRIVKEY, pool_config=RelayPoolConfig(http2=False)
+    )
+    try:
+        await run_control_calls(relay, "tuned")
+    finally:
+        await relay.close()
+
+    if not http2_available():
+        print("h2 is not installed, HTTP/2 is disabled in the relay pools")
+
+
+if __name__ == "__main__":
+    server = multiprocessing.Process(target=run_stub_relay, daemon=True)
+    server.start()
+    time.sleep(1)
+    try:
+        anyio.run(main)
+    finally:
+        server.terminate()
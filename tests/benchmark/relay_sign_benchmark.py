@@ -0,0 +1,99 @@
+"""
+Compare the relay request signing: the eth_account signer before,
+the pure python and the libsecp256k1 backends of Signer,
+and the signatures reused within the same second.
+All of them must give the same signatures.
+
+Run from the repository root:
+
+    python tests/benchmark/relay_sign_benchmark.py
+"""
+
+import json
+import os
+import sys
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+sys.path.insert(0, os.path.abspath("src"))
+
+from crynux_server.relay.sign import Signer, native_signing_available  # noqa: E402
+from crynux_server.utils import sort_dict  # noqa: E402
+
+PRIVKEY = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+TIMESTAMP = 1692446475
+
+
+def make_inputs(count: int):
+    return [
+        {
+            "task_id_commitment": "0x" + os.urandom(32).hex(),
+            "task_error": 0,
+            "score": os.urandom(8).hex(),
+            "index": str(i),
+        }
+        for i in range(count)
+    ]
+
+
+def old_sign(account, input) -> str:
+    input_bytes = json.dumps(
+        sort_dict(input), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    data_hash = Web3.keccak(input_bytes + str(TIMESTAMP).encode("utf-8"))
+    res = bytearray(account.signHash(data_hash).signature)
+    res[-1] -= 27
+    return "0x" + res.hex()
+
+
+def run(name: str, sign, inputs, expected=None):
+    start = time.perf_counter()
+    signatures = [sign(input) for input in inputs]
+    cost = (time.perf_counter() - start) / len(inputs)
+    if expected is not None:
+        assert signatures == expected, f"{name} signatures differ"
+    print(f"{name:16s} {cost * 1e6:8.1f} us/signature")
+    return signatures, cost
+
+
+def main():
+    inputs = make_inputs(1000)
+
+    account = Account.from_key(PRIVKEY)
+    expected, base = run("eth_account", lambda input: old_sign(account, input), inputs)
+
+    signer = Signer(PRIVKEY, native=False)
+    _, cost = run(
+        "signer (python)",
+        lambda input: signer.sign(input, timestamp=TIMESTAMP)[1],
+        inputs,
+        expected,
+    )
+    print(f"{'':16s} {base / cost:8.1f}x")
+
+    if native_signing_available():
+        signer = Signer(PRIVKEY, native=True)
+        _, cost = run(
+            "signer (native)",
+            lambda input: signer.sign(input, timestamp=TIMESTAMP)[1],
+            inputs,
+            expected,
+        )
+        print(f"{'':16s} {base / cost:8.1f}x")
+    else:
+        print("coincurve is not installed, skip the native backend")
+
+    # the same inputs are signed again in the same second
+    _, cost = run(
+        "signer (reused)",
+        lambda input: signer.sign(input, timestamp=TIMESTAMP)[1],
+        inputs[:200],
+        expected[:200],
+    )
+    print(f"{'':16s} {base / cost:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
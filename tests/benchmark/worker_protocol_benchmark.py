@@ -0,0 +1,141 @@
+"""
+Compare the JSON worker protocol with the msgpack framed protocol:
+the cost and size of one task message, and the CPU used by idle workers.
+
+Run from the repository root:
+
+    python tests/benchmark/worker_protocol_benchmark.py
+"""
+
+import json
+import os
+import sys
+import time
+
+import anyio
+from anyio import EndOfStream, create_memory_object_stream, create_task_group, sleep
+
+sys.path.insert(0, os.path.abspath("src"))
+
+from crynux_server.config import Config, TaskConfig  # noqa: E402
+from crynux_server.models import (InferenceTaskInput, ModelConfig,  # noqa: E402
+                                  TaskInput, TaskType)
+from crynux_server.server.v1.worker import worker as worker_endpoint  # noqa: E402
+from crynux_server.worker_manager import WorkerManager  # noqa: E402
+from crynux_server.worker_manager.protocol import (Frame, decode_frame,  # noqa: E402
+                                                   encode_frame)
+
+
+class MemoryWebSocket(object):
+    def __init__(self) -> None:
+        self.query_params = {}
+        self.to_node, self.node_receiver = create_memory_object_stream(10)
+        self.worker_sender, self.to_worker = create_memory_object_stream(10)
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        try:
+            return await self.node_receiver.receive()
+        except EndOfStream:
+            raise anyio.get_cancelled_exc_class()()
+
+    async def receive_bytes(self):
+        return await self.receive_json()
+
+    async def send_json(self, data):
+        # starlette encodes json in the same way
+        await self.worker_sender.send(
+            json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        )
+
+    async def send_text(self, data: str):
+        await self.worker_sender.send(data)
+
+    async def send_bytes(self, data: bytes):
+        await self.worker_sender.send(data)
+
+
+def make_task_input() -> TaskInput:
+    return TaskInput(
+        task=InferenceTaskInput(
+            task_name="inference",
+            task_type=TaskType.SD,
+            task_id="0x" + "ab" * 32,
+            models=[
+                ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base", variant="fp16")
+            ],
+            task_args=json.dumps(
+                {
+                    "version": "2.5.0",
+                    "base_model": {"name": "crynux-network/stable-diffusion-v1-5"},
+                    "prompt": "a realistic photo of an old man sitting on a brown chair, " * 4,
+                    "negative_prompt": "low quality, blurry",
+                    "task_config": {"num_images": 4, "steps": 30, "seed": 42},
+                }
+            ),
+            output_dir="/data/tasks/" + "ab" * 32,
+        )
+    )
+
+
+def benchmark_message(rounds: int = 20000):
+    data = make_task_input().model_dump()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        json.loads(text)
+    json_cost = (time.perf_counter() - start) / rounds
+    print(f"json:    {json_cost * 1e6:6.1f} us/message, {len(text.encode()):5d} bytes")
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        frame = encode_frame(Frame(id=i, type="task", data=data))
+        decode_frame(frame)
+    frame_cost = (time.perf_counter() - start) / rounds
+    print(f"msgpack: {frame_cost * 1e6:6.1f} us/message, {len(frame):5d} bytes")
+
+
+async def idle_worker(websocket: MemoryWebSocket, features):
+    async with websocket.to_node:
+        await websocket.to_node.send({"version": "2.5.0", "features": features})
+        async for _ in websocket.to_worker:
+            pass
+
+
+async def benchmark_idle(features, num_workers: int = 32, seconds: float = 5):
+    devices = [str(i) for i in range(num_workers)]
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=devices)
+    )
+    manager = WorkerManager(config=config)
+
+    async with create_task_group() as tg:
+        for _ in devices:
+            websocket = MemoryWebSocket()
+            tg.start_soon(worker_endpoint, websocket, manager)
+            tg.start_soon(idle_worker, websocket, features)
+        await sleep(0.5)
+
+        start = time.process_time()
+        await sleep(seconds)
+        cost = time.process_time() - start
+        tg.cancel_scope.cancel()
+
+    name = features[0] if len(features) > 0 else "json"
+    print(
+        f"{name:8s} {num_workers} idle workers: "
+        f"{cost / seconds * 100:5.2f}% cpu over {seconds:.0f}s"
+    )
+
+
+async def main():
+    benchmark_message()
+    await benchmark_idle([])
+    await benchmark_idle(["msgpack"])
+
+
+if __name__ == "__main__":
+    anyio.run(main)
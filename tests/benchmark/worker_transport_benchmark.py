@@ -0,0 +1,120 @@
+"""
+Compare the round trip latency of worker tasks over the tcp port
+and over the dedicated unix socket.
+
+A fake worker connects to the worker endpoint and answers every task at once,
+so the latency is the cost of the transport and the endpoint.
+
+Run from the repository root:
+
+    python tests/benchmark/worker_transport_benchmark.py
+"""
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+
+import anyio
+from anyio import create_task_group, sleep
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HyperConfig
+from websockets.asyncio.client import connect, unix_connect
+
+sys.path.insert(0, os.path.abspath("src"))
+
+from crynux_server.config import Config, TaskConfig  # noqa: E402
+from crynux_server.models import (DownloadTaskInput, ModelConfig,  # noqa: E402
+                                  TaskInput, TaskType)
+from crynux_server.server import WorkerServer  # noqa: E402
+from crynux_server.worker_manager import (WorkerManager,  # noqa: E402
+                                          set_worker_manager)
+
+PORT = 17412
+
+
+async def fake_worker(websocket):
+    await websocket.send(json.dumps({"version": "2.5.0"}))
+    await websocket.recv()
+    async for msg in websocket:
+        if msg == "":
+            continue
+        task = json.loads(msg)["task"]
+        await websocket.send(
+            json.dumps(
+                {
+                    "task_name": task["task_name"],
+                    "task_id_commitment": task["task_id"],
+                    "result": {"status": "success"},
+                }
+            )
+        )
+
+
+async def round_trips(manager: WorkerManager, name: str, rounds: int = 2000):
+    costs = []
+    for i in range(rounds):
+        task_input = TaskInput(
+            task=DownloadTaskInput(
+                task_name="download",
+                task_type=TaskType.SD,
+                task_id=f"{name}_{i}",
+                model=ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base"),
+            )
+        )
+        start = time.perf_counter()
+        await (await manager.send_task(task_input)).get()
+        costs.append(time.perf_counter() - start)
+
+    costs.sort()
+    print(
+        f"{name}: p50 {statistics.median(costs) * 1e6:7.1f} us, "
+        f"p99 {costs[int(len(costs) * 0.99)] * 1e6:7.1f} us"
+    )
+
+
+async def main():
+    config = Config.model_construct(
+        server_port=PORT, task_config=TaskConfig(worker_patch_url="")
+    )
+    manager = WorkerManager(config)
+    set_worker_manager(manager)
+
+    worker_server = WorkerServer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "worker.sock")
+        shutdown = anyio.Event()
+        tcp_config = HyperConfig()
+        tcp_config.bind = [f"127.0.0.1:{PORT}"]
+
+        async with create_task_group() as tg:
+            tg.start_soon(partial(serve, worker_server.app, tcp_config, shutdown_trigger=shutdown.wait))  # type: ignore
+            await tg.start(worker_server.start, socket_path)
+            await sleep(0.5)
+
+            async with connect(f"ws://127.0.0.1:{PORT}/manager/v1/worker/") as websocket:
+                tg.start_soon(fake_worker, websocket)
+                async with manager.wait_connected(5):
+                    pass
+                await round_trips(manager, "tcp")
+
+            while await manager.is_connected():
+                await sleep(0.01)
+
+            async with unix_connect(socket_path, "ws://localhost/manager/v1/worker/") as websocket:
+                tg.start_soon(fake_worker, websocket)
+                async with manager.wait_connected(5):
+                    pass
+                await round_trips(manager, "unix")
+
+            while await manager.is_connected():
+                await sleep(0.01)
+            shutdown.set()
+            worker_server.stop()
+
+
+if __name__ == "__main__":
+    anyio.run(main)
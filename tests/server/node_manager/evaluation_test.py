@@ -0,0 +1,156 @@
+import json
+from typing import Dict, List
+
+from crynux_server import models
+from crynux_server.config import Config, TaskConfig
+from crynux_server.download_model_cache import MemoryDownloadModelCache
+from crynux_server.evaluation_cache import MemoryEvaluationCache
+from crynux_server.node_manager import NodeManager
+from crynux_server.node_manager.state_cache import (
+    ManagerStateCache,
+    MemoryNodeStateCache,
+    MemoryTxStateCache,
+)
+from crynux_server.node_manager.state_cache.memory_impl import (
+    MemoryNodeScoreStateCache,
+)
+from crynux_server.worker_manager import TaskFuture, WorkerState
+
+
+class FakeWorkerManager(object):
+    def __init__(self, workers: Dict[str, str]) -> None:
+        # device to worker version
+        self.workers = workers
+        self.tasks: List[models.TaskInput] = []
+        # result hash of the tasks by steps
+        self.hashes: Dict[int, str] = {40: "ab" * 8, 4: "cd" * 8}
+
+    def worker_states(self) -> List[WorkerState]:
+        return [
+            WorkerState(worker_id=i, device=device, version=version)
+            for i, (device, version) in enumerate(self.workers.items())
+        ]
+
+    @property
+    def steps(self) -> List[int]:
+        res = []
+        for task_input in self.tasks:
+            assert isinstance(task_input.task, models.InferenceTaskInput)
+            task_args = json.loads(task_input.task.task_args)
+            res.append(task_args["task_config"]["steps"])
+        return res
+
+    async def send_task(self, task_input: models.TaskInput) -> TaskFuture:
+        self.tasks.append(task_input)
+        assert isinstance(task_input.task, models.InferenceTaskInput)
+        steps = json.loads(task_input.task.task_args)["task_config"]["steps"]
+        fut = TaskFuture()
+        fut.set_result(
+            models.SuccessResult(
+                status="success", files=["0.png"], hashes=[self.hashes[steps]]
+            )
+        )
+        return fut
+
+
+def make_node_manager(
+    worker_manager: FakeWorkerManager, force_evaluation: bool = False
+) -> NodeManager:
+    config = Config.model_construct(
+        task_config=TaskConfig(
+            worker_patch_url="", output_dir="build/data/images", force_evaluation=force_evaluation
+        )
+    )
+    manager = NodeManager(
+        config=config,
+        platform="linux",
+        gpu_name="NVIDIA GeForce RTX 4090",
+        gpu_vram=24,
+        manager_state_cache=ManagerStateCache(
+            node_state_cache_cls=MemoryNodeStateCache,
+            tx_state_cache_cls=MemoryTxStateCache,
+            node_score_state_cache_cls=MemoryNodeScoreStateCache,
+        ),
+        download_model_cache_cls=MemoryDownloadModelCache,
+        evaluation_cache_cls=MemoryEvaluationCache,
+        worker_manager=worker_manager,  # type: ignore
+    )
+    return manager
+
+
+async def saved_result_hashes(manager: NodeManager) -> List[str]:
+    res = []
+    for fingerprint in manager.evaluation_cache._results:  # type: ignore
+        result = await manager.evaluation_cache.get(fingerprint)
+        assert result is not None
+        res.append(result.result_hash)
+    return res
+
+
+async def test_reuse_evaluation_result():
+    worker_manager = FakeWorkerManager({"cuda:0": "2.5.0"})
+    manager = make_node_manager(worker_manager)
+
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40]
+    assert await saved_result_hashes(manager) == ["ab" * 8]
+
+    # same environment, a shortened evaluation is run instead
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4]
+    assert sorted(await saved_result_hashes(manager)) == ["ab" * 8, "cd" * 8]
+
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 4]
+
+    # the worker is updated
+    worker_manager.workers["cuda:0"] = "2.6.0"
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 4, 40]
+
+
+async def test_evaluation_fingerprint_of_all_workers():
+    worker_manager = FakeWorkerManager({"cuda:0": "2.5.0", "cuda:1": "2.5.0"})
+    manager = make_node_manager(worker_manager)
+
+    await manager._run_initial_inference_task()
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4]
+
+    # a worker other than the first one is updated
+    worker_manager.workers["cuda:1"] = "2.6.0"
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 40]
+
+    # a worker runs on another device
+    worker_manager.workers = {"cuda:0": "2.5.0", "cuda:2": "2.6.0"}
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 40, 40]
+
+
+async def test_shortened_evaluation_mismatch():
+    worker_manager = FakeWorkerManager({"cuda:0": "2.5.0"})
+    manager = make_node_manager(worker_manager)
+
+    await manager._run_initial_inference_task()
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4]
+
+    # the shortened evaluation gives another result, the full one is rerun
+    worker_manager.hashes[4] = "ef" * 8
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 4, 40]
+    assert sorted(await saved_result_hashes(manager)) == ["ab" * 8, "ef" * 8]
+
+    # the new shortened result is kept after the full evaluation passed
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 4, 4, 40, 4]
+
+
+async def test_force_evaluation():
+    worker_manager = FakeWorkerManager({"cuda:0": "2.5.0"})
+    manager = make_node_manager(worker_manager, force_evaluation=True)
+
+    await manager._run_initial_inference_task()
+    await manager._run_initial_inference_task()
+    assert worker_manager.steps == [40, 40]
@@ -0,0 +1,132 @@
+import httpx
+import pytest
+from anyio import create_task_group, fail_after, sleep
+
+from crynux_server.relay import RelayError, WebRelay
+from crynux_server.relay.coalesce import RequestCoalescer
+
+privkey = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+
+
+async def test_coalesce_concurrent_calls():
+    requests = []
+
+    async def handler(request: httpx.Request):
+        requests.append(request.url.path)
+        if request.url.path.endswith("/task"):
+            await sleep(0.1)
+            return httpx.Response(200, json={"data": "0x" + "01" * 32})
+        return httpx.Response(200, json={"message": "success"})
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    results = []
+
+    async def get_current_task():
+        results.append(await relay.node_get_current_task())
+
+    try:
+        with fail_after(5):
+            async with create_task_group() as tg:
+                for _ in range(5):
+                    tg.start_soon(get_current_task)
+            # the result is cached for a short time
+            await get_current_task()
+            assert len(requests) == 1
+
+            # the node status is changed, so the cached task is dropped
+            await relay.node_pause()
+            await get_current_task()
+    finally:
+        await relay.close()
+
+    assert results == [bytes([1] * 32)] * 7
+    assert len([path for path in requests if path.endswith("/task")]) == 2
+    stats = relay.coalesce_stats()["node_get_current_task"]
+    assert stats.hits == 5
+    assert stats.misses == 2
+
+
+async def test_coalesce_errors_are_not_cached():
+    coalescer = RequestCoalescer()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await sleep(0.1)
+        raise RelayError(500, "getTask", "internal error")
+
+    errors = []
+
+    async def call():
+        try:
+            await coalescer.call("get_task", (b"1",), fail, ttl=10)
+        except RelayError as e:
+            errors.append(e)
+
+    async with create_task_group() as tg:
+        tg.start_soon(call)
+        tg.start_soon(call)
+    assert calls == 1
+    assert len(errors) == 2
+    # each caller gets its own error, chained to the one of the request
+    assert errors[0] is not errors[1]
+    assert errors[0].status_code == errors[1].status_code == 500
+    assert errors[0].__cause__ is errors[1] or errors[1].__cause__ is errors[0]
+
+    with pytest.raises(RelayError):
+        await coalescer.call("get_task", (b"1",), fail, ttl=10)
+    assert calls == 2
+
+
+async def test_coalesce_results_are_copied():
+    coalescer = RequestCoalescer()
+
+    async def get():
+        await sleep(0.1)
+        return {"models": ["a"]}
+
+    results = []
+
+    async def call():
+        results.append(await coalescer.call("get_task", (b"1",), get, ttl=10))
+
+    async with create_task_group() as tg:
+        tg.start_soon(call)
+        tg.start_soon(call)
+    await call()
+
+    assert len(results) == 3
+    # a caller changing its result does not change the others
+    results[0]["models"].append("b")
+    assert results[1] == results[2] == {"models": ["a"]}
+    assert results[1] is not results[2]
+
+
+async def test_coalesce_cancelled_request_is_sent_again():
+    coalescer = RequestCoalescer()
+    calls = 0
+
+    async def get():
+        nonlocal calls
+        calls += 1
+        await sleep(0.1)
+        return calls
+
+    results = []
+
+    async def call():
+        results.append(await coalescer.call("get_task", (b"1",), get))
+
+    async with create_task_group() as tg:
+        async with create_task_group() as leader_tg:
+            leader_tg.start_soon(call)
+            await sleep(0.01)
+            tg.start_soon(call)
+            await sleep(0.01)
+            leader_tg.cancel_scope.cancel()
+
+    assert results == [2]
+    assert calls == 2
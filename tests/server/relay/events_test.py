@@ -0,0 +1,89 @@
+import json
+
+import httpx
+import pytest
+
+from crynux_server.relay import WebRelay
+from crynux_server.relay.exceptions import RelayError
+
+privkey = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+node_address = "0x577887519278199ce8F8D80bAcc70fc32b48daD4"
+
+
+def sse_event(id: int) -> str:
+    args = json.dumps(
+        {"selected_node": node_address, "task_id_commitment": "0x" + "01" * 32}
+    )
+    data = json.dumps({"id": id, "type": "TaskStarted", "args": args})
+    return f": keep alive\n\nid: {id}\ndata: {data}\n\n"
+
+
+async def test_subscribe_events():
+    async def handler(request: httpx.Request):
+        assert request.url.path == "/v1/events/stream"
+        assert request.url.params["start"] == "3"
+        body = sse_event(4) + sse_event(5)
+        return httpx.Response(
+            200, content=body.encode(), headers={"Content-Type": "text/event-stream"}
+        )
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    try:
+        events = [event async for event in relay.subscribe_events(3, node_address)]
+    finally:
+        await relay.close()
+
+    assert [event.id for event in events] == [4, 5]
+    assert all(event.type == "TaskStarted" for event in events)
+
+
+async def test_subscribe_events_not_supported():
+    async def handler(request: httpx.Request):
+        return httpx.Response(404, text="404 page not found")
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    assert relay.supports_event_push
+    try:
+        events = [event async for event in relay.subscribe_events(0)]
+    finally:
+        await relay.close()
+
+    assert len(events) == 0
+    assert not relay.supports_event_push
+
+
+class SilentStream(httpx.AsyncByteStream):
+    def __init__(self, request: httpx.Request) -> None:
+        self.request = request
+
+    async def __aiter__(self):
+        yield sse_event(4).encode()
+        raise httpx.ReadTimeout("timed out", request=self.request)
+
+
+async def test_subscribe_events_read_timeout():
+    async def handler(request: httpx.Request):
+        return httpx.Response(
+            200,
+            stream=SilentStream(request),
+            headers={"Content-Type": "text/event-stream"},
+        )
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    events = []
+    try:
+        # a silent stream is a broken subscription, not the end of the events
+        with pytest.raises(RelayError):
+            async for event in relay.subscribe_events(3):
+                events.append(event)
+    finally:
+        await relay.close()
+
+    assert [event.id for event in events] == [4]
+    assert relay.supports_event_push
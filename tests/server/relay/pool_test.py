@@ -0,0 +1,106 @@
+import httpx
+import pytest
+from anyio import EndOfStream, Event, create_task_group, create_tcp_listener, fail_after
+from anyio.abc import SocketAttribute, SocketStream
+
+from crynux_server.config import RelayPoolConfig
+from crynux_server.relay import WebRelay
+
+privkey = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+
+
+# A minimal HTTP/1.1 relay: /slow sends its body after release is set,
+# other paths answer the now call at once
+async def serve_relay(stream: SocketStream, release: Event):
+    async with stream:
+        buf = b""
+        while True:
+            while b"\r\n\r\n" not in buf:
+                try:
+                    buf += await stream.receive()
+                except EndOfStream:
+                    return
+            head, buf = buf.split(b"\r\n\r\n", 1)
+            path = head.split(b" ", 2)[1]
+            if path == b"/slow":
+                await stream.send(
+                    b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nfirst\r\n"
+                )
+                await release.wait()
+                await stream.send(b"4\r\nlast\r\n0\r\n\r\n")
+            else:
+                body = b'{"data": {"now": 1}}'
+                await stream.send(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+
+
+def make_relay(port: int) -> WebRelay:
+    return WebRelay(
+        base_url=f"http://127.0.0.1:{port}",
+        privkey=privkey,
+        pool_config=RelayPoolConfig(
+            max_connections=1,
+            max_keepalive_connections=1,
+            http2=False,
+            pool_timeout=0.2,
+        ),
+    )
+
+
+async def test_pool_timeout_restarts_client():
+    release = Event()
+    listener = await create_tcp_listener(local_host="127.0.0.1")
+    port = listener.extra(SocketAttribute.local_port)
+
+    async with listener, create_task_group() as tg:
+        tg.start_soon(listener.serve, lambda stream: serve_relay(stream, release))
+
+        relay = make_relay(port)
+        client = relay.client
+        try:
+            with fail_after(5):
+                async with client.stream("GET", "/slow") as resp:
+                    chunks = resp.aiter_raw()
+                    assert await chunks.__anext__() == b"first"
+
+                    # the only connection is held by a response which is not closed
+                    with pytest.raises(httpx.PoolTimeout):
+                        await relay.now()
+                    # the client is rebuilt, so the next call gets a new connection
+                    assert relay.client is not client
+                    assert client.is_closed
+                    assert await relay.now() == 1
+                    release.set()
+        finally:
+            await relay.close()
+            tg.cancel_scope.cancel()
+
+
+async def test_event_stream_pool_timeout_restarts_client():
+    release = Event()
+    listener = await create_tcp_listener(local_host="127.0.0.1")
+    port = listener.extra(SocketAttribute.local_port)
+
+    async with listener, create_task_group() as tg:
+        tg.start_soon(listener.serve, lambda stream: serve_relay(stream, release))
+
+        relay = make_relay(port)
+        client = relay.client
+        try:
+            with fail_after(5):
+                async with client.stream("GET", "/slow") as resp:
+                    chunks = resp.aiter_raw()
+                    assert await chunks.__anext__() == b"first"
+
+                    with pytest.raises(httpx.PoolTimeout):
+                        async for _ in relay.subscribe_events(0):
+                            pass
+                    assert relay.client is not client
+                    assert await relay.now() == 1
+                    release.set()
+        finally:
+            await relay.close()
+            tg.cancel_scope.cancel()
@@ -1,4 +1,6 @@
-from crynux_server.relay.sign import Signer
+import pytest
+
+from crynux_server.relay.sign import Signer, native_signing_available
 
 
 def test_sign():
@@ -10,3 +12,50 @@ def test_sign():
 
     expected = "0xdd78a14f5dcef6a57c5cfba8466baa1ac0ad2767e52eaf5a409895742e0475b4402acacaed2a2d7f158eac2f39849d653b45f207b0204858114cd38c415de5c700"
     assert signature == expected
+
+
+def old_sign(privkey: str, input, timestamp: int) -> str:
+    import json
+
+    from eth_account import Account
+    from web3 import Web3
+
+    from crynux_server.utils import sort_dict
+
+    input_bytes = json.dumps(
+        sort_dict(input), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    data_hash = Web3.keccak(input_bytes + str(timestamp).encode("utf-8"))
+    res = bytearray(Account.from_key(privkey).signHash(data_hash).signature)
+    res[-1] -= 27
+    return "0x" + res.hex()
+
+
+@pytest.mark.parametrize(
+    "native",
+    [
+        False,
+        pytest.param(
+            True,
+            marks=pytest.mark.skipif(
+                not native_signing_available(), reason="coincurve is not installed"
+            ),
+        ),
+    ],
+)
+def test_sign_backends(native: bool):
+    privkey = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+    signer = Signer(privkey, native=native)
+    inputs = [
+        {"task_id": 1},
+        {"b": "节点", "a": {"d": 1, "c": [1, 2]}},
+        {
+            "task_id_commitment": "0x01",
+            "files": [{"size": 1, "name": "0.png", "checksum": "ab"}],
+        },
+    ]
+    for input in inputs:
+        _, signature = signer.sign(input, timestamp=1692446475)
+        assert signature == old_sign(privkey, input, 1692446475)
+        # signed again in the same second
+        assert signer.sign(input, timestamp=1692446475)[1] == signature
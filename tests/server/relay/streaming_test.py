@@ -0,0 +1,252 @@
+import email
+import email.policy
+import hashlib
+import io
+import os
+import zipfile
+
+import httpx
+import pytest
+
+from crynux_server.relay import WebRelay
+from crynux_server.relay.streaming import (StreamingUnzipper, stage_task_result,
+                                          unzip_stream, zip_dir_stream)
+
+privkey = "0x420fcabfd5dbb55215490693062e6e530840c64de837d071f0d9da21aaac861e"
+
+
+def make_checkpoint(checkpoint_dir: str):
+    os.makedirs(os.path.join(checkpoint_dir, "unet"))
+    with open(os.path.join(checkpoint_dir, "config.json"), mode="w") as f:
+        f.write('{"rank": 8}' * 100)
+    with open(os.path.join(checkpoint_dir, "unet", "model.safetensors"), mode="wb") as f:
+        f.write(os.urandom(3000))
+
+
+def parse_multipart(content_type: str, body: bytes):
+    msg = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body,
+        policy=email.policy.HTTP,
+    )
+    assert msg.is_multipart()
+    fields = {}
+    files = []
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True)
+        if filename is None:
+            fields[name] = payload.decode()
+        else:
+            files.append((name, filename, payload))
+    return fields, files
+
+
+async def test_zip_dir_stream(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+
+    chunks = [chunk async for chunk in zip_dir_stream(checkpoint_dir, chunk_size=1024)]
+    assert len(chunks) > 1
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        infos = {info.filename: info for info in zf.infolist()}
+        assert infos["config.json"].compress_type == zipfile.ZIP_DEFLATED
+        assert infos["unet/model.safetensors"].compress_type == zipfile.ZIP_STORED
+        with open(os.path.join(checkpoint_dir, "unet", "model.safetensors"), "rb") as f:
+            assert zf.read("unet/model.safetensors") == f.read()
+
+
+async def test_upload_task_result(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+    image = tmp_path / "0.png"
+    image.write_bytes(os.urandom(100))
+
+    requests = []
+
+    async def handler(request: httpx.Request):
+        body = await request.aread()
+        requests.append((request, body))
+        return httpx.Response(200, json={"message": "success"})
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    try:
+        await relay.upload_task_result(bytes([1] * 32), [str(image)], checkpoint_dir)
+    finally:
+        await relay.close()
+
+    assert len(requests) == 1
+    request, body = requests[0]
+    fields, files = parse_multipart(request.headers["Content-Type"], body)
+    assert set(fields) == {"timestamp", "signature"}
+    assert [(name, filename) for name, filename, _ in files] == [
+        ("files", "0.png"),
+        ("checkpoint", "checkpoint.zip"),
+    ]
+    assert files[0][2] == image.read_bytes()
+    with zipfile.ZipFile(io.BytesIO(files[1][2])) as zf:
+        assert set(zf.namelist()) == {"config.json", "unet/", "unet/model.safetensors"}
+
+
+def read_dir(dirname: str):
+    res = {}
+    for root, _, files in os.walk(dirname):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                res[os.path.relpath(path, dirname)] = f.read()
+    return res
+
+
+async def iter_chunks(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1024 * 1024])
+async def test_unzip_stream(tmp_path, chunk_size):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+    # stored data containing a fake data descriptor signature
+    with open(os.path.join(checkpoint_dir, "unet", "fake.bin"), mode="wb") as f:
+        f.write(os.urandom(100) + b"PK\x07\x08" + os.urandom(100))
+
+    archive = b"".join([chunk async for chunk in zip_dir_stream(checkpoint_dir)])
+    dst_dir = str(tmp_path / "dst")
+    await unzip_stream(iter_chunks(archive, chunk_size), dst_dir)
+
+    assert os.path.isdir(os.path.join(dst_dir, "unet"))
+    assert read_dir(dst_dir) == read_dir(checkpoint_dir)
+
+
+async def test_unzip_stream_seekable_archive(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.write(os.path.join(checkpoint_dir, "config.json"), "config.json")
+        zf.write(
+            os.path.join(checkpoint_dir, "unet", "model.safetensors"),
+            "unet/model.safetensors",
+            compress_type=zipfile.ZIP_STORED,
+        )
+
+    dst_dir = str(tmp_path / "dst")
+    await unzip_stream(iter_chunks(buf.getvalue(), 100), dst_dir)
+    assert read_dir(dst_dir) == read_dir(checkpoint_dir)
+
+
+async def test_unzip_stream_bad_archive(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+    archive = b"".join([chunk async for chunk in zip_dir_stream(checkpoint_dir)])
+
+    # truncated
+    with pytest.raises(zipfile.BadZipFile):
+        await unzip_stream(iter_chunks(archive[:-100], 1024), str(tmp_path / "dst1"))
+
+    # corrupted data of the deflated config.json
+    corrupted = bytearray(archive)
+    corrupted[archive.index(b"config.json") + 20] ^= 0xFF
+    with pytest.raises(zipfile.BadZipFile):
+        await unzip_stream(iter_chunks(bytes(corrupted), 1024), str(tmp_path / "dst2"))
+
+
+def test_unzip_unsafe_path(tmp_path):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, mode="w") as zf:
+        zf.writestr("../evil.txt", b"evil")
+
+    unzipper = StreamingUnzipper(str(tmp_path / "dst"))
+    with pytest.raises(zipfile.BadZipFile):
+        unzipper.feed(buf.getvalue())
+    assert not (tmp_path / "evil.txt").exists()
+
+
+async def test_get_checkpoint(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+    archive = b"".join([chunk async for chunk in zip_dir_stream(checkpoint_dir)])
+
+    async def handler(request: httpx.Request):
+        assert request.url.path.endswith("/checkpoint")
+        return httpx.Response(200, content=iter_chunks(archive, 1000))
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    dst_dir = str(tmp_path / "dst")
+    try:
+        await relay.get_checkpoint(bytes([1] * 32), dst_dir)
+    finally:
+        await relay.close()
+
+    assert read_dir(dst_dir) == read_dir(checkpoint_dir)
+
+
+@pytest.mark.parametrize("resumable", [False, True])
+async def test_upload_staged_task_result(tmp_path, resumable: bool):
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    make_checkpoint(checkpoint_dir)
+    image = tmp_path / "0.png"
+    image.write_bytes(os.urandom(100))
+
+    payload = await stage_task_result(
+        [str(image)], checkpoint_dir, resumable=resumable
+    )
+    # files are hashed while they are uploaded, unless staged for resumable uploads
+    assert ("0.png" in payload.checksums) == resumable
+
+    requests = []
+
+    async def handler(request: httpx.Request):
+        body = await request.aread()
+        requests.append((request, body))
+        return httpx.Response(200, json={"message": "success"})
+
+    relay = WebRelay(
+        base_url="http://relay", privkey=privkey, transport=httpx.MockTransport(handler)
+    )
+    try:
+        # the payload can be uploaded again when the first upload fails
+        for _ in range(2):
+            await relay.upload_task_result(
+                bytes([1] * 32), [str(image)], checkpoint_dir, payload=payload
+            )
+        checksums = payload.checksums
+    finally:
+        payload.close()
+        await relay.close()
+
+    assert len(requests) == 2
+    for request, body in requests:
+        if resumable:
+            assert int(request.headers["Content-Length"]) == len(body)
+            assert "Transfer-Encoding" not in request.headers
+        else:
+            # the checkpoint is zipped while the body is sent
+            assert "Content-Length" not in request.headers
+        fields, files = parse_multipart(request.headers["Content-Type"], body)
+        assert set(fields) == {"timestamp", "signature"}
+        assert [(name, filename) for name, filename, _ in files] == [
+            ("files", "0.png"),
+            ("checkpoint", "checkpoint.zip"),
+        ]
+        assert files[0][2] == image.read_bytes()
+        assert checksums["0.png"] == hashlib.sha256(image.read_bytes()).hexdigest()
+        if resumable:
+            assert checksums["checkpoint.zip"] == hashlib.sha256(files[1][2]).hexdigest()
+        else:
+            assert "checkpoint.zip" not in checksums
+        with zipfile.ZipFile(io.BytesIO(files[1][2])) as zf:
+            assert zf.testzip() is None
+            assert set(zf.namelist()) == {
+                "config.json",
+                "unet/",
+                "unet/model.safetensors",
+            }
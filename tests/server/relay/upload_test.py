@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from crynux_server.relay import MockRelay, RelayError
+from crynux_server.relay.streaming import stage_task_result
+from crynux_server.relay.upload import upload_task_result_resumable
+
+
+class FlakyRelay(MockRelay):
+    def __init__(self, fail_parts) -> None:
+        super().__init__()
+        self.fail_parts = set(fail_parts)
+        self.part_calls = []
+
+    async def upload_task_result_part(
+        self, task_id_commitment: bytes, index: int, offset: int, data: bytes
+    ):
+        self.part_calls.append((index, offset))
+        if (index, offset) in self.fail_parts:
+            self.fail_parts.remove((index, offset))
+            raise RelayError(502, "uploadTaskResultPart", "bad gateway")
+        await super().upload_task_result_part(task_id_commitment, index, offset, data)
+
+
+class ShortRelay(MockRelay):
+    async def start_task_result_upload(self, task_id_commitment, files):
+        received = await super().start_task_result_upload(task_id_commitment, files)
+        return received[:-1]
+
+
+def make_result(tmp_path):
+    files = []
+    for i in range(3):
+        path = tmp_path / f"{i}.png"
+        path.write_bytes(os.urandom(2500))
+        files.append(str(path))
+    checkpoint_dir = tmp_path / "checkpoint"
+    checkpoint_dir.mkdir()
+    (checkpoint_dir / "model.safetensors").write_bytes(os.urandom(3000))
+    return files, str(checkpoint_dir)
+
+
+async def test_retry_failed_parts(tmp_path):
+    task_id_commitment = bytes([1] * 32)
+    files, checkpoint_dir = make_result(tmp_path)
+    relay = FlakyRelay(fail_parts=[(0, 1000), (3, 0)])
+
+    payload = await stage_task_result(files, checkpoint_dir, resumable=True)
+    try:
+        await upload_task_result_resumable(
+            relay, task_id_commitment, payload, part_size=1000
+        )
+    finally:
+        payload.close()
+
+    # only the failed parts are sent twice
+    assert relay.part_calls.count((0, 1000)) == 2
+    assert relay.part_calls.count((3, 0)) == 2
+    assert relay.part_calls.count((1, 0)) == 1
+    for i, src in enumerate(files):
+        with open(src, "rb") as f, open(relay.task_results[task_id_commitment][i], "rb") as g:
+            assert f.read() == g.read()
+    with open(os.path.join(checkpoint_dir, "model.safetensors"), "rb") as f, open(
+        os.path.join(relay.task_result_checkpoint[task_id_commitment], "model.safetensors"),
+        "rb",
+    ) as g:
+        assert f.read() == g.read()
+    await relay.close()
+
+
+async def test_resume_upload(tmp_path):
+    task_id_commitment = bytes([1] * 32)
+    files, checkpoint_dir = make_result(tmp_path)
+    # the part keeps failing, so the first upload fails
+    relay = FlakyRelay(fail_parts=[(2, 2000)])
+
+    payload = await stage_task_result(files, checkpoint_dir, resumable=True)
+    try:
+        with pytest.raises(RelayError):
+            await upload_task_result_resumable(
+                relay, task_id_commitment, payload, part_size=1000, part_attempts=1
+            )
+        first_calls = list(relay.part_calls)
+        relay.part_calls.clear()
+
+        await upload_task_result_resumable(
+            relay, task_id_commitment, payload, part_size=1000
+        )
+    finally:
+        payload.close()
+
+    # received parts are not sent again
+    assert (2, 2000) in relay.part_calls
+    for part in first_calls:
+        if part != (2, 2000):
+            assert part not in relay.part_calls
+    assert len(relay.task_results[task_id_commitment]) == 3
+    await relay.close()
+
+
+async def test_received_sizes_mismatch(tmp_path):
+    task_id_commitment = bytes([1] * 32)
+    files, checkpoint_dir = make_result(tmp_path)
+    relay = ShortRelay()
+
+    payload = await stage_task_result(files, checkpoint_dir, resumable=True)
+    try:
+        with pytest.raises(RelayError) as exc_info:
+            await upload_task_result_resumable(
+                relay, task_id_commitment, payload, part_size=1000
+            )
+    finally:
+        payload.close()
+
+    # nothing is uploaded when the relay does not know every result file
+    assert exc_info.value.method == "startTaskResultUpload"
+    assert task_id_commitment not in relay.task_results
+    await relay.close()
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+from anyio import create_task_group, fail_after, sleep
+
+from crynux_server.download_model_cache import (MemoryDownloadModelCache,
+                                                model_files_exist)
+from crynux_server.models import DownloadedModel, ModelConfig, TaskType
+from crynux_server.task.utils import DownloadBudget, run_download_task
+from crynux_server.worker_manager import TaskDownloadError
+from crynux_server.worker_manager.exchange import TaskExchange
+
+
+async def test_coalesce_downloads():
+    exchange = TaskExchange()
+    model = ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base", variant="fp16")
+    finished = []
+
+    async def download(task_id: str):
+        await run_download_task(
+            task_id=task_id,
+            task_type=TaskType.SD,
+            model=model,
+            worker_manager=exchange,  # type: ignore
+        )
+        finished.append(task_id)
+
+    async with create_task_group() as tg:
+        tg.start_soon(download, "preload_models_0")
+        tg.start_soon(download, "0x01_base:crynux-network/stable-diffusion-v1-5+fp16")
+        with fail_after(1):
+            task_input, task_future = await exchange.get_task()
+        await sleep(0.01)
+        # only one task is sent to the worker
+        assert len(exchange._task_queue) == 0
+        assert task_input.task.task_id == "preload_models_0"
+        task_future.set_result(None)
+
+    assert len(finished) == 2
+
+
+async def test_coalesce_download_error():
+    exchange = TaskExchange()
+    model = ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base")
+    errors = []
+
+    async def download(task_id: str):
+        try:
+            await run_download_task(
+                task_id=task_id,
+                task_type=TaskType.SD,
+                model=model,
+                worker_manager=exchange,  # type: ignore
+            )
+        except TaskDownloadError as e:
+            errors.append(e)
+
+    async with create_task_group() as tg:
+        tg.start_soon(download, "task_0")
+        tg.start_soon(download, "task_1")
+        with fail_after(1):
+            _, task_future = await exchange.get_task()
+        await sleep(0.01)
+        task_future.set_error(TaskDownloadError("network error"))
+
+    assert len(errors) == 2
+    # the waiting download gets its own copy of the error
+    assert errors[0] is not errors[1]
+    assert str(errors[0]) == str(errors[1])
+    assert len(exchange._task_queue) == 0
+
+
+async def test_download_model_cache_has():
+    cache = MemoryDownloadModelCache()
+    model = ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base", variant="fp16")
+    assert not await cache.has(model)
+
+    await cache.save(DownloadedModel(task_type=TaskType.SD, model=model))
+    assert await cache.has(model)
+    assert not await cache.has(ModelConfig(id=model.id, type="base"))
+
+
+async def test_download_budget():
+    exchange = TaskExchange()
+    budget = DownloadBudget(concurrency=2, bandwidth=1000)
+    model_ids = [
+        "crynux-network/stable-diffusion-v1-5",
+        "crynux-network/stable-diffusion-xl-base-1.0",
+        "crynux-network/controlnet-canny",
+    ]
+    finished = []
+
+    async def download(task_id: str, model_id: str):
+        await run_download_task(
+            task_id=task_id,
+            task_type=TaskType.SD,
+            model=ModelConfig(id=model_id, type="base"),
+            worker_manager=exchange,  # type: ignore
+            budget=budget,
+        )
+        finished.append(task_id)
+
+    async with create_task_group() as tg:
+        for i, model_id in enumerate(model_ids):
+            tg.start_soon(download, f"task_{i}", model_id)
+
+        futures = []
+        with fail_after(1):
+            for _ in range(2):
+                task_input, task_future = await exchange.get_task()
+                # each running download gets an equal share of the bandwidth
+                assert task_input.task.max_bandwidth == 500
+                futures.append(task_future)
+        await sleep(0.01)
+        # the third download waits for a slot of the budget
+        assert len(exchange._task_queue) == 0
+
+        futures[0].set_result(None)
+        with fail_after(1):
+            task_input, task_future = await exchange.get_task()
+        assert task_input.task.max_bandwidth == 500
+        futures[1].set_result(None)
+        task_future.set_result(None)
+
+    assert len(finished) == 3
+
+
+def test_model_files_exist(tmp_path):
+    hf_cache_dir = str(tmp_path)
+    model = ModelConfig(id="crynux-network/stable-diffusion-v1-5", type="base")
+    assert not model_files_exist(model, hf_cache_dir)
+
+    snapshots_dir = os.path.join(
+        hf_cache_dir, "models--crynux-network--stable-diffusion-v1-5", "snapshots"
+    )
+    os.makedirs(snapshots_dir)
+    assert not model_files_exist(model, hf_cache_dir)
+
+    os.makedirs(os.path.join(snapshots_dir, "main"))
+    assert model_files_exist(model, hf_cache_dir)
+
+    # files of models out of huggingface are checked by the worker
+    url_model = ModelConfig(id="https://example.com/model.safetensors", type="lora")
+    assert not model_files_exist(url_model, hf_cache_dir)
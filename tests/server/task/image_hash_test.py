@@ -0,0 +1,26 @@
+import os
+import shutil
+
+import imhash
+import pytest
+
+from crynux_server.task.utils import get_image_hash, get_image_hashes
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(imhash, "getPHash"), reason="imhash extension is not built"
+)
+
+image = os.path.join(os.path.dirname(__file__), "..", "..", "..", "test.png")
+
+
+async def test_image_hashes_in_worker_processes(tmp_path):
+    files = []
+    for i in range(3):
+        dst = str(tmp_path / f"{i}.png")
+        shutil.copyfile(image, dst)
+        files.append(dst)
+
+    hashes = await get_image_hashes(files)
+
+    assert hashes == [get_image_hash(f) for f in files]
+    assert await get_image_hashes(files[:1]) == hashes[:1]
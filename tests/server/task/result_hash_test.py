@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import pytest
+from anyio import create_task_group, fail_after
+
+from crynux_server.models import SuccessResult, TaskType
+from crynux_server.task.utils import run_inference_task
+from crynux_server.worker_manager import TaskExecutionError
+from crynux_server.worker_manager.exchange import TaskExchange
+
+task_id_commitment = bytes([1] * 32)
+
+
+def write_results(task_dir: str, count: int):
+    os.makedirs(task_dir, exist_ok=True)
+    hashes = []
+    for i in range(count):
+        content = json.dumps({"index": i}).encode("utf-8")
+        with open(os.path.join(task_dir, f"{i}.json"), mode="wb") as f:
+            f.write(content)
+        hashes.append(hashlib.sha256(content).digest())
+    return hashes
+
+
+async def run_task(task_dir: str, result, verify_hash: bool = False):
+    exchange = TaskExchange()
+    res = []
+
+    async def run():
+        res.append(
+            await run_inference_task(
+                task_id_commitment=task_id_commitment,
+                task_type=TaskType.LLM,
+                models=[],
+                task_args="{}",
+                task_dir=task_dir,
+                verify_hash=verify_hash,
+                worker_manager=exchange,  # type: ignore
+            )
+        )
+
+    with fail_after(5):
+        async with create_task_group() as tg:
+            tg.start_soon(run)
+            _, task_future = await exchange.get_task()
+            task_future.set_result(result)
+
+    return res[0]
+
+
+@pytest.mark.parametrize("verify_hash", [False, True])
+async def test_worker_result_hashes(tmp_path, verify_hash: bool):
+    task_dir = str(tmp_path)
+    hashes = write_results(task_dir, 2)
+    result = SuccessResult(
+        status="success",
+        files=["0.json", "1.json"],
+        hashes=["0x" + h.hex() for h in hashes],
+    )
+
+    files, res_hashes, checkpoint = await run_task(task_dir, result, verify_hash)
+
+    assert files == [os.path.join(task_dir, f) for f in ["0.json", "1.json"]]
+    assert res_hashes == hashes
+    assert checkpoint is None
+
+
+async def test_worker_result_hashes_mismatch(tmp_path):
+    task_dir = str(tmp_path)
+    hashes = write_results(task_dir, 2)
+    result = SuccessResult(
+        status="success",
+        files=["0.json", "1.json"],
+        hashes=[hashes[0].hex(), bytes(32).hex()],
+    )
+
+    # the hashes from the worker are trusted unless they are verified
+    _, res_hashes, _ = await run_task(task_dir, result)
+    assert res_hashes == [hashes[0], bytes(32)]
+
+    with pytest.raises(TaskExecutionError):
+        await run_task(task_dir, result, verify_hash=True)
+
+
+async def test_worker_result_files_without_hashes(tmp_path):
+    task_dir = str(tmp_path)
+    write_results(task_dir, 2)
+    result = SuccessResult(status="success", files=["0.json", "1.json"], hashes=[])
+
+    with pytest.raises(TaskExecutionError):
+        await run_task(task_dir, result)
+
+
+async def test_older_worker_result(tmp_path):
+    task_dir = str(tmp_path)
+    hashes = write_results(task_dir, 3)
+    with open(os.path.join(task_dir, "other.txt"), mode="w") as f:
+        f.write("not a result")
+
+    # older workers only write the result files
+    result = SuccessResult(status="success")
+    files, res_hashes, _ = await run_task(task_dir, result)
+
+    assert files == [os.path.join(task_dir, f"{i}.json") for i in range(3)]
+    assert res_hashes == hashes
@@ -0,0 +1,131 @@
+from anyio import Event, create_task_group, fail_after, sleep
+
+from crynux_server.task.scheduler import TaskPriority, TaskScheduler
+
+
+async def test_priority_order():
+    scheduler = TaskScheduler(
+        limits={
+            TaskPriority.Inference: 1,
+            TaskPriority.Download: 1,
+            TaskPriority.Preload: 1,
+        }
+    )
+    started = []
+    release = Event()
+
+    def make_task(name: str):
+        async def task():
+            started.append(name)
+            await release.wait()
+
+        return task
+
+    # block the inference class, so the other tasks are queued
+    scheduler.submit(TaskPriority.Inference, "blocker", make_task("blocker"))
+    async with create_task_group() as tg:
+        tg.start_soon(scheduler.run)
+        await sleep(0.01)
+        assert started == ["blocker"]
+
+        scheduler.submit(TaskPriority.Preload, "preload", make_task("preload"))
+        scheduler.submit(TaskPriority.Download, "download", make_task("download"))
+        scheduler.submit(TaskPriority.Inference, "late", make_task("late"), deadline=200)
+        scheduler.submit(TaskPriority.Inference, "early", make_task("early"), deadline=100)
+        await sleep(0.01)
+
+        # lower classes wait for the queued inference tasks
+        assert started == ["blocker"]
+        depth = scheduler.queue_depth()
+        assert depth[TaskPriority.Inference].queued == 2
+        assert depth[TaskPriority.Inference].running == 1
+        assert depth[TaskPriority.Download].queued == 1
+        assert depth[TaskPriority.Preload].queued == 1
+
+        release.set()
+        with fail_after(1):
+            while len(started) < 5:
+                await sleep(0.01)
+        tg.cancel_scope.cancel()
+
+    assert started == ["blocker", "early", "late", "download", "preload"]
+
+
+async def test_concurrency_limit():
+    scheduler = TaskScheduler(
+        limits={
+            TaskPriority.Inference: None,
+            TaskPriority.Download: 2,
+            TaskPriority.Preload: 1,
+        }
+    )
+    running = 0
+    max_running = 0
+    finished = 0
+
+    async def download():
+        nonlocal running, max_running, finished
+        running += 1
+        max_running = max(max_running, running)
+        await sleep(0.02)
+        running -= 1
+        finished += 1
+
+    for i in range(6):
+        scheduler.submit(TaskPriority.Download, f"download_{i}", download)
+
+    async with create_task_group() as tg:
+        tg.start_soon(scheduler.run)
+        with fail_after(2):
+            while finished < 6:
+                await sleep(0.01)
+        tg.cancel_scope.cancel()
+
+    assert max_running == 2
+    depth = scheduler.queue_depth()
+    assert depth[TaskPriority.Download].queued == 0
+    assert depth[TaskPriority.Download].running == 0
+
+
+async def test_downloads_wait_for_running_inference():
+    scheduler = TaskScheduler()
+    started = []
+    inference_done = Event()
+
+    async def inference():
+        started.append("inference")
+        await inference_done.wait()
+
+    def make_task(name: str):
+        async def task():
+            started.append(name)
+            await sleep(0.05)
+
+        return task
+
+    async with create_task_group() as tg:
+        tg.start_soon(scheduler.run)
+        scheduler.submit(TaskPriority.Inference, "inference", inference)
+        await sleep(0.01)
+
+        scheduler.submit(TaskPriority.Preload, "preload", make_task("preload"))
+        for i in range(3):
+            scheduler.submit(TaskPriority.Download, f"download_{i}", make_task(f"download_{i}"))
+        await sleep(0.01)
+
+        # only one download runs beside the inference task
+        assert started == ["inference", "download_0"]
+        depth = scheduler.queue_depth()
+        assert depth[TaskPriority.Download].running == 1
+        assert depth[TaskPriority.Download].queued == 2
+        assert depth[TaskPriority.Preload].queued == 1
+
+        await sleep(0.2)
+        # the preload waits while the inference task is running
+        assert started == ["inference", "download_0", "download_1", "download_2"]
+
+        inference_done.set()
+        with fail_after(1):
+            while "preload" not in started:
+                await sleep(0.01)
+        tg.cancel_scope.cancel()
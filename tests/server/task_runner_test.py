@@ -1,6 +1,7 @@
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 
+from anyio import create_task_group, fail_after, sleep
 from web3 import Web3
 
 from crynux_server import models
@@ -18,8 +19,9 @@ class EndInvalidatedRunner(InferenceTaskRunnerBase):
         self.cancel_calls = 0
         self.cleaned = False
         self._status_index = 0
-        # Keep delay short so the old timeout/cancel path is deterministic in tests.
-        self._start_time = datetime.now() - timedelta(seconds=4.8)
+        # The start time is truncated to seconds by the runner, so a timeout
+        # less than one second away may have passed already when it starts.
+        self._start_time = datetime.now()
         self._statuses = [
             models.InferenceTaskStatus.Queued,
             models.InferenceTaskStatus.EndInvalidated,
@@ -32,10 +34,10 @@ class EndInvalidatedRunner(InferenceTaskRunnerBase):
         return models.RelayTask(
             sequence=1,
             task_args="{}",
-            task_id_commitment=self.task_id_commitment,
+            task_id_commitment="0x" + bytes(self.task_id_commitment).hex(),
             creator=Web3.to_checksum_address("0x0000000000000000000000000000000000000001"),
-            sampling_seed=bytes([0] * 32),
-            nonce=bytes([0] * 32),
+            sampling_seed="0x" + bytes([0] * 32).hex(),
+            nonce="0x" + bytes([0] * 32).hex(),
             status=status,
             task_type=models.TaskType.SD,
             task_version="3.0.0",
@@ -43,7 +45,7 @@ class EndInvalidatedRunner(InferenceTaskRunnerBase):
             min_vram=0,
             required_gpu="",
             required_gpu_vram=0,
-            task_fee=0,
+            task_fee="0",
             task_size=1,
             model_ids=["test/model"],
             score="0x",
@@ -83,3 +85,136 @@ async def test_end_invalidated_upload_exits_without_cancel():
     assert runner.cancel_calls == 0
     assert runner.cleaned
     assert elapsed < 0.5
+
+
+class PushedStatusRunner(InferenceTaskRunnerBase):
+    def __init__(self, task_id_commitment: bytes):
+        super().__init__(
+            task_id_commitment=task_id_commitment,
+            state_cache=MemoryInferenceTaskStateCache(),
+            contracts=object(),
+        )
+        self.get_task_calls = 0
+        self.execute_calls = 0
+        self.upload_calls = 0
+        self.cancel_calls = 0
+        self.cleaned = False
+        self._start_time = datetime.now()
+
+    async def get_task(self) -> models.RelayTask:
+        self.get_task_calls += 1
+        return models.RelayTask(
+            sequence=1,
+            task_args="{}",
+            task_id_commitment="0x" + bytes(self.task_id_commitment).hex(),
+            creator=Web3.to_checksum_address("0x0000000000000000000000000000000000000001"),
+            sampling_seed="0x" + bytes([0] * 32).hex(),
+            nonce="0x" + bytes([0] * 32).hex(),
+            status=models.InferenceTaskStatus.Started,
+            task_type=models.TaskType.SD,
+            task_version="3.0.0",
+            timeout=600,
+            min_vram=0,
+            required_gpu="",
+            required_gpu_vram=0,
+            task_fee="0",
+            task_size=1,
+            model_ids=["test/model"],
+            score="0x",
+            qos_score=0,
+            selected_node=Web3.to_checksum_address(
+                "0x0000000000000000000000000000000000000002"
+            ),
+            create_time=self._start_time,
+            start_time=self._start_time,
+            score_ready_time=None,
+            validated_time=None,
+            result_uploaded_time=None,
+        )
+
+    async def cancel_task(self):
+        self.cancel_calls += 1
+
+    async def execute_task(self):
+        self.execute_calls += 1
+
+    async def upload_result(self):
+        self.upload_calls += 1
+
+    async def cleanup(self):
+        self.cleaned = True
+        del self.state
+
+
+async def test_pushed_status_without_polling():
+    runner = PushedStatusRunner(task_id_commitment=bytes([2] * 32))
+
+    with fail_after(5):
+        async with create_task_group() as tg:
+            tg.start_soon(runner.run, 100)
+            await sleep(0.1)
+            assert runner.execute_calls == 1
+            runner.push_status(models.InferenceTaskStatus.ScoreReady)
+            await sleep(0.1)
+            runner.push_status(models.InferenceTaskStatus.Validated)
+            await sleep(0.1)
+            assert runner.upload_calls == 1
+            runner.push_status(models.InferenceTaskStatus.EndSuccess)
+
+    assert runner.get_task_calls == 1
+    assert runner.cancel_calls == 0
+    assert runner.cleaned
+
+
+class StagedRunner(PushedStatusRunner):
+    def __init__(self, task_id_commitment: bytes):
+        super().__init__(task_id_commitment=task_id_commitment)
+        self.stage_calls = 0
+
+    async def stage_result(self):
+        self.stage_calls += 1
+
+
+async def test_quick_pushed_status_are_all_handled():
+    runner = StagedRunner(task_id_commitment=bytes([4] * 32))
+
+    with fail_after(5):
+        async with create_task_group() as tg:
+            tg.start_soon(runner.run, 100)
+            await sleep(0.1)
+            # pushed before the runner wakes up
+            runner.push_status(models.InferenceTaskStatus.ScoreReady)
+            runner.push_status(models.InferenceTaskStatus.Validated)
+            await sleep(0.1)
+            runner.push_status(models.InferenceTaskStatus.EndSuccess)
+
+    assert runner.stage_calls == 1
+    assert runner.upload_calls == 1
+    assert runner.get_task_calls == 1
+
+
+class AbortedRunner(PushedStatusRunner):
+    def __init__(self, task_id_commitment: bytes):
+        super().__init__(task_id_commitment=task_id_commitment)
+        self.cancel_execution_calls = 0
+
+    async def execute_task(self):
+        self.execute_calls += 1
+        await sleep(100)
+
+    async def cancel_execution(self):
+        self.cancel_execution_calls += 1
+
+
+async def test_aborted_task_cancels_execution():
+    runner = AbortedRunner(task_id_commitment=bytes([3] * 32))
+
+    with fail_after(5):
+        async with create_task_group() as tg:
+            tg.start_soon(runner.run, 100)
+            await sleep(0.1)
+            assert runner.execute_calls == 1
+            runner.push_status(models.InferenceTaskStatus.EndAborted)
+
+    assert runner.cancel_execution_calls == 1
+    assert runner.cleaned
@@ -1,3 +1,6 @@
+import hashlib
+import os
+
 from crynux_server import utils
 
 
@@ -36,3 +39,24 @@ async def test_disk_info():
     assert disk_info.external_models >= 0
     assert disk_info.logs >= 0
     assert disk_info.temp_files >= 0
+
+
+def test_sha256_file(tmp_path):
+    content = os.urandom(utils.FILE_CHUNK_SIZE * 2 + 123)
+    filename = tmp_path / "resp.json"
+    filename.write_bytes(content)
+
+    assert utils.sha256_file(str(filename)) == hashlib.sha256(content).digest()
+    assert utils.sha256_file(str(filename), chunk_size=1000) == hashlib.sha256(content).digest()
+
+
+def test_iter_fileobj_chunks(tmp_path):
+    content = os.urandom(2500)
+    filename = tmp_path / "result.bin"
+    filename.write_bytes(content)
+
+    with open(filename, mode="rb") as f:
+        f.seek(100)
+        chunks = [bytes(chunk) for chunk in utils.iter_fileobj_chunks(f, 1000, 1800)]
+    assert [len(chunk) for chunk in chunks] == [1000, 800]
+    assert b"".join(chunks) == content[100:1900]
@@ -0,0 +1,176 @@
+from typing import List, Optional
+
+from anyio import Event, create_task_group, fail_after, sleep
+
+from crynux_server import models
+from crynux_server.relay import MockRelay
+from crynux_server.watcher import EventWatcher
+
+node_address = "0x577887519278199ce8F8D80bAcc70fc32b48daD4"
+
+
+class CountingRelay(MockRelay):
+    def __init__(self, push_events: bool = True) -> None:
+        super().__init__(push_events=push_events)
+        self.get_events_calls = 0
+        self.limits: List[Optional[int]] = []
+
+    async def get_events(self, start_id: int, *args, **kwargs) -> List[models.Event]:
+        self.get_events_calls += 1
+        self.limits.append(kwargs.get("limit"))
+        return await super().get_events(start_id, *args, **kwargs)
+
+
+def make_task_started(task_id: int) -> models.TaskStarted:
+    return models.TaskStarted.model_validate(
+        {
+            "id": 0,
+            "selected_node": node_address,
+            "task_id_commitment": "0x" + bytes([task_id] * 32).hex(),
+        }
+    )
+
+
+async def watch_task_started(relay: CountingRelay, watcher: EventWatcher):
+    received: List[models.Event] = []
+    event_received: Optional[Event] = None
+
+    async def callback(event: models.Event):
+        received.append(event)
+        if event_received is not None:
+            event_received.set()
+
+    watcher.add_event_filter("TaskStarted", callback)
+
+    async with create_task_group() as tg:
+        await tg.start(watcher.start)
+
+        for i in range(3):
+            event_received = Event()
+            with fail_after(1):
+                await relay.add_event(make_task_started(i))
+                await event_received.wait()
+            await sleep(0.3)
+
+        await watcher.stop()
+
+    return received
+
+
+async def test_watch_pushed_events():
+    relay = CountingRelay()
+    watcher = EventWatcher(relay, fetch_interval=0.05, max_fetch_interval=0.2)
+
+    received = await watch_task_started(relay, watcher)
+
+    assert [event.id for event in received] == [1, 2, 3]
+    # only the events missed before subscribing are fetched
+    assert relay.get_events_calls == 1
+
+
+async def test_poll_events_without_push():
+    relay = CountingRelay(push_events=False)
+    watcher = EventWatcher(relay, fetch_interval=0.05, max_fetch_interval=0.2)
+
+    received = await watch_task_started(relay, watcher)
+
+    assert [event.id for event in received] == [1, 2, 3]
+    # the poll interval grows while no events happen,
+    # a fixed interval would poll more than 20 times
+    assert 3 < relay.get_events_calls < 16
+
+
+async def test_catch_up_in_pages():
+    relay = CountingRelay(push_events=False)
+    watcher = EventWatcher(relay, fetch_interval=0.05, page_size=10)
+
+    received: List[models.Event] = []
+    all_received = Event()
+
+    async def callback(event: models.Event):
+        received.append(event)
+        if len(received) == 25:
+            all_received.set()
+
+    watcher.add_event_filter("TaskStarted", callback)
+
+    async with create_task_group() as tg:
+        await tg.start(watcher.start)
+        # the events happened while the node was not polling
+        for i in range(25):
+            await relay.add_event(make_task_started(i))
+        with fail_after(1):
+            await all_received.wait()
+        await sleep(0.1)
+
+        stats = watcher.lag_stats()
+        assert stats.head_event_id == 25
+        assert stats.processed_event_id == 25
+        assert stats.lag_ids == 0
+        assert stats.lag_seconds == 0
+
+        await watcher.stop()
+
+    assert [event.id for event in received] == list(range(1, 26))
+    assert all(limit == 10 for limit in relay.limits)
+    # a full page is followed by the next one without waiting
+    assert relay.get_events_calls >= 4
+
+
+async def test_event_lag_stats():
+    relay = CountingRelay(push_events=False)
+    watcher = EventWatcher(relay, fetch_interval=0.05, page_size=10)
+
+    processing = Event()
+    release = Event()
+
+    async def callback(event: models.Event):
+        processing.set()
+        await release.wait()
+
+    watcher.add_event_filter("TaskStarted", callback)
+
+    async with create_task_group() as tg:
+        await tg.start(watcher.start)
+        for i in range(3):
+            await relay.add_event(make_task_started(i))
+        with fail_after(1):
+            await processing.wait()
+        await sleep(0.1)
+
+        stats = watcher.lag_stats()
+        assert stats.head_event_id == 3
+        assert stats.lag_ids == 3
+        assert stats.lag_seconds >= 0.1
+
+        release.set()
+        await sleep(0.1)
+        stats = watcher.lag_stats()
+        assert stats.processed_event_id == 3
+        assert stats.lag_ids == 0
+        assert stats.lag_seconds == 0
+
+        await watcher.stop()
+
+
+async def test_poll_events_while_active():
+    relay = CountingRelay(push_events=False)
+    watcher = EventWatcher(
+        relay, fetch_interval=0.2, max_fetch_interval=0.4, active_fetch_interval=0.02
+    )
+    active = False
+    watcher.set_active_check(lambda: active)
+
+    async with create_task_group() as tg:
+        await tg.start(watcher.start)
+        await sleep(0.5)
+        idle_calls = relay.get_events_calls
+
+        active = True
+        await sleep(1)
+        active_calls = relay.get_events_calls - idle_calls
+
+        await watcher.stop()
+
+    assert idle_calls < 5
+    assert active_calls > 10
@@ -0,0 +1,617 @@
+import os
+import sys
+from typing import Dict, List, Optional
+
+import psutil
+import pytest
+from anyio import (EndOfStream, create_memory_object_stream, create_task_group,
+                   fail_after, sleep)
+from fastapi import WebSocketDisconnect
+
+from crynux_server.config import Config, LogConfig, TaskConfig
+from crynux_server.models import (DownloadTaskInput, InferenceTaskInput,
+                                  ModelConfig, TaskInput, TaskType,
+                                  WarmupTaskInput)
+from crynux_server.server.v1.worker import worker as worker_endpoint
+from crynux_server.worker_manager import (TaskCancelled, TaskExecutionError,
+                                          WorkerManager)
+from crynux_server.worker_manager.protocol import (PROTOCOL_MSGPACK, Frame,
+                                                   FrameWorkerChannel,
+                                                   decode_frame, encode_frame)
+from crynux_server.worker_manager.utils import get_node_url
+from crynux_server.worker_manager.watchdog import ProgressHistory
+
+
+class FakeWebSocket(object):
+    def __init__(self, device: Optional[str]) -> None:
+        self.query_params: Dict[str, str] = {}
+        if device is not None:
+            self.query_params["device"] = device
+        self.to_node, self.node_receiver = create_memory_object_stream(10)
+        self.worker_sender, self.to_worker = create_memory_object_stream(10)
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        try:
+            return await self.node_receiver.receive()
+        except EndOfStream:
+            raise WebSocketDisconnect()
+
+    async def send_json(self, data):
+        await self.worker_sender.send(data)
+
+    async def send_text(self, data: str):
+        await self.worker_sender.send(data)
+
+    async def receive_bytes(self):
+        return await self.receive_json()
+
+    async def send_bytes(self, data: bytes):
+        await self.worker_sender.send(data)
+
+
+# A worker running on cpu, which finishes every task after a short delay
+async def fake_cpu_worker(websocket: FakeWebSocket, executed: List[str], delay: float):
+    async with websocket.to_node:
+        await websocket.to_node.send({"version": "2.5.0"})
+        await websocket.to_worker.receive()
+        async for msg in websocket.to_worker:
+            if msg == "":
+                continue
+            task = msg["task"]
+            await sleep(delay)
+            executed.append(task["task_id"])
+            await websocket.to_node.send(
+                {
+                    "task_name": task["task_name"],
+                    "task_id_commitment": task["task_id"],
+                    "result": {"status": "success"},
+                }
+            )
+            if len(executed) >= 2:
+                break
+
+
+def make_download_task(task_id: str):
+    return TaskInput(
+        task=DownloadTaskInput(
+            task_name="download",
+            task_type=TaskType.SD,
+            task_id=task_id,
+            model=ModelConfig(id=task_id, type="base"),
+        )
+    )
+
+
+async def test_dispatch_to_idle_workers():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0", "1"])
+    )
+    manager = WorkerManager(config=config)
+    assert manager.devices == ["0", "1"]
+
+    executed: Dict[str, List[str]] = {"0": [], "1": []}
+    async with create_task_group() as tg:
+        for device in ["0", "1"]:
+            websocket = FakeWebSocket(device)
+            tg.start_soon(worker_endpoint, websocket, manager)
+            tg.start_soon(fake_cpu_worker, websocket, executed[device], 0.1)
+
+        with fail_after(1):
+            while len(manager.worker_states()) < 2:
+                await sleep(0.01)
+        assert sorted(state.device for state in manager.worker_states()) == ["0", "1"]
+
+        futures = [await manager.send_task(make_download_task(f"task_{i}")) for i in range(4)]
+        await sleep(0.05)
+        # each worker runs one task at a time
+        running = [state.task_id for state in manager.worker_states()]
+        assert sorted(running) == ["task_0", "task_1"]
+
+        with fail_after(2):
+            for fut in futures:
+                await fut.get()
+
+    assert len(executed["0"]) == 2
+    assert len(executed["1"]) == 2
+    assert manager.worker_states() == []
+
+
+# A worker which reports the models loaded after each inference task,
+# the task args are the seconds to run the task
+async def fake_gpu_worker(websocket: FakeWebSocket, executed: List[str]):
+    async with websocket.to_node:
+        await websocket.to_node.send({"version": "2.5.0"})
+        await websocket.to_worker.receive()
+        async for msg in websocket.to_worker:
+            if msg == "":
+                continue
+            task = msg["task"]
+            await sleep(float(task["task_args"]))
+            executed.append(task["task_id"])
+            await websocket.to_node.send(
+                {
+                    "task_name": task["task_name"],
+                    "task_id_commitment": task["task_id"],
+                    "result": {"status": "success"},
+                    "resident_models": task["models"],
+                }
+            )
+
+
+def make_inference_task(task_id: str, model_id: str, seconds: float):
+    return TaskInput(
+        task=InferenceTaskInput(
+            task_name="inference",
+            task_type=TaskType.SD,
+            task_id=task_id,
+            models=[ModelConfig(id=model_id, type="base")],
+            task_args=str(seconds),
+            output_dir="",
+        )
+    )
+
+
+async def test_model_affinity():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0", "1"])
+    )
+    manager = WorkerManager(config=config)
+    manager.model_affinity_max_wait = 0.2
+
+    executed: Dict[str, List[str]] = {"0": [], "1": []}
+
+    def executor(task_id: str) -> str:
+        return next(device for device, ids in executed.items() if task_id in ids)
+
+    async with create_task_group() as tg:
+        for device in ["0", "1"]:
+            websocket = FakeWebSocket(device)
+            tg.start_soon(worker_endpoint, websocket, manager)
+            tg.start_soon(fake_gpu_worker, websocket, executed[device])
+
+        with fail_after(1):
+            while len(manager.worker_states()) < 2:
+                await sleep(0.01)
+
+        with fail_after(2):
+            # no worker is warm, so any worker runs the task
+            await (await manager.send_task(make_inference_task("task_0", "sd15", 0))).get()
+            warm = executor("task_0")
+            # the idle cold worker leaves the task to the warm worker
+            await (await manager.send_task(make_inference_task("task_1", "sd15", 0))).get()
+            assert executor("task_1") == warm
+
+            # the warm worker is busy, so the cold worker takes the task after the max wait
+            fut_2 = await manager.send_task(make_inference_task("task_2", "sd15", 0.5))
+            await sleep(0.05)
+            fut_3 = await manager.send_task(make_inference_task("task_3", "sd15", 0))
+            await sleep(0.05)
+            assert len(executed["0"]) + len(executed["1"]) == 2
+            await fut_3.get()
+            assert executor("task_3") != warm
+            assert not fut_2.done()
+            await fut_2.get()
+            assert executor("task_2") == warm
+
+        tg.cancel_scope.cancel()
+
+    stats = manager.model_affinity_stats()
+    assert stats.hits == 2
+    assert stats.misses == 2
+    assert stats.fallbacks == 1
+    assert stats.hit_rate == 0.5
+
+
+async def test_warmup():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"])
+    )
+    manager = WorkerManager(config=config)
+    websocket = FakeWebSocket("0")
+    executed: List[str] = []
+
+    async def warmup_worker():
+        async with websocket.to_node:
+            await websocket.to_node.send({"version": "2.5.0", "features": ["warmup"]})
+            await websocket.to_worker.receive()
+            async for msg in websocket.to_worker:
+                if msg == "":
+                    continue
+                task = msg["task"]
+                executed.append(task["task_name"])
+                await websocket.to_node.send(
+                    {
+                        "task_name": task["task_name"],
+                        "task_id_commitment": task["task_id"],
+                        "result": {"status": "success"},
+                        "resident_models": task["models"],
+                    }
+                )
+
+    model = ModelConfig(id="sd15", type="base")
+    warmup_input = TaskInput(
+        task=WarmupTaskInput(
+            task_name="warmup", task_type=TaskType.SD, task_id="task_0", models=[model]
+        )
+    )
+    # no worker supports warmup
+    assert await manager.send_warmup(warmup_input) is None
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(warmup_worker)
+
+        with fail_after(1):
+            while not manager.supports("warmup"):
+                await sleep(0.01)
+            fut = await manager.send_warmup(warmup_input)
+            assert fut is not None
+            await fut.get()
+            # the models are loaded already
+            assert await manager.send_warmup(warmup_input) is None
+            await (await manager.send_task(make_inference_task("task_0", "sd15", 0))).get()
+
+        tg.cancel_scope.cancel()
+
+    assert executed == ["warmup", "inference"]
+    stats = manager.model_affinity_stats()
+    assert stats.hits == 1
+    assert stats.misses == 0
+
+
+async def test_cancel_task():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"])
+    )
+    manager = WorkerManager(config=config)
+    websocket = FakeWebSocket("0")
+    started: List[str] = []
+    cancelled: List[str] = []
+
+    # runs each task until it is cancelled, except task_2
+    async def cancel_worker():
+        async with websocket.to_node:
+            await websocket.to_node.send({"version": "2.5.0", "features": ["cancel"]})
+            await websocket.to_worker.receive()
+            async for msg in websocket.to_worker:
+                if msg == "":
+                    continue
+                if "cancel" in msg:
+                    task_id = msg["cancel"]["task_id"]
+                    cancelled.append(task_id)
+                    status = "cancelled"
+                else:
+                    task_id = msg["task"]["task_id"]
+                    started.append(task_id)
+                    if task_id != "task_2":
+                        continue
+                    status = "success"
+                await websocket.to_node.send(
+                    {
+                        "task_name": "download",
+                        "task_id_commitment": task_id,
+                        "result": {"status": status},
+                    }
+                )
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(cancel_worker)
+
+        with fail_after(1):
+            while not manager.supports("cancel"):
+                await sleep(0.01)
+            futures = [await manager.send_task(make_download_task(f"task_{i}")) for i in range(3)]
+            await sleep(0.05)
+            assert started == ["task_0"]
+
+            # the queued task is removed without reaching the worker
+            await manager.cancel_task("task_1")
+            # the running task is stopped by the worker
+            await manager.cancel_task("task_0")
+            assert cancelled == ["task_0"]
+
+            await futures[2].get()
+            assert started == ["task_0", "task_2"]
+            for fut in futures[:2]:
+                with pytest.raises(TaskCancelled):
+                    await fut.get()
+
+        tg.cancel_scope.cancel()
+
+
+async def test_framed_protocol():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"])
+    )
+    manager = WorkerManager(config=config)
+    websocket = FakeWebSocket("0")
+    protocols: List[str] = []
+
+    async def framed_worker():
+        async with websocket.to_node:
+            await websocket.to_node.send({"version": "2.5.0", "features": ["msgpack"]})
+            handshake = await websocket.to_worker.receive()
+            protocols.append(handshake["protocol"])
+            msg = await websocket.to_worker.receive()
+            if handshake["protocol"] == PROTOCOL_MSGPACK:
+                frame = decode_frame(msg)
+                task = frame.data["task"]
+                result = Frame(
+                    id=1,
+                    reply_to=frame.id,
+                    type="result",
+                    data={
+                        "task_name": task["task_name"],
+                        "task_id_commitment": task["task_id"],
+                        "result": {"status": "success"},
+                    },
+                )
+                await websocket.to_node.send(encode_frame(result))
+            else:
+                task = msg["task"]
+                await websocket.to_node.send(
+                    {
+                        "task_name": task["task_name"],
+                        "task_id_commitment": task["task_id"],
+                        "result": {"status": "success"},
+                    }
+                )
+            await sleep(1)
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(framed_worker)
+
+        with fail_after(1):
+            await (await manager.send_task(make_download_task("task_0"))).get()
+
+        tg.cancel_scope.cancel()
+
+    assert protocols == [PROTOCOL_MSGPACK]
+
+
+async def test_frame_replies():
+    websocket = FakeWebSocket("0")
+    channel = FrameWorkerChannel(websocket)
+
+    task_input = make_download_task("task_0")
+    request_id = await channel.send("task", task_input.model_dump())
+    assert request_id is not None
+    assert channel.pending_requests == {request_id: "task_0"}
+
+    # the result leaves out its task id, which is found by the request it replies to
+    result = Frame(
+        id=1,
+        reply_to=request_id,
+        type="result",
+        data={"task_name": "download", "result": {"status": "success"}},
+    )
+    await websocket.to_node.send(encode_frame(result))
+    data = await channel.receive()
+    assert data["task_id_commitment"] == "task_0"
+    assert channel.pending_requests == {}
+
+    # frame 2 is lost
+    progress = Frame(id=3, type="progress", data={"progress": {}})
+    await websocket.to_node.send(encode_frame(progress))
+    await channel.receive()
+    assert channel.missing_frames == 1
+    assert channel.last_received_id == 3
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unix sockets are not supported")
+def test_node_url():
+    config = Config.model_construct(
+        server_port=7412, task_config=TaskConfig(worker_patch_url="")
+    )
+    assert get_node_url(config) == "ws://127.0.0.1:7412/manager/v1/worker/"
+
+    config.task_config.worker_socket = "/tmp/crynux/worker.sock"
+    assert (
+        get_node_url(config)
+        == "ws+unix://%2Ftmp%2Fcrynux%2Fworker.sock/manager/v1/worker/"
+    )
+
+
+FAKE_WORKER_SCRIPT = """
+import json
+import os
+import sys
+import time
+
+if os.environ.get("cw_standby") == "1":
+    os.environ.update(json.loads(sys.stdin.readline()))
+with open(os.environ["cw_pid_file"], "w") as f:
+    f.write(str(os.getpid()))
+time.sleep(60)
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the fake worker is run by python")
+async def test_promote_standby_worker(tmp_path):
+    with open(tmp_path / "crynux_worker_process.py", "w") as f:
+        f.write(FAKE_WORKER_SCRIPT)
+    task_config = TaskConfig(worker_patch_url="", worker_devices=["0"], standby_worker=True)
+    task_config._script_dir = str(tmp_path)
+    task_config._hf_cache_dir = str(tmp_path / "hf")
+    task_config._external_cache_dir = str(tmp_path / "external")
+    task_config._output_dir = str(tmp_path / "results")
+    task_config._worker_pid_file = str(tmp_path / "worker.pid")
+    config = Config.model_construct(
+        relay_url="",
+        server_port=7412,
+        log=LogConfig(dir=str(tmp_path), level="INFO"),
+        task_config=task_config,
+    )
+    manager = WorkerManager(config=config)
+
+    with manager.start():
+        async with create_task_group() as tg:
+            tg.start_soon(manager.supervise)
+            worker_state, standby_state = manager.worker_process_states()
+            assert worker_state.device == "0"
+            assert standby_state.standby
+
+            psutil.Process(worker_state.pid).kill()
+            with fail_after(5):
+                while True:
+                    states = manager.worker_process_states()
+                    if len(states) == 2 and states[0].pid == standby_state.pid:
+                        break
+                    await sleep(0.01)
+            assert states[0].device == "0"
+            assert states[0].restarts == 1
+            assert not states[0].standby
+            # a new standby worker is started
+            assert states[1].standby
+            assert states[1].pid not in [worker_state.pid, standby_state.pid]
+
+            # the promoted worker writes its pid to the pid file of the device
+            with fail_after(5):
+                while True:
+                    pid_file = task_config.worker_pid_file
+                    if os.path.exists(pid_file):
+                        with open(pid_file) as f:
+                            if f.read() == str(standby_state.pid):
+                                break
+                    await sleep(0.01)
+
+            tg.cancel_scope.cancel()
+
+    assert manager.worker_process_states() == []
+
+
+async def test_progress_watchdog():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"])
+    )
+    manager = WorkerManager(config=config)
+    manager.progress_history = ProgressHistory(default_threshold=0.3, min_threshold=0.1)
+    websocket = FakeWebSocket("0")
+
+    # reports the progress of the first step, then hangs
+    async def hung_worker():
+        async with websocket.to_node:
+            await websocket.to_node.send({"version": "2.5.0", "features": ["progress"]})
+            await websocket.to_worker.receive()
+            async for msg in websocket.to_worker:
+                if msg == "":
+                    continue
+                task_id = msg["task"]["task_id"]
+                await websocket.to_node.send(
+                    {"progress": {"task_id": task_id, "phase": "inference", "step": 1, "total": 30}}
+                )
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(hung_worker)
+        tg.start_soon(manager.watchdog, 0.05)
+
+        with fail_after(2):
+            fut = await manager.send_task(make_inference_task("task_0", "model", 0))
+            while len(manager.task_progress()) == 0 or manager.task_progress()[0].step == 0:
+                await sleep(0.01)
+            progress = manager.task_progress()[0]
+            assert progress.task_id == "task_0"
+            assert progress.phase == "inference"
+            assert progress.total == 30
+
+            with pytest.raises(TaskExecutionError):
+                await fut.get()
+
+        tg.cancel_scope.cancel()
+
+
+async def test_watchdog_ignores_downloads():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"])
+    )
+    manager = WorkerManager(config=config)
+    manager.progress_history = ProgressHistory(default_threshold=0.1, min_threshold=0.1)
+    websocket = FakeWebSocket("0")
+
+    # downloads the model silently for a while
+    async def downloading_worker():
+        async with websocket.to_node:
+            await websocket.to_node.send({"version": "2.5.0", "features": ["progress"]})
+            await websocket.to_worker.receive()
+            async for msg in websocket.to_worker:
+                if msg == "":
+                    continue
+                task = msg["task"]
+                await sleep(0.5)
+                await websocket.to_node.send(
+                    {
+                        "task_name": task["task_name"],
+                        "task_id_commitment": task["task_id"],
+                        "result": {"status": "success"},
+                    }
+                )
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(downloading_worker)
+        tg.start_soon(manager.watchdog, 0.05)
+
+        with fail_after(2):
+            fut = await manager.send_task(make_download_task("task_0"))
+            await fut.get()
+
+        tg.cancel_scope.cancel()
+
+
+async def test_parallel_downloads():
+    config = Config.model_construct(
+        task_config=TaskConfig(worker_patch_url="", worker_devices=["0"], download_concurrency=2)
+    )
+    manager = WorkerManager(config=config)
+    websocket = FakeWebSocket("0")
+    running: List[str] = []
+    max_running = 0
+
+    async def download_worker():
+        async def run_task(task):
+            nonlocal max_running
+            running.append(task["task_id"])
+            max_running = max(max_running, len(running))
+            await sleep(0.1)
+            running.remove(task["task_id"])
+            await websocket.to_node.send(
+                {
+                    "task_name": task["task_name"],
+                    "task_id_commitment": task["task_id"],
+                    "result": {"status": "success"},
+                }
+            )
+
+        async with websocket.to_node, create_task_group() as worker_tg:
+            await websocket.to_node.send(
+                {"version": "2.5.0", "features": ["parallel_download"]}
+            )
+            await websocket.to_worker.receive()
+            async for msg in websocket.to_worker:
+                if msg != "":
+                    worker_tg.start_soon(run_task, msg["task"])
+
+    async with create_task_group() as tg:
+        tg.start_soon(worker_endpoint, websocket, manager)
+        tg.start_soon(download_worker)
+
+        with fail_after(2):
+            futures = [await manager.send_task(make_download_task(f"task_{i}")) for i in range(3)]
+            inference_fut = await manager.send_task(make_inference_task("task_3", "sd15", 0))
+            await sleep(0.05)
+            assert sorted(running) == ["task_0", "task_1"]
+
+            await inference_fut.get()
+            for fut in futures:
+                assert fut.done()
+
+        tg.cancel_scope.cancel()
+
+    # no more than download_concurrency tasks run at a time
+    assert max_running == 2